@@ -0,0 +1,58 @@
+"""
+Measures the bookkeeping of the chapters of a big book while they pass through the pipeline: adding them to the book
+like the parser does, conflating the parts of every chapter and deleting the chapters once they got written.
+The synthetic chapters come in pairs of parts with the same title. They get created before the clock starts.
+
+Usage (from the repository root): python benchmarks/chapter_bookkeeping.py [chapters]
+"""
+import os
+import sys
+import time
+
+from urllib3.util import parse_url
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'lightnovel')]
+
+from api import Book, Chapter  # noqa: E402
+from content import Block, BlockKind, Content, Run  # noqa: E402
+from pipeline import ChapterConflation, DeleteChapters  # noqa: E402
+
+
+class SyntheticChapter(Chapter):
+    def __init__(self, number: int):
+        super().__init__(parse_url(f"https://localhost/novel/chapter-{number}"), None)
+        self._title = f"Chapter {number // 2 + 1} - Step {number // 2 + 1} Of The Climb"
+        self._next_chapter_path = f"/novel/chapter-{number + 1}"
+        self._blocks = Content([Block(BlockKind.PARAGRAPH, 'p', (Run(f"Paragraph of chapter {number}."),))])
+
+    def is_complete(self) -> bool:
+        return True
+
+
+def source(book: Book, chapters: list):
+    for chapter in chapters:
+        chapter._book = book
+        book.chapters.append(chapter)
+        yield book, chapter
+
+
+def main(chapters: int = 10000):
+    print(f"{chapters} chapters in {chapters // 2} pairs of parts")
+    cases = (
+        ('add', lambda book, gen: list(gen)),
+        ('delete', lambda book, gen: list(DeleteChapters().wrap(gen))),
+        ('conflate', lambda book, gen: list(ChapterConflation(None).wrap(gen))),
+        ('both', lambda book, gen: list(DeleteChapters().wrap(ChapterConflation(None).wrap(gen)))),
+    )
+    for name, case in cases:
+        book = Book('Synthetic')
+        gen = source(book, [SyntheticChapter(number) for number in range(chapters)])
+        start = time.perf_counter()
+        result = case(book, gen)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<10} {elapsed * 1000:>10.1f} ms  {len(result):>6} yielded  {len(book.chapters):>6} kept")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
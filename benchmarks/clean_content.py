@@ -0,0 +1,53 @@
+"""
+Measures the time cleaning the content of a chapter takes, over the chapter pages recorded in test_data/.
+
+Usage (from the repository root): python benchmarks/clean_content.py [repetitions]
+"""
+import os
+import sys
+import time
+from typing import List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'lightnovel')]
+
+from urllib3.util import parse_url  # noqa: E402
+
+from parse_backends import load_chapter_pages  # noqa: E402
+from util.soup import HtmlParser, is_available  # noqa: E402
+from wuxiaworld_com import WuxiaWorldComChapter  # noqa: E402
+
+
+def benchmark(parser: HtmlParser, pages: List[Tuple[str, str]], repetitions: int) -> Tuple[float, int]:
+    """
+    Parses every page into a chapter and cleans its content. Only the cleaning is timed.
+    :return: The average seconds per chapter and the amount of chapters that got cleaned.
+    """
+    seconds = 0.0
+    cleaned = 0
+    for _ in range(repetitions):
+        for url, html in pages:
+            document = parser.parse(html, WuxiaWorldComChapter.REQUIRED_SELECTORS, WuxiaWorldComChapter.PARSE_ONLY)
+            chapter = WuxiaWorldComChapter(parse_url(url), document)
+            if not chapter.parse() or not chapter.is_complete():
+                continue
+            start = time.perf_counter()
+            chapter.clean_content()
+            seconds += time.perf_counter() - start
+            cleaned += 1
+    return seconds / max(cleaned, 1), cleaned // repetitions
+
+
+def main(repetitions: int = 5):
+    pages = load_chapter_pages()
+    print(f"{len(pages)} chapter pages, {repetitions} repetitions")
+    print(f"{'backend':<12} {'ms/chapter':>10} {'chapters':>9}")
+    for features in ('html5lib', 'lxml', 'html.parser'):
+        if not is_available(features):
+            continue
+        seconds, cleaned = benchmark(HtmlParser(features, None), pages, repetitions)
+        print(f"{features:<12} {seconds * 1000:>10.2f} {cleaned:>9}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,60 @@
+"""
+Measures how much memory the chapters of a novel keep alive after parsing, with their content kept as a tree
+of tags or compacted into blocks, over the chapter pages recorded in test_data/.
+
+Usage (from the repository root): python benchmarks/content_memory.py [chapters]
+"""
+import gc
+import os
+import sys
+import tracemalloc
+from typing import List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'lightnovel')]
+
+from urllib3.util import parse_url  # noqa: E402
+
+from parse_backends import load_chapter_pages  # noqa: E402
+from util.soup import HtmlParser  # noqa: E402
+from wuxiaworld_com import WuxiaWorldComChapter  # noqa: E402
+
+
+def keep_chapters(pages: List[Tuple[str, str]], count: int, compact: bool) -> Tuple[int, int, int]:
+    """
+    Parses `count` chapters like the :class:`Parser` stage does and keeps them, like a book does.
+    :return: The retained and peak bytes, and the amount of kept chapters.
+    """
+    parser = HtmlParser()
+    chapters = []
+    gc.collect()
+    tracemalloc.start()
+    for i in range(count):
+        url, html = pages[i % len(pages)]
+        chapter = WuxiaWorldComChapter(parse_url(url), None)
+        chapter.defer_document(html, lambda markup: parser.parse(markup, WuxiaWorldComChapter.REQUIRED_SELECTORS,
+                                                                 WuxiaWorldComChapter.PARSE_ONLY))
+        if not chapter.parse() or not chapter.is_complete():
+            continue
+        if compact:
+            chapter.compact()
+        del chapter.document
+        chapters.append(chapter)
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return retained, peak, len(chapters)
+
+
+def main(count: int = 200):
+    pages = load_chapter_pages()
+    print(f"{count} chapters from {len(pages)} chapter pages")
+    print(f"{'content':<8} {'kept':>5} {'retained MiB':>13} {'per chapter KiB':>16} {'peak MiB':>9}")
+    for compact in (False, True):
+        retained, peak, kept = keep_chapters(pages, count, compact)
+        print(f"{'blocks' if compact else 'tags':<8} {kept:>5} {retained / 2 ** 20:>13.1f} "
+              f"{retained / max(kept, 1) / 1024:>16.1f} {peak / 2 ** 20:>9.1f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,67 @@
+"""
+Measures how long parsing the index page of a novel takes, split into building the document and extracting
+the novel from it, over the index page recorded in test_data/WW_AST_Cover_C1-102.har.
+
+Usage (from the repository root): python benchmarks/novel_index.py [repetitions]
+"""
+import json
+import os
+import sys
+import time
+from typing import Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'lightnovel')]
+
+from urllib3.util import parse_url  # noqa: E402
+
+from util.soup import HtmlParser, is_available  # noqa: E402
+from wuxiaworld_com import WuxiaWorldComNovel  # noqa: E402
+
+HAR = os.path.join(ROOT, 'test_data', 'WW_AST_Cover_C1-102.har')
+NOVEL_URL = 'https://www.wuxiaworld.com/novel/ancient-strengthening-technique'
+
+
+def load_index_page(har: str = HAR, url: str = NOVEL_URL) -> str:
+    """Looks up the html of the index page of the novel."""
+    with open(har, 'r', encoding='utf-8') as fp:
+        entries = json.load(fp)['log']['entries']
+    for entry in entries:
+        if entry['request']['url'].rstrip('/') == url and entry['response']['content'].get('text'):
+            return entry['response']['content']['text']
+    raise Exception(f"{url} isn't recorded in {har}")
+
+
+def benchmark(parser: HtmlParser, html: str, repetitions: int) -> Tuple[float, float, int]:
+    """
+    Builds the document of the index page and parses the novel from it.
+    :return: The average seconds spent building and extracting, and the amount of chapter entries.
+    """
+    building = extracting = 0.0
+    entries = 0
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        document = parser.parse(html, WuxiaWorldComNovel.REQUIRED_SELECTORS, WuxiaWorldComNovel.PARSE_ONLY)
+        built = time.perf_counter()
+        novel = WuxiaWorldComNovel(parse_url(NOVEL_URL), document)
+        if not novel.parse():
+            raise Exception("Couldn't parse the novel")
+        extracting += time.perf_counter() - built
+        building += built - start
+        entries = sum(len(book.chapter_entries) for book in novel.books)
+    return building / repetitions, extracting / repetitions, entries
+
+
+def main(repetitions: int = 10):
+    html = load_index_page()
+    print(f"{NOVEL_URL} ({len(html) // 1024} KiB), {repetitions} repetitions")
+    print(f"{'backend':<12} {'build ms':>10} {'extract ms':>11} {'entries':>8}")
+    for features in ('html5lib', 'lxml', 'html.parser'):
+        if not is_available(features):
+            continue
+        building, extracting, entries = benchmark(HtmlParser(features, None), html, repetitions)
+        print(f"{features:<12} {building * 1000:>10.2f} {extracting * 1000:>11.2f} {entries:>8}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
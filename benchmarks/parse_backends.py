@@ -0,0 +1,85 @@
+"""
+Measures the parse time per chapter of every html parser backend over the chapter pages recorded in test_data/.
+
+Usage (from the repository root): python benchmarks/parse_backends.py [repetitions]
+"""
+import json
+import os
+import sys
+import time
+from typing import List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'lightnovel')]
+
+from urllib3.util import parse_url  # noqa: E402
+
+from util.soup import HtmlParser, is_available  # noqa: E402
+from wuxiaworld_com import WuxiaWorldComChapter  # noqa: E402
+
+BACKENDS = [
+    ('html5lib', None, False),
+    ('lxml', None, False),
+    ('lxml', 'html5lib', False),
+    ('lxml', 'html5lib', True),
+    ('html.parser', None, False),
+    ('html.parser', 'html5lib', False),
+    ('html.parser', 'html5lib', True),
+]
+
+
+def load_chapter_pages(folder: str = os.path.join(ROOT, 'test_data')) -> List[Tuple[str, str]]:
+    """Collects the url and html of every recorded wuxiaworld chapter page."""
+    pages = {}
+    for filename in sorted(os.listdir(folder)):
+        if not filename.endswith('.har'):
+            continue
+        with open(os.path.join(folder, filename), 'r', encoding='utf-8') as fp:
+            entries = json.load(fp)['log']['entries']
+        for entry in entries:
+            url = entry['request']['url']
+            content = entry['response']['content']
+            path = parse_url(url).path
+            if not path.startswith('/novel/') or len(path.strip('/').split('/')) != 3:
+                continue
+            if content.get('text') and url not in pages:
+                pages[url] = content['text']
+    return list(pages.items())
+
+
+def benchmark(parser: HtmlParser, pages: List[Tuple[str, str]], repetitions: int,
+              strained: bool) -> Tuple[float, int, int]:
+    """
+    Parses every page into a chapter.
+    :return: The average seconds and tags per chapter and how many documents needed the fallback parser.
+    """
+    parse_only = WuxiaWorldComChapter.PARSE_ONLY if strained else None
+    tags = 0
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        for url, html in pages:
+            document = parser.parse(html, WuxiaWorldComChapter.REQUIRED_SELECTORS, parse_only)
+            WuxiaWorldComChapter(parse_url(url), document).parse()
+            tags += len(document.find_all(True))
+    count = repetitions * len(pages)
+    return (time.perf_counter() - start) / count, tags // count, parser.fallbacks // repetitions
+
+
+def main(repetitions: int = 3):
+    pages = load_chapter_pages()
+    print(f"{len(pages)} chapter pages, {repetitions} repetitions")
+    print(f"{'backend':<40} {'parts':<8} {'ms/chapter':>10} {'tags':>6} {'fallbacks':>10}")
+    baseline: Optional[float] = None
+    for features, fallback, strained in BACKENDS:
+        if not is_available(features) or (fallback is not None and not is_available(fallback)):
+            continue
+        parser = HtmlParser(features, fallback)
+        seconds, tags, fallbacks = benchmark(parser, pages, repetitions, strained)
+        baseline = baseline if baseline is not None else seconds
+        parts = 'needed' if strained else 'all'
+        print(f"{str(parser):<40} {parts:<8} {seconds * 1000:>10.2f} {tags:>6} {fallbacks:>10} "
+              f"({baseline / seconds:.1f}x)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
@@ -0,0 +1,52 @@
+"""
+Measures how much running the pipeline stages on their own threads saves over nesting them, with stages that
+wait like downloads and file writes do. CPU bound stages share the GIL and only overlap with the waiting ones.
+
+Usage (from the repository root): python benchmarks/pipeline_overlap.py [chapters] [milliseconds per stage]
+"""
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'lightnovel')]
+
+from pipeline import Pipeline, PipelineExecutor  # noqa: E402
+
+
+class Waiting(Pipeline):
+    def __init__(self, seconds: float):
+        super().__init__()
+        self.seconds = seconds
+
+    def wrap(self, gen):
+        for book, chapter in gen:
+            time.sleep(self.seconds)
+            yield book, chapter
+
+
+def download(chapters: int, seconds: float):
+    for i in range(chapters):
+        time.sleep(seconds)
+        yield None, i
+
+
+def main(chapters: int = 100, milliseconds: float = 5.0):
+    seconds = milliseconds / 1000
+    print(f"{chapters} chapters, a download and 3 stages waiting {milliseconds} ms each")
+    start = time.perf_counter()
+    gen = download(chapters, seconds)
+    for _ in range(3):
+        gen = Waiting(seconds).wrap(gen)
+    list(gen)
+    print(f"{'nested':<10} {(time.perf_counter() - start) * 1000:>8.0f} ms")
+    start = time.perf_counter()
+    executor = PipelineExecutor(Waiting(seconds), Waiting(seconds), Waiting(seconds))
+    list(executor.wrap(download(chapters, seconds)))
+    print(f"{'executor':<10} {(time.perf_counter() - start) * 1000:>8.0f} ms")
+    for stats in executor.queue_stats:
+        print(f"  {stats.name:<20} peak {stats.peak}/{stats.maxsize}")
+
+
+if __name__ == '__main__':
+    main(*(float(arg) if i else int(arg) for i, arg in enumerate(sys.argv[1:3])))
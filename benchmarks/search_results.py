@@ -0,0 +1,49 @@
+"""
+Measures how long decoding the results of a search takes, like the `search(count=200)` call in main.py,
+over the search response recorded in test_data/WW_Search_default.har, repeated to the requested amount.
+
+Usage (from the repository root): python benchmarks/search_results.py [count] [repetitions]
+"""
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'lightnovel')]
+
+from wuxiaworld_com import WuxiaWorldCom  # noqa: E402
+
+HAR = os.path.join(ROOT, 'test_data', 'WW_Search_default.har')
+
+
+def load_search_response(count: int, har: str = HAR) -> dict:
+    """Looks up the recorded search response and repeats its items until there are `count` of them."""
+    with open(har, 'r', encoding='utf-8') as fp:
+        entries = json.load(fp)['log']['entries']
+    for entry in entries:
+        if entry['request']['url'] == WuxiaWorldCom.SEARCH_URL:
+            data = json.loads(entry['response']['content']['text'])
+            items = data['items']
+            data['items'] = [items[i % len(items)] for i in range(count)]
+            return data
+    raise Exception(f"No search is recorded in {har}")
+
+
+def main(count: int = 200, repetitions: int = 20):
+    data = load_search_response(count)
+    print(f"{count} search results, {repetitions} repetitions")
+    cases = (
+        ('entries', lambda: WuxiaWorldCom._search_results(data)),
+        ('synopses', lambda: [entry.synopsis for entry in WuxiaWorldCom._search_results(data)[0]]),
+        ('bulk', lambda: WuxiaWorldCom._search_results(data, bulk=True)),
+    )
+    for name, case in cases:
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            case()
+        print(f"{name:<10} {(time.perf_counter() - start) / repetitions * 1000:>8.2f} ms")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
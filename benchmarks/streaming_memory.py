@@ -0,0 +1,86 @@
+"""
+Measures the peak memory of writing a novel to Markdown and JSON lines, with the chapters kept by their book like
+before or released once they got written, over the chapter pages recorded in test_data/.
+Every page gets parsed once and restored as often as needed, like chapters from a chapter store.
+
+Usage (from the repository root): python benchmarks/streaming_memory.py [chapters...]
+"""
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+from typing import List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'lightnovel')]
+
+from bs4 import BeautifulSoup  # noqa: E402
+from urllib3.util import parse_url  # noqa: E402
+
+from api import Book, Novel  # noqa: E402
+from parse_backends import load_chapter_pages  # noqa: E402
+from pipeline import JsonLinesMaker, MarkdownMaker, ReleaseChapters  # noqa: E402
+from store import ChapterRecord  # noqa: E402
+from util.soup import HtmlParser  # noqa: E402
+from wuxiaworld_com import WuxiaWorldComChapter  # noqa: E402
+
+
+def parse_records(pages: List[Tuple[str, str]]) -> List[ChapterRecord]:
+    parser = HtmlParser()
+    records = []
+    for url, html in pages:
+        chapter = WuxiaWorldComChapter(parse_url(url), None)
+        chapter.defer_document(html, lambda markup: parser.parse(markup, WuxiaWorldComChapter.REQUIRED_SELECTORS,
+                                                                 WuxiaWorldComChapter.PARSE_ONLY))
+        if chapter.parse() and chapter.is_complete():
+            records.append(chapter.to_record())
+    return records
+
+
+def source(book: Book, records: List[ChapterRecord], count: int):
+    """Yields the chapters like the :class:`Parser` stage does."""
+    for index in range(1, count + 1):
+        record = records[index % len(records)]
+        chapter = WuxiaWorldComChapter(parse_url(f"{record.url}-{index}"), None)
+        chapter.restore(record)
+        _ = chapter.blocks
+        chapter._book = book
+        chapter.index = chapter.abs_index = index
+        book.chapters.append(chapter)
+        yield book, chapter
+
+
+def write(records: List[ChapterRecord], count: int, release: bool) -> Tuple[int, int]:
+    """:return: The peak and the retained bytes of writing `count` chapters."""
+    novel = Novel(parse_url('https://localhost/novel/benchmark'), BeautifulSoup('', 'html.parser'))
+    novel._title = 'Benchmark'
+    novel._success = True
+    book = Book('Book 1')
+    with tempfile.TemporaryDirectory() as folder:
+        gc.collect()
+        tracemalloc.start()
+        gen = JsonLinesMaker(novel, folder).wrap(MarkdownMaker(novel, folder).wrap(source(book, records, count)))
+        if release:
+            gen = ReleaseChapters().wrap(gen)
+        for _ in gen:
+            pass
+        gc.collect()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return peak, retained
+
+
+def main(*counts: int):
+    records = parse_records(load_chapter_pages())
+    print(f"{len(records)} chapter pages")
+    print(f"{'chapters':>8} {'mode':<8} {'peak MiB':>9} {'retained MiB':>13}")
+    for count in counts or (100, 1000):
+        for release in (False, True):
+            peak, retained = write(records, count, release)
+            mode = 'release' if release else 'keep'
+            print(f"{count:>8} {mode:<8} {peak / 2 ** 20:>9.1f} {retained / 2 ** 20:>13.1f}")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
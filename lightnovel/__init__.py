@@ -1,6 +1,15 @@
 # noinspection PyUnresolvedReferences
-from .api import LightNovelApi, Novel, Book, ChapterEntry, Chapter, SearchEntry
+from .api import LightNovelApi, Novel, Book, ChapterEntry, ChapterRow, ChapterTable, ChapterList, Chapter, \
+    ChapterSummary, SearchEntry
 # noinspection PyUnresolvedReferences
-from .pipeline import Pipeline, Parser, HtmlCleaner, ChapterConflation, EpubMaker, DeleteChapters
+from .async_api import AsyncLightNovelApi, AsyncTransport, AsyncResponse, StreamTransport
+# noinspection PyUnresolvedReferences
+from .pipeline import Pipeline, Parser, ProcessParser, HtmlCleaner, ChapterConflation, EpubMaker, DeleteChapters, \
+    ProgressTracker, PipelineExecutor, QueueStats, FanOut, MarkdownMaker, LatexMaker, JsonLinesMaker, Checkpointer, \
+    ReleaseChapters
+# noinspection PyUnresolvedReferences
+from .scheduler import CrawlScheduler, CrawlJob, CrawlState
+# noinspection PyUnresolvedReferences
+from .workqueue import WorkQueue, WorkItem, Worker
 
 __version__ = "0.2"
@@ -2,24 +2,35 @@ import logging
 import os
 import re
 import shutil
-import time
 from abc import ABC
+from array import array
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, Future
 from datetime import datetime, timedelta
 from io import BytesIO
-from typing import List, Any, Tuple, Generator, Optional
+from typing import List, Any, Tuple, Generator, Optional, Iterator, Deque, Callable, Dict, NamedTuple, Type, Union, \
+    Iterable
 
 from PIL import Image
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from bs4.element import Tag
+from requests import Response
 from urllib3.util import parse_url, Url
 
+from cleaner import CleaningRules, ContentCleaner
+from content import Content
+from store import PageStore, ChapterStore, ChapterRecord, StoredProgress
+from util.adapter import ThreadSafeCacheAdapter, BYPASS_CACHE_HEADER
+from util.ratelimit import RateLimiter, TokenBucket, parse_retry_after, backoff_delay
+from util.soup import HtmlParser, head_of
 from util.text import slugify
 from webot import Browser, Firefox
-from webot.adapter import CacheAdapter
 
 
 class LightNovelEntity:
     """An entity that is identified by a url"""
+    __slots__ = ('log', '_url')
     _url: Url
 
     def __init__(self, url: Url):
@@ -48,7 +59,12 @@ class LightNovelEntity:
 
 class LightNovelPage(LightNovelEntity):
     """A html document of a light novel page"""
+    REQUIRED_SELECTORS: Tuple[str, ...] = ()
+    PARSE_ONLY: Optional[SoupStrainer] = None
     _document: BeautifulSoup
+    _markup: Optional[str] = None
+    _head_markup: Optional[str] = None
+    _build_document: Optional[Callable[[str], BeautifulSoup]] = None
     _success: bool
     _title: str = ''
     _language: str = ''
@@ -60,8 +76,37 @@ class LightNovelPage(LightNovelEntity):
         self._document = document
         self._success = False
 
+    def defer_document(self, markup: str, build: Callable[[str], BeautifulSoup]):
+        """
+        Keeps the html of the page and builds the document only once it gets accessed.
+        Until then, pages can extract data from the raw html.
+        :param markup: The html of the page.
+        :param build: Builds the document from the html.
+        """
+        self._markup = markup
+        self._head_markup = None
+        self._build_document = build
+        self._document = None
+
+    @property
+    def markup(self) -> Optional[str]:
+        """The html of the page, if its document hasn't been built or deleted yet"""
+        return self._markup
+
+    @property
+    def head_markup(self) -> Optional[str]:
+        """The html of the page up to the end of its head"""
+        if self._head_markup is None and self._markup is not None:
+            self._head_markup = head_of(self._markup)
+        return self._head_markup
+
     @property
     def document(self) -> BeautifulSoup:
+        if self._document is None and self._build_document is not None:
+            self._document = self._build_document(self._markup)
+            self._build_document = None
+            self._markup = None
+            self._head_markup = None
         return self._document
 
     @document.setter
@@ -70,7 +115,10 @@ class LightNovelPage(LightNovelEntity):
 
     @document.deleter
     def document(self):
-        del self._document
+        self._document = None
+        self._build_document = None
+        self._markup = None
+        self._head_markup = None
 
     @property
     def success(self) -> bool:
@@ -145,21 +193,30 @@ class Novel(LightNovelPage, ABC):
     def release_date(self) -> Optional[datetime]:
         return self._release_date if self._release_date else None
 
-    def enumerate_chapter_entries(self) -> Generator[Tuple['Book', 'ChapterEntry'], None, None]:
-        """Enumerates all the parsed books and their chapter entries and assigns them their index."""
+    def enumerate_chapter_entries(
+            self, rows: bool = False
+    ) -> Generator[Tuple['Book', Union['ChapterEntry', 'ChapterRow']], None, None]:
+        """
+        Enumerates all the parsed books and their chapter entries and assigns them their index.
+        :param rows: Whether to yield the :class:`ChapterRow` of every entry instead of the entry itself.
+            Rows have the same attributes, but don't create an entry object for every chapter of long novels.
+        :return: A generator that yields every book together with each of its chapter entries.
+        """
+        debug = self.log.isEnabledFor(logging.DEBUG)
         book_n = 0
         chapter_abs_n = 0
         for book in self.books:
             book_n += 1
-            chapter_abs_n += 1
             book.number = book_n
-            chapter_n = 0
-            for chapter_entry in book.chapter_entries:
-                chapter_n += 1
-                chapter_entry.index = chapter_n
-                chapter_entry.abs_index = chapter_abs_n
-                self.log.debug(f"Getting chapter entry {book_n}.{chapter_n}({chapter_abs_n}) '{chapter_entry.title}'")
+            table = book.chapter_entries
+            table.number(book_n, chapter_abs_n + 1)
+            for row in range(len(table)):
+                chapter_entry = table.row(row) if rows else table[row]
+                if debug:
+                    self.log.debug(f"Getting chapter entry {book_n}.{chapter_entry.index}({chapter_entry.abs_index}) "
+                                   f"'{chapter_entry.title}'")
                 yield book, chapter_entry
+            chapter_abs_n += len(table)
 
     def __str__(self):
         if self._author:
@@ -169,28 +226,39 @@ class Novel(LightNovelPage, ABC):
 
 class Book:
     _title: str = ''
-    _chapter_entries: List['ChapterEntry'] = []
-    _chapters: List['Chapter'] = []
+    _chapter_entries: 'ChapterTable' = None
+    _chapters: 'ChapterList' = None
+    _summaries: List['ChapterSummary'] = []
     _novel: 'Novel' = None
     _index: int = 0
 
     def __init__(self, title: str):
         self._title = title
-        self._chapter_entries = []
-        self._chapters = []
+        self._chapter_entries = ChapterTable()
+        self._chapters = ChapterList()
+        self._summaries = []
 
     @property
     def title(self) -> str:
         return self._title
 
     @property
-    def chapter_entries(self) -> List['ChapterEntry']:
+    def chapter_entries(self) -> 'ChapterTable':
         return self._chapter_entries
 
+    @chapter_entries.setter
+    def chapter_entries(self, value: 'ChapterTable'):
+        self._chapter_entries = value
+
     @property
-    def chapters(self) -> List['Chapter']:
+    def chapters(self) -> 'ChapterList':
         return self._chapters
 
+    @property
+    def summaries(self) -> List['ChapterSummary']:
+        """The summaries of the chapters that got released after being written, in the order of their release."""
+        return self._summaries
+
     @property
     def novel(self) -> 'Novel':
         return self._novel
@@ -211,6 +279,7 @@ class Book:
         book = type(self)(self._title)
         book._chapter_entries = self._chapter_entries.copy()
         book._chapters = self._chapters.copy()
+        book._summaries = self._summaries.copy()
         book._novel = self._novel
         book._index = self._index
         return book
@@ -252,20 +321,328 @@ class ChapterEntry(LightNovelEntity):
         return self._title
 
 
+class ChapterRow(NamedTuple):
+    """A row of a :class:`ChapterTable`. It has the attributes of a chapter entry without being one."""
+    base: Url
+    path: str
+    title: str
+    book_number: int
+    index: int
+    abs_index: int
+
+    @property
+    def url(self) -> Url:
+        return Url(self.base.scheme, host=self.base.host, port=self.base.port, path=self.path)
+
+
+class ChapterTable:
+    """
+    The chapter entries of a book, kept in parallel columns instead of one object per entry.
+
+    Index pages of long novels list thousands of chapters. The table only stores their paths and titles,
+    as well as the numbers assigned by :meth:`Novel.enumerate_chapter_entries`. Entry objects get created
+    when an entry is accessed by index or iteration, and are kept from then on.
+    All entries share the scheme and host of the base url.
+    """
+    __slots__ = ('_entry_class', '_base', '_paths', '_titles', '_book_numbers', '_indices', '_abs_indices', '_entries')
+    _entry_class: Type[ChapterEntry]
+    _base: Optional[Url]
+    _paths: List[str]
+    _titles: List[str]
+    _book_numbers: array
+    _indices: array
+    _abs_indices: array
+    _entries: Dict[int, ChapterEntry]
+
+    def __init__(self, base: Url = None, entry_class: Type[ChapterEntry] = ChapterEntry):
+        """
+        Creates an empty table.
+        :param base: The url whose scheme and host the entries share. Defaults to the url of the first appended entry.
+            Entries can only be added by path once the table has a base.
+        :param entry_class: The class of the entries to create.
+        """
+        self._entry_class = entry_class
+        self._base = base
+        self._paths = []
+        self._titles = []
+        self._book_numbers = array('l')
+        self._indices = array('l')
+        self._abs_indices = array('l')
+        self._entries = {}
+
+    def add(self, path: str, title: str):
+        """
+        Adds an entry without creating an object for it.
+        :raises Exception: If the table has no base url to build the url of the entry with.
+        """
+        if self._base is None:
+            raise Exception("The chapter table has no base url. Create it with one or append an entry first.")
+        self._paths.append(path)
+        self._titles.append(title)
+        self._book_numbers.append(0)
+        self._indices.append(len(self._paths))
+        self._abs_indices.append(0)
+
+    def append(self, entry: ChapterEntry):
+        """Adds an existing entry. It is kept and gets returned when accessed."""
+        if self._base is None:
+            self._base = entry.url
+        self._entries[len(self._paths)] = entry
+        self.add(entry.url.path, entry.title)
+        if entry.index > 0:
+            self._indices[-1] = entry.index
+
+    def number(self, book_number: int, first_abs_index: int):
+        """
+        Assigns the book number, the index within the book and the absolute index to every entry.
+        :param book_number: The number of the book of the entries.
+        :param first_abs_index: The absolute index of the first entry.
+        """
+        count = len(self._paths)
+        self._book_numbers = array('l', [book_number]) * count
+        self._indices = array('l', range(1, count + 1))
+        self._abs_indices = array('l', range(first_abs_index, first_abs_index + count))
+        for row, entry in self._entries.items():
+            entry.index = row + 1
+            entry.abs_index = first_abs_index + row
+
+    def url(self, row: int) -> Url:
+        return Url(self._base.scheme, host=self._base.host, port=self._base.port, path=self._paths[row])
+
+    def row(self, row: int) -> ChapterRow:
+        """The columns of an entry, without creating an object for it."""
+        return ChapterRow(self._base, self._paths[row], self._titles[row], self._book_numbers[row],
+                          self._indices[row], self._abs_indices[row])
+
+    def rows(self) -> Iterator[ChapterRow]:
+        return (self.row(row) for row in range(len(self._paths)))
+
+    @property
+    def paths(self) -> List[str]:
+        return self._paths
+
+    @property
+    def titles(self) -> List[str]:
+        return self._titles
+
+    def copy(self) -> 'ChapterTable':
+        table = ChapterTable(self._base, self._entry_class)
+        table._paths = self._paths.copy()
+        table._titles = self._titles.copy()
+        table._book_numbers = array('l', self._book_numbers)
+        table._indices = array('l', self._indices)
+        table._abs_indices = array('l', self._abs_indices)
+        table._entries = self._entries.copy()
+        return table
+
+    def __getitem__(self, row: int) -> ChapterEntry:
+        if row < 0:
+            row += len(self._paths)
+        if not 0 <= row < len(self._paths):
+            raise IndexError(f"Chapter entry {row} out of range")
+        entry = self._entries.get(row)
+        if entry is None:
+            entry = self._entry_class(self.url(row), self._titles[row])
+            entry.index = self._indices[row]
+            entry.abs_index = self._abs_indices[row]
+            self._entries[row] = entry
+        return entry
+
+    def __iter__(self) -> Iterator[ChapterEntry]:
+        return (self[row] for row in range(len(self._paths)))
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+
+class ChapterSummary(NamedTuple):
+    """What a book keeps of a chapter once it got released. See :meth:`Chapter.release`."""
+    url: str
+    index: int
+    abs_index: int
+    title: str
+    # Where the outputs wrote the chapter to
+    paths: Tuple[str, ...]
+
+
+class ChapterList:
+    """
+    The parsed chapters of a book, in the order they got added.
+
+    Chapters get added by the parser and removed again when they get conflated or deleted once they got written.
+    Adding, removing and looking up a chapter take constant time, unlike with a list.
+    """
+    __slots__ = ('_chapters',)
+    _chapters: Dict['Chapter', None]
+
+    def __init__(self, chapters: Iterable['Chapter'] = ()):
+        self._chapters = dict.fromkeys(chapters)
+
+    def append(self, chapter: 'Chapter'):
+        self._chapters[chapter] = None
+
+    def remove(self, chapter: 'Chapter'):
+        try:
+            del self._chapters[chapter]
+        except KeyError:
+            raise ValueError(f"Chapter {chapter} is not a chapter of the book") from None
+
+    def discard(self, chapter: 'Chapter'):
+        self._chapters.pop(chapter, None)
+
+    def copy(self) -> 'ChapterList':
+        return ChapterList(self._chapters)
+
+    def __getitem__(self, index: int) -> 'Chapter':
+        """Looks a chapter up by its position, which takes linear time except for the first and the last one."""
+        index = range(len(self._chapters))[index]
+        if index == len(self._chapters) - 1:
+            return next(reversed(self._chapters))
+        return next(islice(self._chapters, index, None))
+
+    def __contains__(self, chapter: 'Chapter') -> bool:
+        return chapter in self._chapters
+
+    def __iter__(self) -> Iterator['Chapter']:
+        return iter(self._chapters)
+
+    def __reversed__(self) -> Iterator['Chapter']:
+        return reversed(self._chapters)
+
+    def __len__(self) -> int:
+        return len(self._chapters)
+
+
+_CHAPTER_PREFIX_PATTERN = re.compile(r'^chapter\s+[(\[]?\s*(\d+)\s*[)\]\-:]*\s*', re.IGNORECASE)
+_CHAPTER_SUFFIX_PATTERN = re.compile(r'[(\[]?(\d+[A-Z]?)[)\]]?$')
+
+
 class Chapter(LightNovelPage, ABC):
-    _previous_chapter_path: str
-    _next_chapter_path: str
+    PEEKS_WITHOUT_PARSING = False
+    CLEANING_RULES: Optional[CleaningRules] = None
+    _previous_chapter_path: str = None
+    _next_chapter_path: str = None
     _content: Tag = None
+    _content_html: str = None
+    _blocks: Content = None
     _book: Book = None
     _index: int = 0
+    _abs_index: int = 0
+    _digest: str = ''
+    _cleaned: bool = False
+    _restored: bool = False
+    _released: bool = False
+    _output_paths: List[str]
+
+    def __init__(self, url: Url, document: BeautifulSoup):
+        super().__init__(url, document)
+        self._output_paths = []
 
     @property
     def content(self) -> Optional[Tag]:
+        """
+        The content as a tag. Compacted chapters render a new tag from their blocks on every access,
+        so changes to it don't stick. Change the :attr:`blocks` instead.
+        """
+        if self._content is None and self._blocks is not None:
+            return BeautifulSoup(self._blocks.html(), 'html.parser').find()
+        if self._content is None and self._content_html is not None:
+            self._content = BeautifulSoup(self._content_html, 'html.parser').find()
+            self._content_html = None
         if not self._content:
             self.log.warning("Content not parsed yet.")
             return None
         return self._content
 
+    @property
+    def content_html(self) -> str:
+        """The content as html. Restored and compacted chapters return it without building a tag first."""
+        if self._content is not None:
+            return str(self._content)
+        if self._blocks is not None:
+            return self._blocks.html()
+        return self._content_html or ''
+
+    @property
+    def blocks(self) -> Content:
+        """The content as compact blocks. Accessing them compacts the chapter, see :meth:`compact`."""
+        if self._blocks is None:
+            if self._content is not None:
+                self._blocks = Content.from_tag(self._content)
+            elif self._content_html is not None:
+                self._blocks = Content.from_html(self._content_html)
+            else:
+                self._blocks = Content()
+            self._content = None
+            self._content_html = None
+        return self._blocks
+
+    def compact(self):
+        """
+        Converts the parsed content into compact blocks, so it no longer holds on to the document.
+        The html of restored chapters is compact already and only gets converted once the blocks are needed.
+        """
+        if self._content is not None:
+            self._blocks = Content.from_tag(self._content)
+            self._content = None
+
+    @property
+    def digest(self) -> str:
+        """The hash of the page this chapter got parsed from"""
+        return self._digest
+
+    @digest.setter
+    def digest(self, value: str):
+        self._digest = value
+
+    @property
+    def cleaned(self) -> bool:
+        return self._cleaned
+
+    @property
+    def restored(self) -> bool:
+        """Whether the chapter got restored from a :class:`ChapterRecord` instead of being parsed here"""
+        return self._restored
+
+    @property
+    def released(self) -> bool:
+        """Whether the content of the chapter got released, see :meth:`release`"""
+        return self._released
+
+    @property
+    def output_paths(self) -> Tuple[str, ...]:
+        """Where the outputs wrote the chapter to"""
+        return tuple(self._output_paths)
+
+    def add_output_path(self, path: str):
+        """
+        Records where an output wrote the chapter to. Outputs on different threads may do so at once,
+        appending to the list of the chapter is atomic.
+        """
+        self._output_paths.append(path)
+
+    def release(self) -> ChapterSummary:
+        """
+        Drops the content of the chapter once every output wrote it, and replaces the chapter with a summary of it
+        in the chapters of its book. Its book then no longer keeps it alive.
+        The url, title, indices and links of the chapter stay, so later stages can still record progress.
+        Releasing a chapter again only returns its summary.
+        :return: The summary of the chapter.
+        """
+        summary = ChapterSummary(str(self._url), self._index, self._abs_index, self.extract_clean_title(),
+                                 tuple(self._output_paths))
+        if self._released:
+            return summary
+        del self.document
+        self._content = None
+        self._content_html = None
+        self._blocks = None
+        self._released = True
+        if self._book is not None:
+            self._book.chapters.discard(self)
+            self._book.summaries.append(summary)
+        return summary
+
     @property
     def index(self) -> int:
         return self._index
@@ -274,6 +651,15 @@ class Chapter(LightNovelPage, ABC):
     def index(self, value: int):
         self._index = value
 
+    @property
+    def abs_index(self) -> int:
+        """The index of the chapter across all books"""
+        return self._abs_index
+
+    @abs_index.setter
+    def abs_index(self, value: int):
+        self._abs_index = value
+
     @property
     def previous_chapter(self) -> Optional[Url]:
         return self.alter_url(self._previous_chapter_path) if self._previous_chapter_path else None
@@ -286,13 +672,22 @@ class Chapter(LightNovelPage, ABC):
     def book(self) -> Optional[Book]:
         return self._book if self._book else None
 
+    def peek_next_chapter(self) -> Optional[Url]:
+        """
+        Looks up the link to the next chapter without parsing the whole chapter, so the next chapter can be
+        downloaded while this one is still being processed.
+        Chapters that set `PEEKS_WITHOUT_PARSING` find the link in the raw html of any unparsed chapter.
+        :return: The url of the next chapter or None if there is none or it can't be found cheaply.
+        """
+        return self.next_chapter if self._restored or self._success else None
+
     def extract_clean_title(self) -> str:
         """Try to get the title as clean as possible"""
         title = self._title.strip()
-        match = re.compile(r'^chapter\s+[(\[]?\s*(\d+)\s*[)\]\-:]*\s*', re.IGNORECASE).search(title)
+        match = _CHAPTER_PREFIX_PATTERN.search(title)
         if match is not None:
             title = self._cut_match(match, title)
-        match = re.compile(r'[(\[]?(\d+[A-Z]?)[)\]]?$').search(title)
+        match = _CHAPTER_SUFFIX_PATTERN.search(title)
         if match is not None:
             title = self._cut_match(match, title)
         title = title.strip('–- ')
@@ -306,9 +701,61 @@ class Chapter(LightNovelPage, ABC):
         """Whether the chapter has been completely published or not (partial/restricted access)"""
         raise NotImplementedError
 
-    def clean_content(self):
-        """Clean the content of the chapter"""
-        raise NotImplementedError
+    def clean_content(self, cleaner: ContentCleaner = None):
+        """
+        Clean the content of the chapter in place.
+        :param cleaner: The cleaner to use. Defaults to one with the `CLEANING_RULES` of the site.
+        """
+        if cleaner is None:
+            if self.CLEANING_RULES is None:
+                raise NotImplementedError
+            cleaner = ContentCleaner(self.CLEANING_RULES)
+        if self._blocks is not None:
+            self._blocks = cleaner.clean_blocks(self._blocks, self.extract_clean_title())
+        else:
+            self._content = cleaner.clean(self.content, self.extract_clean_title())
+        self._cleaned = True
+
+    def to_record(self) -> ChapterRecord:
+        """Captures the parsed result of the chapter for a :class:`ChapterStore`."""
+        return ChapterRecord(
+            str(self._url),
+            self._digest,
+            self._title,
+            self._translator,
+            self._previous_chapter_path,
+            self._next_chapter_path,
+            self._cleaned,
+            self.content_html,
+            self._record_extra()
+        )
+
+    def restore(self, record: ChapterRecord):
+        """
+        Takes over the parsed result of a chapter from a :class:`ChapterStore` or a parser process instead of
+        parsing the document.
+        The content stays a html string until it gets accessed as a tag.
+        :param record: The stored chapter.
+        """
+        self._digest = record.digest
+        self._title = record.title
+        self._translator = record.translator
+        self._previous_chapter_path = record.previous_path
+        self._next_chapter_path = record.next_path
+        self._cleaned = record.cleaned
+        self._content = None
+        self._content_html = record.content
+        self._blocks = None
+        self._restore_extra(record.extra)
+        self._restored = True
+        self._success = True
+
+    def _record_extra(self) -> dict:
+        """Site specific fields to store along with the chapter"""
+        return {}
+
+    def _restore_extra(self, extra: dict):
+        pass
 
     def __del__(self):
         if self._book is not None:
@@ -325,25 +772,48 @@ class Chapter(LightNovelPage, ABC):
 
 
 class SearchEntry(LightNovelEntity):
+    __slots__ = ('title',)
     title: str
 
 
 class LightNovelApi(ABC):
+    RETRY_STATUS_CODES = (429, 503)
+    IDEMPOTENT_METHODS = ('navigate', 'get')
     _hostname: str
     _browser: Browser
-    _last_request_timestamp: datetime
-    _request_delay: timedelta
-
-    def __init__(self, browser: Browser = Firefox(), delay: timedelta = timedelta(seconds=1.0)):
+    _rate_limiter: RateLimiter
+    default_delay: timedelta = timedelta(seconds=1.0)
+    default_burst: int = 1
+    max_retries: int = 5
+    backoff_base: float = 2.0
+    backoff_cap: float = 300.0
+    html_features: Optional[str] = None
+    html_fallback: Optional[str] = 'html5lib'
+
+    def __init__(self, browser: Browser = Firefox(), delay: timedelta = None, burst: int = None,
+                 rate_limiter: RateLimiter = None, page_store: PageStore = None, chapter_store: ChapterStore = None):
         """
         Creates a new API for a specific service.
         :param browser: The browser to use when executing http requests.
+        :param delay: The average delay between two requests to the host. Changes the bucket of the host
+            in the rate limiter, which is shared with other apis. Defaults to `default_delay` for a new bucket.
+        :param burst: How many requests can be made at once after a quiet period. Like `delay`, changes the bucket
+            of the host and defaults to `default_burst` for a new bucket.
+        :param rate_limiter: The rate limiter to throttle requests with. Defaults to the one shared by all apis.
+        :param page_store: The store to keep novel and chapter pages in for conditional requests.
+        :param chapter_store: The store to restore already parsed chapters from.
         """
         self.log = logging.getLogger(self.__class__.__name__)
         self._browser = browser
-        self._last_request_timestamp = datetime(1, 1, 1)
-        self._request_delay = delay
-        if not isinstance(browser.session.get_adapter('https://'), CacheAdapter):
+        self._page_store = page_store
+        self._chapter_store = chapter_store
+        self._html_parser = HtmlParser(self.html_features, self.html_fallback)
+        self._refresh = False
+        self._rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter.default()
+        if getattr(self, '_hostname', None) is not None:
+            self._rate_limiter.setdefault(self._hostname, self._delay_to_rate(self.default_delay), self.default_burst)
+            self._rate_limiter.configure(self._hostname, None if delay is None else self._delay_to_rate(delay), burst)
+        if ThreadSafeCacheAdapter.mount(browser.session) is None:
             self.log.warning("Not using a CacheAdapter will take a long time for every run.")
 
     @property
@@ -356,6 +826,7 @@ class LightNovelApi(ABC):
 
     @browser.setter
     def browser(self, value: Browser):
+        ThreadSafeCacheAdapter.mount(value.session)
         self._browser = value
 
     @property
@@ -363,20 +834,124 @@ class LightNovelApi(ABC):
         return self._browser.session.get_adapter('https://')
 
     @property
-    def last_request_timestamp(self) -> datetime:
-        return self._last_request_timestamp
+    def rate_limiter(self) -> RateLimiter:
+        return self._rate_limiter
+
+    @property
+    def page_store(self) -> Optional[PageStore]:
+        return self._page_store
+
+    @page_store.setter
+    def page_store(self, value: Optional[PageStore]):
+        self._page_store = value
+
+    @property
+    def html_parser(self) -> HtmlParser:
+        """
+        The parser to build documents with. Defaults to the fastest available parser with an html5lib fallback
+        for pages that miss the selectors the page class requires. Sites can change the default
+        with `html_features` and `html_fallback`.
+        """
+        return self._html_parser
+
+    @html_parser.setter
+    def html_parser(self, value: HtmlParser):
+        self._html_parser = value
+
+    @property
+    def chapter_store(self) -> Optional[ChapterStore]:
+        return self._chapter_store
+
+    @chapter_store.setter
+    def chapter_store(self, value: Optional[ChapterStore]):
+        self._chapter_store = value
+
+    @property
+    def refresh(self) -> bool:
+        """
+        Whether novel and chapter pages should be revalidated with the host instead of being taken from the cache.
+        Pages in the page store are requested conditionally and reused if the host answers with 304 Not Modified.
+        """
+        return self._refresh
+
+    @refresh.setter
+    def refresh(self, value: bool):
+        if value and self._page_store is None:
+            self.log.warning("Refreshing without a page store downloads every page in full.")
+        self._refresh = value
 
-    @last_request_timestamp.setter
-    def last_request_timestamp(self, value: datetime):
-        self._last_request_timestamp = value
+    @property
+    def throttle(self) -> TokenBucket:
+        """The token bucket of the host of this api. Keeps track of how long requests had to wait."""
+        return self._rate_limiter.bucket(self._hostname)
 
     @property
     def request_delay(self) -> timedelta:
-        return self._request_delay
+        rate = self.throttle.rate
+        return timedelta(seconds=1.0 / rate) if rate > 0 else timedelta.max
 
     @request_delay.setter
     def request_delay(self, value: timedelta):
-        self._request_delay = value
+        self.throttle.rate = self._delay_to_rate(value)
+
+    @staticmethod
+    def _delay_to_rate(delay: timedelta) -> float:
+        seconds = delay.total_seconds()
+        return 1.0 / seconds if seconds > 0 else float('inf')
+
+    def _request(self, method: str, url: Any, **kwargs: Any) -> Response:
+        """
+        Executes an http request through the browser once the rate limiter of the host allows it.
+        Requests that got answered by the cache don't count towards the limit.
+
+        If the host rejects the request (429 or 503), the rate limiter of the host backs off for the time
+        given by the Retry-After header (or exponentially with jitter) and idempotent requests are retried.
+        :param method: The browser method to use (navigate, get, post).
+        :param url: The url to send the request to.
+        :param kwargs: Additional args to convey to the requests library.
+        :raises requests.HTTPError: If the host still rejects the request after all retries.
+        :return: The response to the request.
+        """
+        hostname = parse_url(str(url)).host
+        attempt = 0
+        while True:
+            self._rate_limiter.acquire(hostname)
+            response = getattr(self._browser, method)(str(url), **kwargs)
+            cache_hit = self._was_cache_hit(response)
+            if cache_hit:
+                self.log.debug("Hit in cache. Giving back the request token")
+                self._rate_limiter.refund(hostname)
+            if response.status_code not in self.RETRY_STATUS_CODES:
+                if not cache_hit:
+                    self._rate_limiter.reward(hostname)
+                return response
+            if isinstance(self.adapter, ThreadSafeCacheAdapter):
+                self.adapter.delete(response.url)  # Never keep a rejection in the cache
+            if method not in self.IDEMPOTENT_METHODS or attempt >= self.max_retries:
+                response.raise_for_status()
+                return response
+            if not cache_hit:
+                delay = parse_retry_after(response.headers.get('Retry-After'))
+                if delay is None:
+                    delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+                self.log.warning(f"Got status {response.status_code} for {url} (attempt {attempt + 1}).")
+                self._rate_limiter.penalize(hostname, delay)
+            attempt += 1
+
+    def _uncached_headers(self, headers: Dict[str, Optional[str]] = None) -> Dict[str, Optional[str]]:
+        """
+        Marks the headers of a request to bypass the http cache. Requests of other threads still use the cache.
+        :param headers: The headers of the request.
+        :return: A copy of the headers, along with the :data:`BYPASS_CACHE_HEADER` if the browser uses a cache.
+        """
+        headers = dict(headers) if headers is not None else {}
+        if isinstance(self.adapter, ThreadSafeCacheAdapter):
+            headers[BYPASS_CACHE_HEADER] = '1'
+        return headers
+
+    @staticmethod
+    def _was_cache_hit(response: Response) -> bool:
+        return getattr(response, 'from_cache', False)
 
     def _get_document(self, url: Url, **kwargs: Any) -> BeautifulSoup:
         """
@@ -385,11 +960,84 @@ class LightNovelApi(ABC):
         :param kwargs: Additional args to convey to the requests library.
         :return: An instance of BeautifulSoup which represents the html document.
         """
-        self.check_wait_condition()
         kwargs.setdefault('headers', {}).setdefault('Accept', 'text/html')
-        response = self._browser.navigate(str(url), **kwargs)
-        self._last_request_timestamp = datetime.now()
-        return BeautifulSoup(response.text, features="html5lib")
+        response = self._request('navigate', url, **kwargs)
+        return self._make_document(response.text)
+
+    def _make_document(self, markup: str, page_class: type = None) -> BeautifulSoup:
+        """
+        Parses the html of a page.
+        :param markup: The html of the page.
+        :param page_class: The :class:`LightNovelPage` class of the page. Only the parts it declares in `PARSE_ONLY`
+            get built, and the parser falls back to html5lib if its `REQUIRED_SELECTORS` are missing.
+        :return: An instance of BeautifulSoup which represents the html document.
+        """
+        if page_class is None:
+            return self._html_parser.parse(markup)
+        return self._html_parser.parse(markup, page_class.REQUIRED_SELECTORS, page_class.PARSE_ONLY)
+
+    def _get_page(self, url: Url, page_class: type = None) -> BeautifulSoup:
+        """
+        Downloads the html document of a novel or chapter page.
+        :param url: The url where the page is located at.
+        :param page_class: The :class:`LightNovelPage` class of the page. See :meth:`_make_document`.
+        :return: An instance of BeautifulSoup which represents the html document.
+        """
+        return self._make_document(self._get_page_html(url), page_class)
+
+    def _get_page_html(self, url: Url) -> str:
+        """
+        Downloads the html of a novel or chapter page.
+
+        The page is kept in the page store along with its validators (ETag, Last-Modified). In refresh mode,
+        stored pages are requested conditionally, bypassing the cache, and reused on 304 Not Modified.
+        :param url: The url where the page is located at.
+        :return: The html of the page.
+        """
+        headers = {'Accept': 'text/html'}
+        stored = self._page_store.get(str(url)) if self._page_store is not None else None
+        if self._refresh:
+            if stored is not None:
+                if stored.etag:
+                    headers['If-None-Match'] = stored.etag
+                if stored.last_modified:
+                    headers['If-Modified-Since'] = stored.last_modified
+            response = self._request('navigate', url, headers=self._uncached_headers(headers))
+            if stored is not None and response.status_code == 304:
+                self.log.debug(f"Page {url} not modified. Reusing stored page.")
+                self._page_store.touch(str(url))
+                return stored.body
+        else:
+            response = self._request('navigate', url, headers=headers)
+        if self._page_store is not None and response.status_code == 200 and not self._was_cache_hit(response):
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if etag or last_modified:
+                self._page_store.put(str(url), etag, last_modified, response.text)
+        return response.text
+
+    def _make_chapter(self, chapter_class: type, url: Url, html: str) -> Chapter:
+        """
+        Creates a chapter from the html of its page.
+        If the chapter store holds the parsed result of the very same page, the chapter gets restored
+        from it without building a document. Otherwise the document gets built once the chapter needs it.
+        :param chapter_class: The chapter class of the service.
+        :param url: The url of the chapter.
+        :param html: The html of the chapter page.
+        :return: The restored chapter or a chapter ready to be parsed.
+        """
+        digest = ChapterStore.digest(html)
+        if self._chapter_store is not None:
+            record = self._chapter_store.get(str(url), digest)
+            if record is not None:
+                self.log.debug(f"Restoring chapter {url} from the chapter store.")
+                chapter = chapter_class(url, None)
+                chapter.restore(record)
+                return chapter
+        chapter = chapter_class(url, None)
+        chapter.defer_document(html, lambda markup: self._make_document(markup, chapter_class))
+        chapter.digest = digest
+        return chapter
 
     def get_novel(self, url: Url) -> Novel:
         """
@@ -397,7 +1045,7 @@ class LightNovelApi(ABC):
         :param url: The url where the page is located at.
         :return: An instance of a Novel.
         """
-        return Novel(url, self._get_document(url))
+        return Novel(url, self._get_page(url))
 
     def get_image(self, url: str) -> Image.Image:
         """
@@ -405,8 +1053,7 @@ class LightNovelApi(ABC):
         :param url: The url of the image.
         :return: An image object representation.
         """
-        response = self._browser.get(str(url))
-        self._last_request_timestamp = datetime.now()
+        response = self._request('get', url)
         return Image.open(BytesIO(response.content))
 
     def get_chapter(self, url: Url) -> Chapter:
@@ -415,9 +1062,14 @@ class LightNovelApi(ABC):
         :param url: The url where the chapter is located at.
         :return: An instance of a Chapter.
         """
-        return Chapter(url, self._get_document(url))
-
-    def get_entire_novel(self, url: Url) -> Tuple[Novel, Generator[Tuple[Book, Chapter], None, None]]:
+        return Chapter(url, self._get_page(url))
+
+    def get_entire_novel(
+            self,
+            url: Url,
+            prefetch: int = 0,
+            workers: int = 4,
+            since: StoredProgress = None) -> Tuple[Novel, Generator[Tuple[Book, Chapter], None, None]]:
         """
         Downloads the main page of a novel (including its image) and then all its chapters.
         It also links the chapters to the corresponding books and the image with the novel.
@@ -428,6 +1080,9 @@ class LightNovelApi(ABC):
         If the main page did not get parsed properly, the function returns the parsed novel
         and an empty list.
         :param url: The url where the main page of the novel is located at.
+        :param prefetch: How many listed chapters may be downloaded ahead of the consumer. 0 disables prefetching.
+        :param workers: How many threads download the prefetched chapters.
+        :param since: The progress of an earlier run. Only the chapters after it get downloaded.
         :return: A tuple with an instance of the Novel, an image and a list of the downloaded chapters.
         """
         novel = self.get_novel(url)
@@ -440,53 +1095,178 @@ class LightNovelApi(ABC):
             return novel, empty_gen()
         self.log.info(f"Downloading novel {novel.title} ({novel.url}).")
         novel.cover = self.get_image(novel.cover_url)
-        return novel, self.get_all_chapters(novel)
-
-    def get_all_chapters(self, novel: Novel) -> Generator[Tuple[Book, Chapter], None, None]:
+        return novel, self.get_all_chapters(novel, prefetch, workers, since)
+
+    def get_all_chapters(
+            self,
+            novel: Novel,
+            prefetch: int = 0,
+            workers: int = 4,
+            since: StoredProgress = None,
+            chapter_range: Tuple[int, Optional[int]] = None) -> Generator[Tuple[Book, Chapter], None, None]:
         """
         Creates a generator that downloads all the available chapters of a novel, including
         those that aren't listed on the front page of the novel.
 
+        With a `chapter_range`, only the listed chapters within the range of absolute indices get downloaded.
+        Links to unlisted chapters are only followed if the range is open-ended.
+
+        In update mode (`since` given), the listed chapters up to the recorded one are skipped without
+        being downloaded. If none of the listed chapters are new, the generator continues at the recorded
+        next chapter link or, if there was none, checks the recorded chapter for a new one.
+        Use :attr:`refresh` to revalidate cached pages in update mode.
+
         The generator can be fed into various pipelines.
         :param novel: The novel from which the chapters should be downloaded. Has to be parsed already.
+        :param prefetch: How many listed chapters may be downloaded ahead of the consumer. 0 disables prefetching.
+            When following links, the next chapter gets downloaded while the current one is being consumed.
+        :param workers: How many threads download the prefetched chapters.
+        :param since: The progress of an earlier run, as recorded by :class:`ProgressTracker` or returned by
+            :meth:`Checkpointer.resume`.
+        :param chapter_range: The first and last absolute index of the chapters to download. The last can be None.
         :return: A generator that downloads each chapter.
         """
         chapter_index = 0
+        abs_index = 0
         book = None
         chapter = None
-        for book, chapter_entry in novel.enumerate_chapter_entries():
+        entries = novel.enumerate_chapter_entries(rows=True)
+        if since is not None:
+            entries = ((book, entry) for book, entry in entries if entry.abs_index > since.abs_index)
+        if chapter_range is not None:
+            first, last = chapter_range
+            entries = (
+                (book, entry) for book, entry in entries
+                if entry.abs_index >= first and (last is None or entry.abs_index <= last)
+            )
+        if prefetch > 0:
+            chapters = self._prefetch_chapters(entries, prefetch, workers)
+        else:
+            chapters = ((book, chapter_entry, self.get_chapter(chapter_entry.url)) for book, chapter_entry in entries)
+        for book, chapter_entry, chapter in chapters:
             chapter_index = chapter_entry.index
-            chapter = self.get_chapter(chapter_entry.url)
-            chapter.index = chapter_entry.index
+            abs_index = chapter_entry.abs_index
+            chapter.index = chapter_index
+            chapter.abs_index = abs_index
             yield book, chapter
-        while chapter.success and chapter.next_chapter:
+        if chapter_range is not None and chapter_range[1] is not None:
+            next_url = None
+        elif chapter is not None:
+            next_url = chapter.next_chapter if chapter.success else None
+        elif since is not None:
+            book, next_url = self._resume_point(novel, since)
+            chapter_index = since.chapter_index
+            abs_index = since.abs_index
+        else:
+            next_url = None
+        if prefetch > 0:
+            chapters = self._follow_speculatively(next_url)
+        else:
+            chapters = self._follow(next_url)
+        for chapter in chapters:
             chapter_index += 1
-            self.log.debug(f"Following existing next chapter link({chapter.next_chapter}).")
-            chapter = self.get_chapter(chapter.next_chapter)
+            abs_index += 1
             chapter.index = chapter_index
+            chapter.abs_index = abs_index
             yield book, chapter
 
-    def check_wait_condition(self):
-        """
-        Waits until the proxy request delay expires.
-        The delay will be omitted if the last request was a hit in the cache.
-        """
-        adapter = self._browser.session.get_adapter('https://')
-        if isinstance(adapter, CacheAdapter):
-            if adapter.hit:
-                self.log.debug("Hit in cache. No need to wait")
-                return
-        self.await_timeout()
-
-    def await_timeout(self):
-        now = datetime.now()
-        wait_until = self._last_request_timestamp + self._request_delay
-        if now < wait_until:
-            wait_remainder = wait_until - now
-            self.log.debug(f"Waiting for {wait_remainder.total_seconds()} seconds")
-            time.sleep(wait_remainder.total_seconds())
+    def _follow(self, next_url: Optional[Url]) -> Generator[Chapter, None, None]:
+        """
+        Downloads chapters by following their next chapter links.
+        :param next_url: The url of the first chapter to download.
+        :return: A generator that yields the chapters. Every link is looked up after the consumer processed the chapter.
+        """
+        while next_url:
+            self.log.debug(f"Following existing next chapter link({next_url}).")
+            chapter = self.get_chapter(next_url)
+            yield chapter
+            next_url = chapter.next_chapter if chapter.success else None
+
+    def _follow_speculatively(self, next_url: Optional[Url]) -> Generator[Chapter, None, None]:
+        """
+        Downloads chapters by following their next chapter links, starting the download of the next chapter
+        as soon as :meth:`Chapter.peek_next_chapter` finds its link, while the current chapter is being consumed.
+
+        If the link found after consuming the chapter differs from the peeked one, the speculative download
+        gets dropped and the actual link is followed instead.
+        :param next_url: The url of the first chapter to download.
+        :return: A generator that yields the chapters.
+        """
+        executor = ThreadPoolExecutor(1, thread_name_prefix='speculate')
+        speculative_url = None
+        speculative: Optional[Future] = None
+        try:
+            while next_url:
+                self.log.debug(f"Following existing next chapter link({next_url}).")
+                if speculative is not None and str(speculative_url) == str(next_url):
+                    chapter = speculative.result()
+                else:
+                    if speculative is not None:
+                        self.log.debug(f"Dropping speculative download of {speculative_url}.")
+                        speculative.cancel()
+                    chapter = self.get_chapter(next_url)
+                speculative_url = chapter.peek_next_chapter()
+                speculative = executor.submit(self.get_chapter, speculative_url) if speculative_url else None
+                yield chapter
+                next_url = chapter.next_chapter if chapter.success else None
+        finally:
+            if speculative is not None:
+                speculative.cancel()
+            executor.shutdown(wait=False)
+
+    def _resume_point(self, novel: Novel, since: StoredProgress) -> Tuple[Optional[Book], Optional[Url]]:
+        """
+        Finds where to continue after the recorded progress when no listed chapter is new.
+        :param novel: The parsed novel.
+        :param since: The recorded progress of the novel.
+        :return: The book to add new chapters to and the url of the next chapter, if there is one.
+        """
+        books = novel.books
+        if 0 < since.book_index <= len(books):
+            book = books[since.book_index - 1]
         else:
-            self.log.debug("Delay already expired. No need to wait")
+            book = books[-1] if books else None
+        if since.next_path:
+            return book, novel.alter_url(since.next_path)
+        self.log.debug(f"Checking last chapter ({since.chapter_url}) for a new next chapter link.")
+        last_chapter = self.get_chapter(parse_url(since.chapter_url))
+        if last_chapter.PEEKS_WITHOUT_PARSING:
+            return book, last_chapter.peek_next_chapter()
+        if not last_chapter.parse():
+            self.log.warning(f"Couldn't parse last chapter ({since.chapter_url}).")
+            return book, None
+        return book, last_chapter.next_chapter
+
+    def _prefetch_chapters(
+            self,
+            entries: Iterator[Tuple[Book, ChapterRow]],
+            window: int,
+            workers: int) -> Generator[Tuple[Book, ChapterRow, Chapter], None, None]:
+        """
+        Downloads the chapters of the given entries on a pool of threads while keeping their order.
+
+        At most `window` chapters are downloaded ahead of the consumer. Every download still
+        goes through the rate limiter of this api.
+        :param entries: The chapter entries to download, together with their books.
+        :param window: The maximum amount of chapters being downloaded or waiting to be consumed.
+        :param workers: The amount of threads to download the chapters with.
+        :return: A generator that yields the books, entries and downloaded chapters in their original order.
+        """
+        pending: Deque[Tuple[Book, ChapterRow, Future]] = deque()
+        executor = ThreadPoolExecutor(max_workers=max(1, min(workers, window)), thread_name_prefix='prefetch')
+        try:
+            for book, chapter_entry in entries:
+                pending.append((book, chapter_entry, executor.submit(self.get_chapter, chapter_entry.url)))
+                if len(pending) >= window:
+                    book, chapter_entry, future = pending.popleft()
+                    yield book, chapter_entry, future.result()
+            while len(pending) > 0:
+                book, chapter_entry, future = pending.popleft()
+                yield book, chapter_entry, future.result()
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
 
     def search(self, **kwargs) -> List[SearchEntry]:
         """
@@ -499,6 +1279,7 @@ class LightNovelApi(ABC):
     # TODO: Get rid of this atrocity and use a proper architecture to deal with this instead.
     @staticmethod
     def compile_to_latex_pdf(novel: Novel, chapters: List[Chapter], folder: str):
+        from pipeline import LatexMaker
         from util import LatexHtmlSink
         if os.path.isdir(folder):
             shutil.rmtree(folder)
@@ -518,38 +1299,9 @@ class LightNovelApi(ABC):
             chapter_path = os.path.join(path, chapter_filename_no_ext + '.tex')
             chapter_filenames_no_ext.append(chapter_filename_no_ext)
             with open(chapter_path, 'w') as f:
-                f.write(f"\\chapter{{{chapter.title}}}\n{converter.parse(chapter.content)}")
+                f.write(f"\\chapter{{{chapter.title}}}\n{converter.render(chapter.blocks)}")
         with open(os.path.join(folder, novel_title, novel_title + '.tex'), 'w') as f:
-            # noinspection SpellCheckingInspection
-            f.write(f"""\\documentclass[oneside,11pt]{{memoir}}
-\\usepackage[normalem]{{ulem}}
-\\usepackage{{fontspec}}
-\\input{{structure.tex}}
-\\title{{{novel.title}}}
-\\author{{{novel.translator}}}
-\\newcommand{{\\edition}}{{}}
-\\makeatletter\\@addtoreset{{chapter}}{{part}}\\makeatother%
-\\begin{{document}}
-\\thispagestyle{{empty}}
-%\\ThisCenterWallPaper{{1.12}}{{cover.jpg}}
-\\begin{{tikzpicture}}[remember picture,overlay]
-\\node[rectangle, rounded corners, fill=white, opacity=0.75, anchor=south west, minimum width=4cm, minimum height=3cm] (box) at (-0.5,-10) (box){{}};
-\\node[anchor=west, color01, xshift=-2cm, yshift=-0.8cm, text width=3.9cm, font=\\sffamily\\bfseries\\scshape\\Large] at (box.north){{\\thetitle}};
-\\node[anchor=west, color01, xshift=-2cm, yshift=-1.8cm, text width=3.9cm, font=\\sffamily\\scriptsize] at (box.north){{\\edition}};
-\\node[anchor=west, color01, xshift=-2cm, yshift=-2.5cm, text width=3.9cm, font=\\sffamily\\bfseries] at (box.north){{\\theauthor}};
-\\end{{tikzpicture}}
-\\newpage
-
-\\tableofcontents
-
-\\chapter*{{Synopsis}}
-{converter.parse(novel.description)}
-\\newpage
-"""
-                    )
-            for chapter_title in chapter_filenames_no_ext:
-                f.write(f"\\include{{{chapter_title}}}\n")
-            f.write("\\end{document}")
+            f.write(LatexMaker.document(novel, chapter_filenames_no_ext, converter))
         shutil.copyfile('structure.tex', os.path.join(folder, novel_title, 'structure.tex'))
 
     @staticmethod
@@ -0,0 +1,409 @@
+import asyncio
+import functools
+import json
+import logging
+import ssl
+from abc import ABC
+from concurrent.futures import Executor
+from datetime import timedelta
+from io import BytesIO
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple, Union
+
+from PIL import Image
+from bs4 import BeautifulSoup
+from urllib3.util import parse_url, Url
+
+from api import Book, Chapter, Novel, SearchEntry, LightNovelApi
+from util.ratelimit import RateLimiter, TokenBucket, parse_retry_after, backoff_delay
+from util.soup import HtmlParser
+
+
+class AsyncResponse:
+    """The response of an http request made through an :class:`AsyncTransport`"""
+    url: str
+    status_code: int
+    headers: Dict[str, str]
+    content: bytes
+
+    def __init__(self, url: str, status_code: int, headers: Dict[str, str], content: bytes):
+        self.url = url
+        self.status_code = status_code
+        self.headers = {key.lower(): value for key, value in headers.items()}
+        self.content = content
+
+    @property
+    def encoding(self) -> str:
+        content_type = self.headers.get('content-type', '')
+        for param in content_type.split(';')[1:]:
+            key, _, value = param.strip().partition('=')
+            if key.lower() == 'charset' and value:
+                return value.strip('"')
+        return 'utf-8'
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, errors='replace')
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise IOError(f"Request to {self.url} failed with status {self.status_code}")
+
+
+class AsyncTransport(ABC):
+    """Executes http requests for an :class:`AsyncLightNovelApi`"""
+
+    async def request(
+            self,
+            method: str,
+            url: str,
+            headers: Dict[str, str] = None,
+            data: Union[str, bytes] = None) -> AsyncResponse:
+        """
+        Executes a single http request.
+        :param method: The http method to use.
+        :param url: The url to send the request to.
+        :param headers: Additional headers to send.
+        :param data: The body of the request.
+        :return: The response to the request.
+        """
+        raise NotImplementedError('Must be overwritten')
+
+    async def close(self):
+        pass
+
+
+class StreamTransport(AsyncTransport):
+    """A minimal HTTP/1.1 client on top of asyncio streams. Opens one connection per request."""
+    REDIRECT_CODES = (301, 302, 303, 307, 308)
+    default_headers: Dict[str, str]
+    max_redirects: int
+
+    def __init__(self, default_headers: Dict[str, str] = None, max_redirects: int = 5,
+                 ssl_context: ssl.SSLContext = None):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.default_headers = {
+            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:71.0) Gecko/20100101 Firefox/71.0',
+            'Accept-Language': 'en-US,en;q=0.5',
+        }
+        if default_headers is not None:
+            self.default_headers.update(default_headers)
+        self.max_redirects = max_redirects
+        self._ssl_context = ssl_context
+
+    async def request(
+            self,
+            method: str,
+            url: str,
+            headers: Dict[str, str] = None,
+            data: Union[str, bytes] = None) -> AsyncResponse:
+        for _ in range(self.max_redirects + 1):
+            response = await self._send(method, url, headers, data)
+            if response.status_code not in self.REDIRECT_CODES or 'location' not in response.headers:
+                return response
+            location = parse_url(response.headers['location'])
+            if location.host is None:
+                current = parse_url(url)
+                location = Url(current.scheme, host=current.host, port=current.port, path=location.path,
+                               query=location.query)
+            self.log.debug(f"Following redirect from {url} to {location}")
+            url = str(location)
+            if response.status_code == 303:
+                method, data = 'GET', None
+        raise IOError(f"Too many redirects for {url}")
+
+    async def _send(self, method: str, url: str, headers: Optional[Dict[str, str]],
+                    data: Optional[Union[str, bytes]]) -> AsyncResponse:
+        parsed = parse_url(url)
+        secure = parsed.scheme == 'https'
+        port = parsed.port or (443 if secure else 80)
+        body = data.encode('utf-8') if isinstance(data, str) else data
+        request_headers = dict(self.default_headers)
+        request_headers.update({
+            'Host': parsed.netloc,
+            'Connection': 'close',
+            'Accept-Encoding': 'identity',
+        })
+        if headers is not None:
+            request_headers.update({key: value for key, value in headers.items() if value is not None})
+        if body is not None:
+            request_headers['Content-Length'] = str(len(body))
+        ssl_context = (self._ssl_context or ssl.create_default_context()) if secure else None
+        reader, writer = await asyncio.open_connection(parsed.host, port, ssl=ssl_context)
+        try:
+            head = [f"{method} {parsed.request_uri} HTTP/1.1"]
+            head.extend(f"{key}: {value}" for key, value in request_headers.items())
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+            if body is not None:
+                writer.write(body)
+            await writer.drain()
+            status_line = (await reader.readline()).decode('latin-1')
+            status_code = int(status_line.split(' ', 2)[1])
+            response_headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').rstrip('\r\n')
+                if line == '':
+                    break
+                key, _, value = line.partition(':')
+                response_headers[key.strip().lower()] = value.strip()
+            if method == 'HEAD' or status_code in (204, 304):
+                content = b''
+            elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+                content = await self._read_chunked(reader)
+            elif 'content-length' in response_headers:
+                content = await reader.readexactly(int(response_headers['content-length']))
+            else:
+                content = await reader.read()
+        finally:
+            writer.close()
+            await writer.wait_closed()
+        return AsyncResponse(url, status_code, response_headers, content)
+
+    @staticmethod
+    async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0].strip(), 16)
+            if size == 0:
+                await reader.readline()
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+
+
+class AsyncLightNovelApi(ABC):
+    """
+    The asyncio counterpart to :class:`LightNovelApi`.
+    Downloads happen on the event loop, while the html parsing is done on an executor.
+    """
+    IDEMPOTENT_METHODS = ('GET', 'HEAD')
+    _hostname: str
+    _transport: AsyncTransport
+    _rate_limiter: RateLimiter
+    _executor: Optional[Executor]
+    default_delay: timedelta = timedelta(seconds=1.0)
+    default_burst: int = 1
+    max_retries: int = 5
+    backoff_base: float = 2.0
+    backoff_cap: float = 300.0
+    html_features: Optional[str] = None
+    html_fallback: Optional[str] = 'html5lib'
+
+    def __init__(self, transport: AsyncTransport = None, delay: timedelta = None, burst: int = None,
+                 rate_limiter: RateLimiter = None, executor: Executor = None):
+        """
+        Creates a new asynchronous API for a specific service.
+        :param transport: The transport to use when executing http requests. Defaults to a :class:`StreamTransport`.
+        :param delay: The average delay between two requests to the host. Changes the bucket of the host
+            in the rate limiter, which is shared with other apis. Defaults to `default_delay` for a new bucket.
+        :param burst: How many requests can be made at once after a quiet period. Like `delay`, changes the bucket
+            of the host and defaults to `default_burst` for a new bucket.
+        :param rate_limiter: The rate limiter to throttle requests with. Defaults to the one shared by all apis.
+        :param executor: The executor to parse the documents on. Defaults to the executor of the event loop.
+        """
+        self.log = logging.getLogger(self.__class__.__name__)
+        self._transport = transport if transport is not None else StreamTransport()
+        self._rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter.default()
+        if getattr(self, '_hostname', None) is not None:
+            rate = None if delay is None else LightNovelApi._delay_to_rate(delay)
+            self._rate_limiter.setdefault(self._hostname, LightNovelApi._delay_to_rate(self.default_delay),
+                                          self.default_burst)
+            self._rate_limiter.configure(self._hostname, rate, burst)
+        self._executor = executor
+        self._html_parser = HtmlParser(self.html_features, self.html_fallback)
+
+    @property
+    def hostname(self) -> str:
+        return self._hostname
+
+    @property
+    def html_parser(self) -> HtmlParser:
+        """The parser to build documents with. See :attr:`LightNovelApi.html_parser`."""
+        return self._html_parser
+
+    @html_parser.setter
+    def html_parser(self, value: HtmlParser):
+        self._html_parser = value
+
+    @property
+    def transport(self) -> AsyncTransport:
+        return self._transport
+
+    @property
+    def rate_limiter(self) -> RateLimiter:
+        return self._rate_limiter
+
+    @property
+    def throttle(self) -> TokenBucket:
+        """The token bucket of the host of this api. Keeps track of how long requests had to wait."""
+        return self._rate_limiter.bucket(self._hostname)
+
+    async def close(self):
+        await self._transport.close()
+
+    async def _run_blocking(self, func: Callable, *args: Any) -> Any:
+        """
+        Runs a blocking function on the executor, so it doesn't stall the event loop.
+        :param func: The function to run.
+        :param args: The arguments to pass to the function.
+        :return: The return value of the function.
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    async def _request(self, method: str, url: Union[str, Url], **kwargs: Any) -> AsyncResponse:
+        """
+        Executes an http request once the rate limiter of the host allows it.
+
+        Rejected requests (429 or 503) make the rate limiter of the host back off, after which
+        idempotent requests are retried. See :meth:`LightNovelApi._request`.
+        :param method: The http method to use.
+        :param url: The url to send the request to.
+        :param kwargs: Additional args to convey to the transport.
+        :raises IOError: If the host still rejects the request after all retries.
+        :return: The response to the request.
+        """
+        hostname = parse_url(str(url)).host
+        attempt = 0
+        while True:
+            await self.throttle_request(hostname)
+            response = await self._transport.request(method, str(url), **kwargs)
+            if response.status_code not in LightNovelApi.RETRY_STATUS_CODES:
+                self._rate_limiter.reward(hostname)
+                return response
+            if method not in self.IDEMPOTENT_METHODS or attempt >= self.max_retries:
+                response.raise_for_status()
+                return response
+            delay = parse_retry_after(response.headers.get('retry-after'))
+            if delay is None:
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+            self.log.warning(f"Got status {response.status_code} for {url} (attempt {attempt + 1}).")
+            self._rate_limiter.penalize(hostname, delay)
+            attempt += 1
+
+    async def throttle_request(self, hostname: str) -> float:
+        """
+        Waits without blocking the event loop until another request to the host is allowed.
+        :param hostname: The host to be requested.
+        :return: The amount of seconds waited.
+        """
+        wait = self._rate_limiter.reserve(hostname)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    async def _get_document(self, url: Url, headers: Dict[str, str] = None, page_class: type = None) -> BeautifulSoup:
+        """
+        Downloads an html document from a given url and parses it on the executor.
+        :param url: The url where the document is located at.
+        :param headers: Additional headers to send.
+        :param page_class: The :class:`LightNovelPage` class of the page. See :meth:`LightNovelApi._make_document`.
+        :return: An instance of BeautifulSoup which represents the html document.
+        """
+        headers = dict(headers) if headers is not None else {}
+        headers.setdefault('Accept', 'text/html')
+        response = await self._request('GET', url, headers=headers)
+        if page_class is None:
+            return await self._run_blocking(self._html_parser.parse, response.text)
+        return await self._run_blocking(
+            self._html_parser.parse, response.text, page_class.REQUIRED_SELECTORS, page_class.PARSE_ONLY)
+
+    async def get_novel(self, url: Url) -> Novel:
+        """
+        Downloads the main page of the novel from the given url.
+        :param url: The url where the page is located at.
+        :return: An instance of a Novel.
+        """
+        return Novel(url, await self._get_document(url))
+
+    async def get_image(self, url: Union[str, Url]) -> Image.Image:
+        """
+        Downloads an image from a url.
+        :param url: The url of the image.
+        :return: An image object representation.
+        """
+        response = await self._request('GET', url)
+        return await self._run_blocking(Image.open, BytesIO(response.content))
+
+    async def get_chapter(self, url: Url) -> Chapter:
+        """
+        Downloads a chapter from the given url.
+        :param url: The url where the chapter is located at.
+        :return: An instance of a Chapter.
+        """
+        return Chapter(url, await self._get_document(url))
+
+    async def get_entire_novel(self, url: Url) -> Tuple[Novel, AsyncGenerator[Tuple[Book, Chapter], None]]:
+        """
+        Downloads and parses the main page of a novel (including its image) and creates an
+        asynchronous generator for all its chapters.
+
+        If the main page did not get parsed properly, the function returns the parsed novel
+        and an empty generator.
+        :param url: The url where the main page of the novel is located at.
+        :return: A tuple with an instance of the Novel and an asynchronous generator of the chapters.
+        """
+        novel = await self.get_novel(url)
+        if not await self._run_blocking(novel.parse):
+            self.log.warning("Couldn't parse novel page. No chapters will be extracted.")
+
+            async def empty_gen():
+                for item in ():
+                    yield item
+
+            return novel, empty_gen()
+        self.log.info(f"Downloading novel {novel.title} ({novel.url}).")
+        novel.cover = await self.get_image(novel.cover_url)
+        return novel, self.get_all_chapters(novel)
+
+    async def get_all_chapters(self, novel: Novel) -> AsyncGenerator[Tuple[Book, Chapter], None]:
+        """
+        Creates an asynchronous generator that downloads and parses all the available chapters of a novel,
+        including those that aren't listed on the front page of the novel.
+
+        Unlike :meth:`LightNovelApi.get_all_chapters`, the chapters are already parsed (on the executor),
+        as the links to the next chapters are needed to continue. The generator stops at the first chapter
+        that could not be parsed or is not complete.
+        :param novel: The novel from which the chapters should be downloaded. Has to be parsed already.
+        :return: An asynchronous generator that downloads each chapter.
+        """
+        chapter_index = 0
+        book = None
+        chapter = None
+        for book, chapter_entry in novel.enumerate_chapter_entries(rows=True):
+            chapter_index = chapter_entry.index
+            chapter = await self.get_chapter(chapter_entry.url)
+            chapter.index = chapter_entry.index
+            if not await self._parse_chapter(book, chapter):
+                return
+            yield book, chapter
+        while chapter is not None and chapter.next_chapter:
+            chapter_index += 1
+            self.log.debug(f"Following existing next chapter link({chapter.next_chapter}).")
+            chapter = await self.get_chapter(chapter.next_chapter)
+            chapter.index = chapter_index
+            if not await self._parse_chapter(book, chapter):
+                return
+            yield book, chapter
+
+    async def _parse_chapter(self, book: Book, chapter: Chapter) -> bool:
+        chapter._book = book
+        if not await self._run_blocking(chapter.parse):
+            self.log.warning(f"Failed parsing chapter {chapter}")
+            return False
+        if not chapter.is_complete():
+            self.log.warning("Chapter not complete.")
+            return False
+        self.log.info(f"Got chapter {chapter} ({chapter.url})")
+        del chapter.document
+        return True
+
+    async def search(self, **kwargs) -> List[SearchEntry]:
+        """
+        Searches for a novel by title.
+        :param kwargs: The search parameters to use.
+        :return: A list of SearchEntry.
+        """
+        raise NotImplementedError
@@ -0,0 +1,167 @@
+import logging
+from typing import FrozenSet, List, NamedTuple
+
+from bs4.element import NavigableString, Tag
+
+from content import Block, BlockKind, Content, Run, IMAGE
+
+EPUB_TAGS = frozenset([
+    'a', 'abbr', 'acronym', 'applet', 'b', 'bdo', 'big', 'br', 'cite', 'code', 'del', 'dfn', 'em', 'i', 'iframe',
+    'img', 'ins', 'kbd', 'map', 'noscript', 'ns:svg', 'object', 'q', 'samp', 'script', 'small', 'span', 'strong',
+    'sub', 'sup', 'tt', 'var',
+    # Added:
+    'p', 'div', 'hr'
+])
+
+
+class CleaningRules(NamedTuple):
+    """What a :class:`ContentCleaner` keeps of the content of a chapter. Every site declares its own rules."""
+    # Tags that may appear within paragraphs. Others get renamed to `rename_to`.
+    allowed_tags: FrozenSet[str] = EPUB_TAGS
+    rename_to: str = 'span'
+    # Top level tags that are paragraphs. Empty ones get dropped.
+    paragraph_tags: FrozenSet[str] = frozenset(['p', 'div', 'blockquote'])
+    # Paragraph tags whose children have to be wrapped in a paragraph, i.e. block quotes.
+    wrapped_tags: FrozenSet[str] = frozenset(['blockquote'])
+    # Top level tags that are kept as they are.
+    kept_tags: FrozenSet[str] = frozenset(['hr', 'ol', 'ul'])
+    # Top level tags that are dropped, i.e. navigation links.
+    dropped_tags: FrozenSet[str] = frozenset(['a'])
+    # Whether links within paragraphs lose their attributes.
+    strip_links: bool = True
+    # Paragraphs with exactly these texts are navigation and get dropped.
+    nav_texts: FrozenSet[str] = frozenset(['Next Chapter', 'Previous Chapter'])
+    # If one of the first paragraphs contains the title, it and everything before it gets dropped.
+    title_paragraphs: int = 4
+    # Whether unexpected top level tags raise an exception. Otherwise they are dropped.
+    strict: bool = True
+
+
+class ContentCleaner:
+    """
+    Cleans the content of a chapter according to the rules of its site.
+
+    The content gets changed in place in a single pass over its top level tags: dropped tags are extracted
+    and the descendants of every kept paragraph get visited once to rename and strip tags.
+    Compacted content gets cleaned by the same rules, block by block. Its blocks have no tags left to rename, but
+    their paragraphs lose the links and images that would have been stripped or renamed.
+    """
+    rules: CleaningRules
+
+    def __init__(self, rules: CleaningRules = CleaningRules()):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.rules = rules
+
+    def clean(self, content: Tag, title: str = '') -> Tag:
+        """
+        Cleans the content of a chapter.
+        :param content: The content tag. It gets detached from its document and loses its attributes.
+        :param title: The clean title of the chapter, to detect paragraphs that repeat it.
+        :return: The cleaned content tag.
+        """
+        rules = self.rules
+        kept: List[Tag] = []
+        paragraphs = 0
+        for child in list(content.contents):
+            if isinstance(child, NavigableString):
+                if len(child.strip('\n  ')) > 0:
+                    self.log.warning(f"Non-Empty string: '{child}'.")
+                child.extract()
+                continue
+            if not isinstance(child, Tag):
+                raise Exception(f"Unexpected type: {child}")
+            name = child.name
+            if name in rules.paragraph_tags:
+                text = child.get_text()
+                if len(text.strip('\n ')) == 0 or text in rules.nav_texts:
+                    child.extract()
+                    continue
+                if name in rules.wrapped_tags:
+                    self._wrap(child)
+                self._clean_paragraph(child)
+                kept.append(child)
+                paragraphs += 1
+                if paragraphs <= rules.title_paragraphs and title != '' and title in text.strip('\n '):
+                    self.log.debug("Title found in paragraph. Discarding previous paragraphs.")
+                    for tag in kept:
+                        tag.extract()
+                    kept.clear()
+                    paragraphs = rules.title_paragraphs
+            elif name in rules.kept_tags:
+                kept.append(child)
+            elif name in rules.dropped_tags or not rules.strict:
+                child.extract()
+            else:
+                raise Exception(f"Unexpected tag name: {child}")
+        content.extract()
+        content.name = 'div'
+        content.attrs = {}
+        return content
+
+    def clean_blocks(self, content: Content, title: str = '') -> Content:
+        """
+        Cleans the content of a chapter that got compacted into blocks.
+        :param content: The blocks of the content. They get changed in place.
+        :param title: The clean title of the chapter, to detect paragraphs that repeat it.
+        :return: The cleaned blocks.
+        """
+        rules = self.rules
+        kept: List[Block] = []
+        paragraphs = 0
+        for block in content.blocks:
+            if block.tag is None:
+                if len(block.text.strip('\n  ')) > 0:
+                    self.log.warning(f"Non-Empty string: '{block.text}'.")
+                continue
+            if block.tag in rules.paragraph_tags or block.kind == BlockKind.QUOTE:
+                text = block.text
+                if len(text.strip('\n ')) == 0 or text in rules.nav_texts:
+                    continue
+                self._clean_runs(block)
+                kept.append(block)
+                paragraphs += 1
+                if paragraphs <= rules.title_paragraphs and title != '' and title in text.strip('\n '):
+                    self.log.debug("Title found in paragraph. Discarding previous paragraphs.")
+                    kept.clear()
+                    paragraphs = rules.title_paragraphs
+            elif block.tag in rules.kept_tags:
+                kept.append(block)
+            elif block.tag not in rules.dropped_tags and rules.strict:
+                raise Exception(f"Unexpected tag name: {block}")
+        content.blocks = kept
+        return content
+
+    def _clean_runs(self, block: Block):
+        """Drops the images and link targets of a paragraph block that :meth:`_clean_paragraph` would strip."""
+        rules = self.rules
+        keep_images = 'img' in rules.allowed_tags
+        keep_links = 'a' in rules.allowed_tags and not rules.strip_links
+        if keep_images and keep_links:
+            return
+        runs = []
+        for run in block.runs:
+            if run.style & IMAGE:
+                if keep_images:
+                    runs.append(run)
+            elif run.url is not None and not keep_links:
+                runs.append(Run(run.text, run.style))
+            else:
+                runs.append(run)
+        block.runs = tuple(runs)
+
+    @staticmethod
+    def _wrap(tag: Tag):
+        """Moves the children of a tag into a new paragraph within it."""
+        paragraph = Tag(name='p')
+        for child in list(tag.contents):
+            paragraph.append(child.extract())
+        tag.append(paragraph)
+
+    def _clean_paragraph(self, paragraph: Tag):
+        rules = self.rules
+        for tag in paragraph.find_all(True):
+            if tag.name not in rules.allowed_tags:
+                self.log.debug(f"Tag '{tag.name}' is not allowed. Changing to {rules.rename_to}")
+                tag.name = rules.rename_to
+            if tag.name == 'a' and rules.strip_links:
+                tag.attrs = {}
@@ -0,0 +1,254 @@
+import html
+from enum import Enum
+from typing import Iterator, List, Optional, Tuple, Union
+
+from bs4 import BeautifulSoup
+from bs4.element import Comment, NavigableString, Tag
+
+ITALIC = 1
+BOLD = 2
+UNDERLINE = 4
+STRIKE = 8
+SUPERSCRIPT = 16
+SUBSCRIPT = 32
+BREAK = 64  # A line break. Its run has no text.
+IMAGE = 128  # An image. The text of its run is the alternative text, its url the source.
+
+INLINE_STYLES = {
+    'em': ITALIC, 'i': ITALIC, 'strong': BOLD, 'b': BOLD, 'u': UNDERLINE, 'del': STRIKE, 's': STRIKE,
+    'strike': STRIKE, 'sup': SUPERSCRIPT, 'sub': SUBSCRIPT,
+}
+STYLE_TAGS = ((ITALIC, 'em'), (BOLD, 'strong'), (UNDERLINE, 'u'), (STRIKE, 'del'), (SUPERSCRIPT, 'sup'),
+              (SUBSCRIPT, 'sub'))
+HEADING_TAGS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+BLOCK_TAGS = frozenset(['p', 'div', 'blockquote', 'hr', 'ol', 'ul', 'table', *HEADING_TAGS])
+
+
+class BlockKind(Enum):
+    PARAGRAPH = 'paragraph'
+    RULE = 'rule'
+    ORDERED_LIST = 'ordered_list'
+    UNORDERED_LIST = 'unordered_list'
+    QUOTE = 'quote'
+    HEADING = 'heading'
+    TABLE = 'table'
+
+
+class Run:
+    """A piece of text within a block, with the styles and the link target that apply to all of it."""
+    __slots__ = ('text', 'style', 'url')
+
+    def __init__(self, text: str, style: int = 0, url: str = None):
+        """
+        :param text: The text of the run. The alternative text of an image.
+        :param style: The style flags of the run.
+        :param url: The target of a link or the source of an image.
+        """
+        self.text = text
+        self.style = style
+        self.url = url
+
+    def html(self) -> str:
+        if self.style & BREAK:
+            return '<br/>'
+        if self.style & IMAGE:
+            return f"<img alt=\"{html.escape(self.text)}\" src=\"{html.escape(self.url or '')}\"/>"
+        string = html.escape(self.text, quote=False)
+        for flag, name in reversed(STYLE_TAGS):
+            if self.style & flag:
+                string = f"<{name}>{string}</{name}>"
+        if self.url is not None:
+            string = f"<a href=\"{html.escape(self.url)}\">{string}</a>"
+        return string
+
+    def __repr__(self):
+        if self.url is not None:
+            return f"Run({self.text!r}, {self.style}, {self.url!r})"
+        return f"Run({self.text!r}, {self.style})"
+
+
+Runs = Tuple[Run, ...]
+
+
+class Block:
+    """
+    A paragraph, horizontal rule, list, quote, heading or table of the content of a chapter.
+    Paragraphs, quotes and headings consist of runs, lists of items which consist of runs
+    and tables of rows of cells which consist of runs. Header cells become regular cells.
+    """
+    __slots__ = ('kind', 'tag', 'runs', 'items', 'level')
+
+    def __init__(self, kind: BlockKind, tag: Optional[str], runs: Runs = (),
+                 items: Union[Tuple[Runs, ...], Tuple[Tuple[Runs, ...], ...]] = (), level: int = 0):
+        """
+        :param kind: The kind of the block.
+        :param tag: The name of the top level tag of the content the block got converted from, for cleaning rules.
+            None for loose text.
+        :param runs: The text of a paragraph, quote or heading.
+        :param items: The text of every item of a list, or of every cell of every row of a table.
+        :param level: The level of a heading, from 1 to 6.
+        """
+        self.kind = kind
+        self.tag = tag
+        self.runs = runs
+        self.items = items
+        self.level = level
+
+    @property
+    def text(self) -> str:
+        """The text of the block like that of its tag, i.e. without the alternative texts of images."""
+        if self.kind == BlockKind.TABLE:
+            return ''.join(_text(cell) for row in self.items for cell in row)
+        if self.items:
+            return ''.join(_text(item) for item in self.items)
+        return _text(self.runs)
+
+    def html(self) -> str:
+        if self.kind == BlockKind.RULE:
+            return '<hr/>'
+        if self.kind in (BlockKind.ORDERED_LIST, BlockKind.UNORDERED_LIST):
+            name = 'ol' if self.kind == BlockKind.ORDERED_LIST else 'ul'
+            items = ''.join(f"<li>{_html(item)}</li>" for item in self.items)
+            return f"<{name}>{items}</{name}>"
+        if self.kind == BlockKind.TABLE:
+            rows = ''.join(f"<tr>{''.join(f'<td>{_html(cell)}</td>' for cell in row)}</tr>" for row in self.items)
+            return f"<table>{rows}</table>"
+        runs = _html(self.runs)
+        if self.kind == BlockKind.QUOTE:
+            return f"<blockquote><p>{runs}</p></blockquote>"
+        if self.kind == BlockKind.HEADING:
+            return f"<h{self.level}>{runs}</h{self.level}>"
+        return f"<p>{runs}</p>"
+
+    def __repr__(self):
+        return f"Block({self.kind.value}, {self.tag!r}, {self.text[:30]!r})"
+
+
+class Content:
+    """
+    The content of a chapter as a compact sequence of blocks.
+
+    Unlike a tag, it holds no references into the document it got parsed from, and only keeps text and styles.
+    """
+    __slots__ = ('blocks',)
+
+    def __init__(self, blocks: List[Block] = None):
+        self.blocks = blocks if blocks is not None else []
+
+    @classmethod
+    def from_tag(cls, tag: Tag) -> 'Content':
+        """
+        Converts the content tag of a chapter.
+        Tags that wrap several blocks, i.e. divs around paragraphs, get flattened into their blocks.
+        :param tag: The content tag.
+        :return: The blocks of the content.
+        """
+        content = cls()
+        content._convert_children(tag)
+        return content
+
+    @classmethod
+    def from_html(cls, markup: str) -> 'Content':
+        """Converts the html of the content of a chapter, as returned by :meth:`html`."""
+        tag = BeautifulSoup(markup, 'html.parser').find()
+        return cls.from_tag(tag) if tag is not None else cls()
+
+    def _convert_children(self, parent: Tag, top_tag: str = None):
+        """Converts the children of a tag. Blocks nested in a top level tag get that tag for the cleaning rules."""
+        for child in parent.children:
+            if isinstance(child, Comment):
+                continue
+            if isinstance(child, NavigableString):
+                if child.strip():
+                    self.blocks.append(Block(BlockKind.PARAGRAPH, top_tag, (Run(str(child)),)))
+                continue
+            if not isinstance(child, Tag):
+                continue
+            name = child.name
+            tag = top_tag if top_tag is not None else name
+            if name == 'hr':
+                self.blocks.append(Block(BlockKind.RULE, tag))
+            elif name in ('ol', 'ul'):
+                kind = BlockKind.ORDERED_LIST if name == 'ol' else BlockKind.UNORDERED_LIST
+                items = tuple(_runs(item) for item in child.find_all('li', recursive=False))
+                self.blocks.append(Block(kind, tag, items=items))
+            elif name == 'blockquote':
+                self.blocks.append(Block(BlockKind.QUOTE, tag, _runs(child)))
+            elif name in HEADING_TAGS:
+                self.blocks.append(Block(BlockKind.HEADING, tag, _runs(child), level=HEADING_TAGS[name]))
+            elif name == 'table':
+                rows = tuple(
+                    tuple(_runs(cell) for cell in row.find_all(('td', 'th'), recursive=False))
+                    for row in child.find_all('tr') if row.find_parent('table') is child
+                )
+                self.blocks.append(Block(BlockKind.TABLE, tag, items=rows))
+            elif name in ('p', 'div') and any(isinstance(nested, Tag) and nested.name in BLOCK_TAGS
+                                             for nested in child.children):
+                self._convert_children(child, tag)
+            else:
+                self.blocks.append(Block(BlockKind.PARAGRAPH, tag, _runs(child, top=True)))
+
+    @property
+    def text(self) -> str:
+        return ''.join(block.text for block in self.blocks)
+
+    def html(self) -> str:
+        return f"<div>{''.join(block.html() for block in self.blocks)}</div>"
+
+    def extend(self, other: 'Content'):
+        self.blocks.extend(other.blocks)
+
+    def __iter__(self) -> Iterator[Block]:
+        return iter(self.blocks)
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    def __getitem__(self, index: int) -> Block:
+        return self.blocks[index]
+
+
+def _runs(tag: Tag, top: bool = False) -> Runs:
+    """
+    Collects the text within a tag as runs, merging neighbouring text of the same style and link.
+    :param tag: The tag to collect the text of.
+    :param top: Whether the styles, link or image of the tag itself apply as well, i.e. for a top level image.
+    """
+    runs: List[Run] = []
+    if top:
+        _collect_run(tag, 0, None, runs)
+    else:
+        _collect_runs(tag, 0, None, runs)
+    return tuple(runs)
+
+
+def _collect_runs(tag: Tag, style: int, url: Optional[str], runs: List[Run]):
+    for child in tag.children:
+        _collect_run(child, style, url, runs)
+
+
+def _collect_run(node, style: int, url: Optional[str], runs: List[Run]):
+    if isinstance(node, Comment):
+        return
+    if isinstance(node, NavigableString):
+        if runs and runs[-1].style == style and runs[-1].url == url:
+            runs[-1].text += node
+        else:
+            runs.append(Run(str(node), style, url))
+    elif isinstance(node, Tag):
+        if node.name == 'br':
+            runs.append(Run('', BREAK))
+        elif node.name == 'img':
+            runs.append(Run(node.get('alt', ''), IMAGE, node.get('src')))
+        else:
+            if node.name == 'a' and node.get('href') is not None:
+                url = node['href']
+            _collect_runs(node, style | INLINE_STYLES.get(node.name, 0), url, runs)
+
+
+def _text(runs: Runs) -> str:
+    return ''.join(run.text for run in runs if not run.style & IMAGE)
+
+
+def _html(runs: Runs) -> str:
+    return ''.join(run.html() for run in runs)
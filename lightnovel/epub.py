@@ -1,8 +1,9 @@
+import base64
 import logging
 import os
 from abc import ABC
 from datetime import datetime
-from typing import AnyStr, List
+from typing import Any, AnyStr, List
 from typing import Dict
 from zipfile import ZipFile, ZIP_STORED
 
@@ -255,7 +256,7 @@ class ChapterFile(XHtmlFile):
         <div class="titlepage">
             <h2 class="title"><a id="{self.unique_id}">{title}</a></h2>
         </div>
-        {str(chapter.content)}
+        {chapter.content_html}
     </div>
 </body>
 </html>""", 'html.parser')
@@ -401,16 +402,41 @@ class CoverFile(XHtmlFile):
 </html>''', 'html.parser')
 
 
+class RestoredFile(XHtmlFile):
+    """A book or chapter file that got written before the :class:`EpubFile` got resumed."""
+
+    def __init__(self, unique_id: str, filepath: str):
+        super().__init__()
+        self.unique_id = unique_id
+        self.filepath = f"OEBPS/{filepath}"
+
+
 class EpubFile(ZipFile):
+    """
+    An EPUB file that gets written book by book and chapter by chapter.
+    The table of contents and the package document get written when it is closed.
+
+    A long run can save a checkpoint of the file from time to time. If the run dies, the file can be resumed from
+    the last checkpoint: everything written after it gets cut off and the books and chapters before it are kept.
+    """
+
     def __init__(self, file: str, unique_id: str, title: str, language: str, identifier: str, rights: str = None,
                  publisher: str = None, subject: str = None, date: datetime = None, description: str = None,
                  creator: str = None, cover_image: Image = None, toc_depth=2, mode="r", compression=ZIP_STORED,
-                 allow_zip64=True, compress_level=None):
-        super().__init__(file, mode, compression, allow_zip64, compress_level)
-        mimetype = MimeTypeFile()
-        self.__write_file(mimetype)
-        container = ContainerFile()
-        self.__write_file(container)
+                 allow_zip64=True, compress_level=None, resume: Dict[str, Any] = None):
+        """
+        :param resume: The state returned by :meth:`checkpoint` to resume the file from, instead of writing a new one.
+        """
+        self._zip_arguments = (compression, allow_zip64, compress_level)
+        if resume is not None:
+            self.repair(file, resume)
+            super().__init__(file, 'a', *self._zip_arguments)
+        else:
+            super().__init__(file, mode, *self._zip_arguments)
+            mimetype = MimeTypeFile()
+            self.__write_file(mimetype)
+            container = ContainerFile()
+            self.__write_file(container)
         self.toc = TOC(identifier, title, toc_depth)
         self.content = ContentFile(unique_id)
         self.content.title = title
@@ -434,8 +460,11 @@ class EpubFile(ZipFile):
             image = ImageFile('cover', cover_image, 'cover-image')
             cover = CoverFile(image)
             self.content.register_cover_image(image, cover)
-            self.__write_file(image)
-            self.__write_file(cover)
+            if resume is None:
+                self.__write_file(image)
+                self.__write_file(cover)
+        if resume is not None:
+            self.__restore(resume)
 
     def __write_file(self, file: EpubEntry):
         if isinstance(file.content, BeautifulSoup):
@@ -454,6 +483,47 @@ class EpubFile(ZipFile):
         self.content.add_file(chapter)
         self.toc.add_chapter(book, chapter)
 
+    def has_book(self, book_file: BookFile) -> bool:
+        return book_file.unique_id in self.toc.structure
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """
+        Makes sure the books and chapters added so far are on disk and returns the state to resume the file from.
+
+        The zip file gets closed, which writes its central directory, and opened again to append to it. As the next
+        chapter overwrites the directory, a copy of it is part of the state.
+        :return: The state to pass as `resume`.
+        """
+        ZipFile.close(self)
+        ZipFile.__init__(self, self.filename, 'a', *self._zip_arguments)
+        with open(self.filename, 'rb') as fp:
+            fp.seek(self.start_dir)
+            directory = fp.read()
+        return {
+            'offset': self.start_dir,
+            'directory': base64.b64encode(directory).decode('ascii'),
+            'structure': {book_id: list(chapter_ids) for book_id, chapter_ids in self.toc.structure.items()},
+            'titles': dict(self.toc.id2title),
+            'filepaths': dict(self.toc.id2filepath),
+        }
+
+    @staticmethod
+    def repair(file: str, state: Dict[str, Any]):
+        """Cuts off everything written to a file after a checkpoint and puts the central directory back."""
+        with open(file, 'r+b') as fp:
+            fp.seek(state['offset'])
+            fp.truncate()
+            fp.write(base64.b64decode(state['directory']))
+
+    def __restore(self, state: Dict[str, Any]):
+        """Registers the books and chapters that got written before the checkpoint."""
+        self.toc.structure = {book_id: list(chapter_ids) for book_id, chapter_ids in state['structure'].items()}
+        self.toc.id2title = dict(state['titles'])
+        self.toc.id2filepath = dict(state['filepaths'])
+        for book_id, chapter_ids in self.toc.structure.items():
+            for unique_id in (book_id, *chapter_ids):
+                self.content.add_file(RestoredFile(unique_id, self.toc.id2filepath[unique_id]))
+
     def __enter__(self):
         return self
 
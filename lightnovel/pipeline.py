@@ -1,16 +1,27 @@
+import json
 import logging
 import os
 import re
+import shutil
+import threading
 from abc import ABC
-from typing import Generator
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from queue import Queue, Empty
+from typing import Any, Deque, Dict, Generator, List, NamedTuple, Optional, Sequence, Union
 from typing import Tuple
 
+from urllib3.util import parse_url
+
 from api import Book, Chapter, Novel
+from cleaner import ContentCleaner, CleaningRules, EPUB_TAGS
 from epub import EpubFile, BookFile, ChapterFile
-from util import slugify, make_sure_dir_exists
+from store import ChapterStore, ChapterRecord, ProgressStore, CheckpointStore, StoredProgress
+from util import slugify, make_sure_dir_exists, MarkdownHtmlSink, LatexHtmlSink
+from util.adapter import ThreadSafeCacheAdapter
+from util.soup import HtmlParser
 # noinspection PyProtectedMember
 from webot import Browser
-from webot.adapter import CacheAdapter
 
 
 class Pipeline(ABC):
@@ -24,9 +35,14 @@ class Pipeline(ABC):
 
 
 class Parser(Pipeline):
-    def __init__(self, browser: Browser):
+    def __init__(self, browser: Browser, chapter_store: ChapterStore = None):
+        """
+        :param browser: The browser the chapters got downloaded with.
+        :param chapter_store: The store to keep the parsed chapters in. Restored chapters don't get stored again.
+        """
         super().__init__()
-        self._adapter = browser.session.get_adapter('https://')
+        self._adapter = ThreadSafeCacheAdapter.mount(browser.session)
+        self._chapter_store = chapter_store
 
     def wrap(self, gen: Generator[Tuple[Book, Chapter], None, None]) -> Generator[Tuple[Book, Chapter], None, None]:
         for book, chapter in gen:
@@ -37,71 +53,479 @@ class Parser(Pipeline):
             else:
                 if chapter.is_complete():
                     self.log.info(f"Got chapter {chapter} ({chapter.url})")
+                    if self._chapter_store is not None and not chapter.restored:
+                        self._chapter_store.put(chapter.to_record())
+                    chapter.compact()
                     del chapter.document
                     book.chapters.append(chapter)
                     yield book, chapter
                 else:
                     self.log.warning("Chapter not complete.")
-                    if isinstance(self._adapter, CacheAdapter):
-                        self._adapter.delete_last()
+                    if self._adapter is not None:
+                        self._adapter.delete(chapter.url)
                     return
 
 
+_process_parsers: Dict[Tuple[str, Optional[str]], HtmlParser] = {}
+
+
+def _parse_in_process(chapter_class: type, url: str, markup: str, digest: str, features: str,
+                      fallback: Optional[str], clean: bool) -> Tuple[bool, bool, Optional[ChapterRecord]]:
+    """
+    Parses a chapter page in a worker process of the :class:`ProcessParser`.
+    :return: Whether the chapter got parsed, whether it is complete and its parsed result.
+    """
+    parser = _process_parsers.get((features, fallback))
+    if parser is None:
+        parser = _process_parsers[(features, fallback)] = HtmlParser(features, fallback)
+    chapter = chapter_class(parse_url(url), None)
+    chapter.defer_document(markup, lambda html: parser.parse(html, chapter_class.REQUIRED_SELECTORS,
+                                                             chapter_class.PARSE_ONLY))
+    chapter.digest = digest
+    if not chapter.parse():
+        return False, False, None
+    if not chapter.is_complete():
+        return True, False, None
+    if clean:
+        chapter.clean_content()
+    return True, True, chapter.to_record()
+
+
+class ProcessParser(Pipeline):
+    """
+    Parses chapters in a pool of worker processes, so parsing isn't limited to a single core.
+
+    The raw html of the chapters gets sent to the workers, which parse and optionally clean the chapters and
+    send back their :class:`ChapterRecord` instead of a document. The chapters then get restored from it.
+    Up to `window` chapters get downloaded and parsed ahead; they are yielded in the order they came in.
+    Chapters without raw html, i.e. restored ones, don't get sent to the workers.
+    """
+
+    def __init__(self, browser: Browser, chapter_store: ChapterStore = None, html_parser: HtmlParser = None,
+                 workers: int = None, window: int = None, clean: bool = True):
+        """
+        :param browser: The browser the chapters got downloaded with.
+        :param chapter_store: The store to keep the parsed chapters in. Restored chapters don't get stored again.
+        :param html_parser: The parser whose features and fallback the workers use. Defaults to the fastest one.
+        :param workers: The amount of worker processes. Defaults to the amount of cores.
+        :param window: How many chapters may be parsing at once. Defaults to twice the amount of workers.
+        :param clean: Whether the workers clean the content as well. A :class:`HtmlCleaner` passes them through.
+        """
+        super().__init__()
+        self._adapter = ThreadSafeCacheAdapter.mount(browser.session)
+        self._chapter_store = chapter_store
+        self._html_parser = html_parser if html_parser is not None else HtmlParser()
+        self._workers = workers if workers is not None else os.cpu_count() or 1
+        self._window = window if window is not None else 2 * self._workers
+        self._clean = clean
+
+    def wrap(self, gen: Generator[Tuple[Book, Chapter], None, None]) -> Generator[Tuple[Book, Chapter], None, None]:
+        pending: Deque[Tuple[Book, Chapter, Optional[Future]]] = deque()
+        with ProcessPoolExecutor(self._workers) as executor:
+            try:
+                for book, chapter in gen:
+                    pending.append((book, chapter, self._submit(executor, chapter)))
+                    if len(pending) >= self._window:
+                        if not (yield from self._finish(pending)):
+                            return
+                while pending:
+                    if not (yield from self._finish(pending)):
+                        return
+            finally:
+                for _, _, future in pending:
+                    if future is not None:
+                        future.cancel()
+
+    def _submit(self, executor: ProcessPoolExecutor, chapter: Chapter) -> Optional[Future]:
+        if chapter.restored or chapter.markup is None:
+            return None
+        return executor.submit(_parse_in_process, type(chapter), str(chapter.url), chapter.markup, chapter.digest,
+                               self._html_parser.features, self._html_parser.fallback, self._clean)
+
+    def _finish(self, pending: Deque[Tuple[Book, Chapter, Optional[Future]]]) -> Generator:
+        """Waits for the oldest chapter and yields it. Returns False if the chapters ran out."""
+        book, chapter, future = pending.popleft()
+        chapter._book = book
+        if future is None:
+            parsed = chapter.parse()
+            complete = parsed and chapter.is_complete()
+        else:
+            parsed, complete, record = future.result()
+            if record is not None:
+                if self._chapter_store is not None:
+                    self._chapter_store.put(record)
+                del chapter.document
+                chapter.restore(record)
+        if not parsed:
+            self.log.warning(f"Failed parsing chapter {chapter}")
+            return False
+        if not complete:
+            self.log.warning("Chapter not complete.")
+            if self._adapter is not None:
+                self._adapter.delete(chapter.url)
+            return False
+        self.log.info(f"Got chapter {chapter} ({chapter.url})")
+        del chapter.document
+        book.chapters.append(chapter)
+        yield book, chapter
+        return True
+
+
+class QueueStats(NamedTuple):
+    """How full a queue between two stages of a :class:`PipelineExecutor` is."""
+    name: str
+    size: int
+    maxsize: int
+    peak: int
+
+
+class _Failure:
+    """Passes an exception raised by a stage on to the next one."""
+    __slots__ = ('exception',)
+
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+_END = object()
+
+
+class _Channel:
+    """
+    A bounded queue between two threads of a :class:`PipelineExecutor`.
+
+    The reading side closes it once it stops reading, which makes the writing side stop as well.
+    """
+
+    def __init__(self, name: str, maxsize: int):
+        self.name = name
+        self._queue = Queue(maxsize)
+        self._closed = False
+        self.peak = 0
+
+    def put(self, item: Any) -> bool:
+        """
+        Waits for room in the queue and puts an item into it.
+        :return: False if the reading side closed the channel, so the writing side should stop.
+        """
+        if self._closed:
+            return False
+        self._queue.put(item)
+        self.peak = max(self.peak, self._queue.qsize())
+        return True
+
+    def drain(self) -> Generator[Tuple[Book, Chapter], None, None]:
+        """Yields the items until the end of the stream. Exceptions of the writing side get raised again."""
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.exception
+            yield item
+
+    def close(self):
+        """Stops reading. Emptying the queue unblocks a writer waiting for room, which then sees it closed."""
+        self._closed = True
+        try:
+            while True:
+                self._queue.get_nowait()
+        except Empty:
+            pass
+
+    @property
+    def stats(self) -> QueueStats:
+        return QueueStats(self.name, self._queue.qsize(), self._queue.maxsize, self.peak)
+
+
+class PipelineExecutor(Pipeline):
+    """
+    Runs pipeline stages on their own threads, linked by bounded queues.
+
+    The chapter generator gets drained on a thread of its own, and every stage wraps the queue before it and fills
+    the queue after it. Downloading, parsing and writing the chapters therefore overlap, while the queues cap how
+    many chapters are held in between. The chapters keep their order.
+
+    An exception in the generator or a stage gets passed on through the following stages and raised again by the
+    executor. If a stage stops early, i.e. at an incomplete chapter, or the consumer stops reading, the stages before
+    it get closed as well. Like with prefetching, the generator may have downloaded further chapters by then.
+    """
+
+    def __init__(self, *stages: Pipeline, queue_size: int = 8):
+        """
+        :param stages: The stages to run, in the order they would wrap each other.
+        :param queue_size: How many chapters each queue holds at most.
+        """
+        super().__init__()
+        self._stages = stages
+        self._queue_size = queue_size
+        self._channels: List[_Channel] = []
+
+    @property
+    def queue_stats(self) -> List[QueueStats]:
+        """How full each queue is, and was at most, from the one after the generator to the one before the consumer."""
+        return [channel.stats for channel in self._channels]
+
+    def wrap(self, gen: Generator[Tuple[Book, Chapter], None, None]) -> Generator[Tuple[Book, Chapter], None, None]:
+        names = ['source', *(stage.__class__.__name__ for stage in self._stages), 'consumer']
+        self._channels = channels = [
+            _Channel(f"{names[i]} -> {names[i + 1]}", self._queue_size) for i in range(len(self._stages) + 1)
+        ]
+        threads = [threading.Thread(target=self._run, args=(lambda _: gen, None, channels[0]),
+                                    name='pipeline-source', daemon=True)]
+        for i, stage in enumerate(self._stages):
+            threads.append(threading.Thread(target=self._run, args=(stage.wrap, channels[i], channels[i + 1]),
+                                            name=f"pipeline-{names[i + 1]}", daemon=True))
+        for thread in threads:
+            thread.start()
+        try:
+            yield from channels[-1].drain()
+        finally:
+            channels[-1].close()
+            for thread in threads:
+                thread.join()
+            self.log.debug(f"Queue peaks: {', '.join(f'{s.name}: {s.peak}/{s.maxsize}' for s in self.queue_stats)}")
+
+    @staticmethod
+    def _run(wrap, source: Optional[_Channel], sink: _Channel):
+        """Fills the sink with the chapters a stage yields, until the stage ends or the sink gets closed."""
+        gen = None
+        try:
+            gen = wrap(source.drain() if source is not None else None)
+            for item in gen:
+                if not sink.put(item):
+                    break
+            else:
+                sink.put(_END)
+        except Exception as e:
+            sink.put(_Failure(e))
+        finally:
+            if gen is not None:
+                gen.close()
+            if source is not None:
+                source.close()
+
+
+class FanOut(Pipeline):
+    """
+    Sends every chapter to several branches of output stages in one pass, so each chapter only gets downloaded
+    and parsed once, whatever the amount of formats.
+
+    Every branch runs on its own thread behind a bounded queue. A slow branch only holds the others up once its
+    queue is full. A failing branch gets logged and dropped, while the other branches and the chapters passed on
+    go on. All branches finish writing before the stage ends, i.e. when the chapters ran out or the consumer stopped.
+
+    The branches share the chapters, so they must not change them. Cleaning and conflation belong before the fan-out.
+    In streaming mode, every chapter gets released once every branch handled it and the stages after the fan-out
+    asked for the next chapter, so none of them reads a released chapter, see :class:`ReleaseChapters`.
+    """
+
+    def __init__(self, *branches: Union[Pipeline, Sequence[Pipeline]], queue_size: int = 8, release: bool = False):
+        """
+        :param branches: The output stages of each branch. A sequence of stages gets chained like nested wraps.
+        :param queue_size: How many chapters a branch may fall behind.
+        :param release: Whether to release the chapters once every branch and the stages after the fan-out handled them.
+        """
+        super().__init__()
+        self._branches = [(branch,) if isinstance(branch, Pipeline) else tuple(branch) for branch in branches]
+        self._queue_size = queue_size
+        self._release = release
+        self._channels: List[_Channel] = []
+        self._failures: Dict[str, Exception] = {}
+        self._pending: Dict[Chapter, int] = {}
+        self._pending_lock = threading.Lock()
+
+    @property
+    def failures(self) -> Dict[str, Exception]:
+        """The exceptions of the branches that failed, by the names of their queues."""
+        return self._failures
+
+    @property
+    def queue_stats(self) -> List[QueueStats]:
+        """How full the queue of each branch is, and was at most."""
+        return [channel.stats for channel in self._channels]
+
+    def wrap(self, gen: Generator[Tuple[Book, Chapter], None, None]) -> Generator[Tuple[Book, Chapter], None, None]:
+        self._failures = {}
+        self._channels = channels = [
+            _Channel(f"{i}: {' -> '.join(stage.__class__.__name__ for stage in stages)}", self._queue_size)
+            for i, stages in enumerate(self._branches)
+        ]
+        threads = [
+            threading.Thread(target=self._run_branch, args=(stages, channel), name=f"fan-out-{i}", daemon=True)
+            for i, (stages, channel) in enumerate(zip(self._branches, channels))
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for book, chapter in gen:
+                _ = chapter.blocks  # Compacts the content before the branches read it at the same time
+                if self._release:
+                    with self._pending_lock:
+                        self._pending[chapter] = len(channels) + 1  # The stages after the fan-out hold it as well
+                for channel in channels:
+                    if not channel.put((book, chapter)) and self._release:  # The branch failed
+                        self._handled(chapter)
+                yield book, chapter
+                if self._release:
+                    self._handled(chapter)
+        finally:
+            for channel in channels:
+                channel.put(_END)
+            for thread in threads:
+                thread.join()
+            # Chapters that were queued for failed branches or the consumer stopped at
+            for chapter in self._pending:
+                chapter.release()
+            self._pending = {}
+
+    def _handled(self, chapter: Chapter):
+        """Counts a branch or the consumer that handled a chapter and releases the chapter after the last one."""
+        with self._pending_lock:
+            pending = self._pending[chapter] - 1
+            if pending > 0:
+                self._pending[chapter] = pending
+                return
+            del self._pending[chapter]
+        chapter.release()
+
+    def _run_branch(self, stages: Tuple[Pipeline, ...], channel: _Channel):
+        gen = channel.drain()
+        for stage in stages:
+            gen = stage.wrap(gen)
+        try:
+            for _, chapter in gen:
+                if self._release:
+                    self._handled(chapter)
+        except Exception as e:
+            self.log.exception(f"Branch {channel.name} failed. The other branches go on.")
+            self._failures[channel.name] = e
+        finally:
+            gen.close()
+            channel.close()
+
+
 class HtmlCleaner(Pipeline):
+    def __init__(self, chapter_store: ChapterStore = None, rules: CleaningRules = None):
+        """
+        :param chapter_store: The store to keep the cleaned chapters in, so they don't have to be cleaned again.
+        :param rules: The rules to clean the chapters with. Defaults to the `CLEANING_RULES` of their site.
+        """
+        super().__init__()
+        self._chapter_store = chapter_store
+        self._cleaners = {}
+        self._rules = rules
+
     def wrap(self, gen: Generator[Tuple[Book, Chapter], None, None]) -> Generator[Tuple[Book, Chapter], None, None]:
         for book, chapter in gen:
-            chapter.clean_content()
-            self.log.debug(f"Cleaned content of {chapter}")
+            if chapter.cleaned:
+                self.log.debug(f"Content of {chapter} is already clean")
+            else:
+                chapter.clean_content(self._cleaner(chapter))
+                self.log.debug(f"Cleaned content of {chapter}")
+                if self._chapter_store is not None:
+                    self._chapter_store.put(chapter.to_record())
             yield book, chapter
 
+    def _cleaner(self, chapter: Chapter) -> Optional[ContentCleaner]:
+        """The cleaner for the site of a chapter, shared by all its chapters."""
+        rules = self._rules if self._rules is not None else chapter.CLEANING_RULES
+        if rules is None:
+            return None
+        cleaner = self._cleaners.get(rules)
+        if cleaner is None:
+            cleaner = self._cleaners[rules] = ContentCleaner(rules)
+        return cleaner
+
+
+_TITLE_TOKEN_PATTERN = re.compile(r'[\w\d]+')
+
 
 class ChapterConflation(Pipeline):
-    def __init__(self, novel: Novel):
+    """
+    Conflates chapters that got published in parts with the same title into one chapter per title and numbers the
+    chapters of every book anew.
+
+    Chapters stream through: only the chapter the following parts get conflated into is held back. With a `window`,
+    it gets passed on after at most that many parts, and further parts with the same title start a new chapter.
+    The title tokens of every chapter get extracted once.
+
+    A conflated chapter ends where its last part does: it takes over the url, absolute index and next chapter link
+    of that part, so progress and checkpoints recorded after it continue behind the last part.
+    """
+
+    def __init__(self, novel: Novel, window: int = None):
+        """
+        :param novel: The novel the chapters belong to.
+        :param window: The maximum number of parts that get conflated into one chapter. Unlimited by default.
+        """
         super().__init__()
         self.novel = novel
+        self.window = window
 
     def wrap(self, gen: Generator[Tuple[Book, Chapter], None, None]) -> Generator[Tuple[Book, Chapter], None, None]:
         last_book = None
         last_chap = None
+        last_tokens = ()
+        parts = 0
+        index = 0
         for book, chapter in gen:
-            if book != last_book:  # New book. First chapter. Can't conflate chapters across books.
-                if last_book is not None:  # First chapter of at least second book. Yield cached one and cache new one.
-                    yield last_book, last_chap
-                last_book = book
-                last_chap = chapter
-                last_chap._index = 1
-                continue
-
-            if self.can_be_conflated(last_chap, chapter):
-                self.log.debug(f"Conflating chapter '{last_chap.title}' with '{chapter.title}'")
-                self.conflate(last_chap, chapter)
-            else:  # Different chapter. Yield cached one and cache new one.
-                self.log.debug(f"Cannot conflate the old chapter ({last_chap}) with chapter {chapter}")
-                yield book, last_chap
-                last_chap = chapter
-                last_chap.index += 1
-        self.log.debug("Source generator finished. Yielding last chapter")
-        yield last_book, last_chap
+            tokens = self.title_tokens(chapter)
+            # Chapters of different books never get conflated
+            if book == last_book and self.tokens_match(last_tokens, tokens):
+                if self.window is None or parts < self.window:
+                    self.log.debug(f"Conflating chapter '{last_chap.title}' with '{chapter.title}'")
+                    self.conflate(last_chap, chapter)
+                    parts += 1
+                    continue
+                self.log.warning(f"Chapter '{last_chap.title}' reached {self.window} parts. "
+                                 f"Starting a new chapter with '{chapter.title}'")
+            if last_chap is not None:
+                self.log.debug(f"Cannot conflate chapter '{last_chap.title}' with '{chapter.title}'")
+                yield last_book, last_chap
+            if book != last_book:
+                index = 0
+            index += 1
+            last_book, last_chap, last_tokens, parts = book, chapter, tokens, 1
+            last_chap.index = index
+        if last_chap is not None:
+            self.log.debug("Source generator finished. Yielding last chapter")
+            yield last_book, last_chap
+
+    @staticmethod
+    def title_tokens(chapter: Chapter) -> Tuple[str, ...]:
+        """The words and numbers of the clean title of a chapter, to compare it with the titles of other chapters."""
+        return tuple(_TITLE_TOKEN_PATTERN.findall(chapter.extract_clean_title()))
+
+    @staticmethod
+    def tokens_match(owns: Tuple[str, ...], others: Tuple[str, ...]) -> bool:
+        """Whether the tokens of two titles are the same, up to the length of the shorter one."""
+        length = min(len(owns), len(others))
+        return owns[:length] == others[:length]
 
     @staticmethod
     def can_be_conflated(first: Chapter, second: Chapter) -> bool:
-        pattern = re.compile(r'[\w\d]+')
-        owns = pattern.findall(first.extract_clean_title())
-        others = pattern.findall(second.extract_clean_title())
-        for own, other in zip(owns, others):
-            if own != other:
-                return False
-        return True
+        return ChapterConflation.tokens_match(ChapterConflation.title_tokens(first),
+                                              ChapterConflation.title_tokens(second))
 
     @staticmethod
     def conflate(first: Chapter, second: Chapter):
-        first._next_chapter_path = second.next_chapter.path
-        first.content.append(second.content)
+        first._url = second._url
+        first.abs_index = second.abs_index
+        first._next_chapter_path = second._next_chapter_path
+        first.blocks.extend(second.blocks)
         # Delete the second chapter from the list of chapters from the book
         DeleteChapters.delete_chapter(second)
 
 
 class Output(Pipeline, ABC):
+    """
+    Writes the chapters to a file or folder of a format.
+
+    Outputs with `can_checkpoint` can save checkpoints while they are wrapping chapters, so a later run can resume
+    writing from the last one, see :class:`Checkpointer`.
+    """
+    can_checkpoint: bool = False
 
     def __init__(self, novel: Novel, ext: str, out_path: str = 'out'):
         super(Output, self).__init__()
@@ -114,26 +538,45 @@ class Output(Pipeline, ABC):
         self.filename = f"{self.slug_title}.{self.ext}"
         self.path = os.path.join(out_path, self.novel.url.hostname)
         make_sure_dir_exists(self.path)
+        self._resume_state = None
 
     def join_to_path(self, *paths: str) -> str:
         return os.path.join(self.path, *paths)
 
+    def resume(self, state: Dict[str, Any]):
+        """
+        Makes the next run continue the output from a checkpoint instead of writing it anew.
+        :param state: The state returned by :meth:`checkpoint` during an earlier run.
+        """
+        self._resume_state = state
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """
+        Makes sure the chapters written so far are on disk. Only possible while chapters are being wrapped.
+        :return: The state to resume the output from, serializable to JSON.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} can't save checkpoints")
+
+    def _take_resume_state(self) -> Optional[Dict[str, Any]]:
+        state, self._resume_state = self._resume_state, None
+        return state
+
 
 class EpubMaker(Output):  # TODO: Add an Epub maker that splits by book
-    ALLOWED_TAGS = [
-        'a', 'abbr', 'acronym', 'applet', 'b', 'bdo', 'big', 'br', 'cite', 'code', 'del', 'dfn', 'em', 'i', 'iframe',
-        'img', 'ins', 'kbd', 'map', 'noscript', 'ns:svg', 'object', 'q', 'samp', 'script', 'small', 'span', 'strong',
-        'sub', 'sup', 'tt', 'var',
-        # Added:
-        'p', 'div', 'hr'
-    ]
+    ALLOWED_TAGS = sorted(EPUB_TAGS)
+    can_checkpoint = True
 
     def __init__(self, novel: Novel, out_path: str = 'out'):
         super().__init__(novel, 'epub', out_path)
+        self._epub: Optional[EpubFile] = None
+
+    def checkpoint(self) -> Dict[str, Any]:
+        return self._epub.checkpoint()
 
     def wrap(self, gen: Generator[Tuple[Book, Chapter], None, None]) -> Generator[Tuple[Book, Chapter], None, None]:
         unique_id = slugify(self.novel.title)
         filepath = self.join_to_path(self.filename)
+        resume_state = self._take_resume_state()
         with EpubFile(
                 file=filepath,
                 unique_id=unique_id,
@@ -147,20 +590,186 @@ class EpubMaker(Output):  # TODO: Add an Epub maker that splits by book
                 description=self.novel.description.text,
                 creator=self.novel.author if self.novel.author else self.novel.translator if self.novel.translator else '',
                 cover_image=self.novel.cover,
-                mode='w') as epub:
-            self.log.debug(f"Opened file '{filepath}'")
+                mode='w',
+                resume=resume_state) as epub:
+            self.log.debug(f"{'Resumed' if resume_state else 'Opened'} file '{filepath}'")
+            self._epub = epub
             last_book = None
+            try:
+                for book, chapter in gen:
+                    if book != last_book:  # New book
+                        last_book = book
+                        book = chapter.book
+                        book_file = BookFile(book)
+                        if not epub.has_book(book_file):  # The book got written before the run got resumed
+                            epub.add_book(book_file)
+                            self.log.debug(f"Saved book {book} to ({book_file.unique_id}): {book_file.filepath}")
+                    chapter_file = ChapterFile(chapter)
+                    epub.add_chapter(book_file, chapter_file)
+                    chapter.add_output_path(os.path.join(filepath, chapter_file.filepath))
+                    self.log.debug(f"Saved chapter {chapter} to ({chapter_file.unique_id}): {chapter_file.filepath}")
+                    yield book, chapter
+            finally:
+                self._epub = None
+
+
+class MarkdownMaker(Output):
+    """Writes the novel into a single Markdown file, chapter by chapter."""
+    can_checkpoint = True
+
+    def __init__(self, novel: Novel, out_path: str = 'out'):
+        super().__init__(novel, 'md', out_path)
+        self.sink = MarkdownHtmlSink()
+        self._fp = None
+        self._book_title: Optional[str] = None
+
+    def checkpoint(self) -> Dict[str, Any]:
+        self._fp.flush()
+        return {'size': self._fp.tell(), 'book': self._book_title}
+
+    def wrap(self, gen: Generator[Tuple[Book, Chapter], None, None]) -> Generator[Tuple[Book, Chapter], None, None]:
+        filepath = self.join_to_path(self.filename)
+        resume_state = self._take_resume_state()
+        with _open_to_resume(filepath, resume_state) as fp:
+            self._fp = fp
+            if resume_state is None:
+                self.log.debug(f"Opened file '{filepath}'")
+                fp.write(f"# {self.novel.title}\n\n")
+                if self.novel.description is not None:
+                    fp.write(f"{self.novel.description.text.strip()}\n\n")
+                self._book_title = None
+            else:
+                self.log.debug(f"Resumed file '{filepath}'")
+                self._book_title = resume_state['book']
+            try:
+                for book, chapter in gen:
+                    if book.title != self._book_title:
+                        self._book_title = book.title
+                        fp.write(f"## {book.title}\n\n")
+                    fp.write(f"### {chapter.extract_clean_title()}\n\n{self.sink.render(chapter.blocks)}\n\n")
+                    chapter.add_output_path(filepath)
+                    self.log.debug(f"Saved chapter {chapter} to {filepath}")
+                    yield book, chapter
+            finally:
+                self._fp = None
+
+
+class LatexMaker(Output):
+    """
+    Writes the novel into a folder of LaTeX files: one per chapter and a document including them,
+    which gets written once the chapters ran out.
+    """
+    STRUCTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'structure.tex')
+    can_checkpoint = True
+
+    def __init__(self, novel: Novel, out_path: str = 'out'):
+        super().__init__(novel, 'tex', out_path)
+        self.sink = LatexHtmlSink()
+        self._filenames: Optional[List[str]] = None
+
+    def checkpoint(self) -> Dict[str, Any]:
+        # Every chapter file gets closed once it is written
+        return {'filenames': list(self._filenames)}
+
+    def wrap(self, gen: Generator[Tuple[Book, Chapter], None, None]) -> Generator[Tuple[Book, Chapter], None, None]:
+        folder = self.join_to_path(self.slug_title)
+        make_sure_dir_exists(folder)
+        resume_state = self._take_resume_state()
+        filenames = self._filenames = list(resume_state['filenames']) if resume_state else []
+        try:
             for book, chapter in gen:
-                if book != last_book:  # New book
-                    last_book = book
-                    book = chapter.book
-                    book_file = BookFile(book)
-                    epub.add_book(book_file)
-                    self.log.debug(f"Saved book {book} to ({book_file.unique_id}): {book_file.filepath}")
-                chapter_file = ChapterFile(chapter)
-                epub.add_chapter(book_file, chapter_file)
-                self.log.debug(f"Saved chapter {chapter} to ({chapter_file.unique_id}): {chapter_file.filepath}")
+                filename = f"{len(filenames) + 1}_{slugify(chapter.title)}"
+                filepath = os.path.join(folder, f"{filename}.tex")
+                with open(filepath, 'w', encoding='utf-8') as fp:
+                    fp.write(f"\\chapter{{{chapter.title}}}\n{self.sink.render(chapter.blocks)}")
+                filenames.append(filename)
+                chapter.add_output_path(filepath)
+                self.log.debug(f"Saved chapter {chapter} to {filename}.tex")
                 yield book, chapter
+        finally:
+            with open(os.path.join(folder, self.filename), 'w', encoding='utf-8') as fp:
+                fp.write(self.document(self.novel, filenames, self.sink))
+            shutil.copyfile(self.STRUCTURE, os.path.join(folder, 'structure.tex'))
+            self.log.debug(f"Saved document {self.filename} with {len(filenames)} chapters")
+            self._filenames = None
+
+    @staticmethod
+    def document(novel: Novel, filenames: List[str], sink: LatexHtmlSink) -> str:
+        """The LaTeX document of a novel, including the files of its chapters."""
+        includes = ''.join(f"\\include{{{filename}}}\n" for filename in filenames)
+        # noinspection SpellCheckingInspection
+        return f"""\\documentclass[oneside,11pt]{{memoir}}
+\\usepackage[normalem]{{ulem}}
+\\usepackage{{fontspec}}
+\\input{{structure.tex}}
+\\title{{{novel.title}}}
+\\author{{{novel.translator}}}
+\\newcommand{{\\edition}}{{}}
+\\makeatletter\\@addtoreset{{chapter}}{{part}}\\makeatother%
+\\begin{{document}}
+\\thispagestyle{{empty}}
+%\\ThisCenterWallPaper{{1.12}}{{cover.jpg}}
+\\begin{{tikzpicture}}[remember picture,overlay]
+\\node[rectangle, rounded corners, fill=white, opacity=0.75, anchor=south west, minimum width=4cm, minimum height=3cm] (box) at (-0.5,-10) (box){{}};
+\\node[anchor=west, color01, xshift=-2cm, yshift=-0.8cm, text width=3.9cm, font=\\sffamily\\bfseries\\scshape\\Large] at (box.north){{\\thetitle}};
+\\node[anchor=west, color01, xshift=-2cm, yshift=-1.8cm, text width=3.9cm, font=\\sffamily\\scriptsize] at (box.north){{\\edition}};
+\\node[anchor=west, color01, xshift=-2cm, yshift=-2.5cm, text width=3.9cm, font=\\sffamily\\bfseries] at (box.north){{\\theauthor}};
+\\end{{tikzpicture}}
+\\newpage
+
+\\tableofcontents
+
+\\chapter*{{Synopsis}}
+{sink.parse(novel.description)}
+\\newpage
+{includes}\\end{{document}}"""
+
+
+class JsonLinesMaker(Output):
+    """Writes every chapter as a line of JSON, i.e. to index or process the novel with other tools."""
+    can_checkpoint = True
+
+    def __init__(self, novel: Novel, out_path: str = 'out'):
+        super().__init__(novel, 'jsonl', out_path)
+        self._fp = None
+
+    def checkpoint(self) -> Dict[str, Any]:
+        self._fp.flush()
+        return {'size': self._fp.tell()}
+
+    def wrap(self, gen: Generator[Tuple[Book, Chapter], None, None]) -> Generator[Tuple[Book, Chapter], None, None]:
+        filepath = self.join_to_path(self.filename)
+        resume_state = self._take_resume_state()
+        with _open_to_resume(filepath, resume_state) as fp:
+            self.log.debug(f"{'Resumed' if resume_state else 'Opened'} file '{filepath}'")
+            self._fp = fp
+            try:
+                for book, chapter in gen:
+                    fp.write(json.dumps({
+                        'novel': str(self.novel.url),
+                        'book': book.title,
+                        'index': chapter.index,
+                        'abs_index': chapter.abs_index,
+                        'url': str(chapter.url),
+                        'title': chapter.title,
+                        'translator': chapter.translator,
+                        'html': chapter.content_html,
+                    }, ensure_ascii=False))
+                    fp.write('\n')
+                    chapter.add_output_path(filepath)
+                    yield book, chapter
+            finally:
+                self._fp = None
+
+
+def _open_to_resume(filepath: str, state: Optional[Dict[str, Any]]):
+    """Opens a text file to write anew, or to append to after cutting off everything written after a checkpoint."""
+    if state is None:
+        return open(filepath, 'w', encoding='utf-8')
+    fp = open(filepath, 'r+', encoding='utf-8')
+    fp.seek(state['size'])
+    fp.truncate()
+    return fp
 
 
 class DeleteChapters(Pipeline):
@@ -173,4 +782,115 @@ class DeleteChapters(Pipeline):
     @staticmethod
     def delete_chapter(chapter: Chapter):
         chapter.book.chapters.remove(chapter)
-        del chapter
+
+
+class ReleaseChapters(Pipeline):
+    """
+    Releases every chapter once the outputs before it wrote it, so a run holds only the chapters in flight
+    instead of a whole novel: the content gets dropped and the book only keeps a summary of the chapter.
+    Stages after it can still record the progress, as the chapters keep their urls, indices and links.
+    Behind a :class:`FanOut`, its branches may still be writing a chapter, so let the fan-out release them instead.
+    """
+
+    def wrap(self, gen: Generator[Tuple[Book, Chapter], None, None]) -> Generator[Tuple[Book, Chapter], None, None]:
+        for book, chapter in gen:
+            chapter.release()
+            self.log.debug(f"Released chapter {chapter}")
+            yield book, chapter
+
+
+class ProgressTracker(Pipeline):
+    """Records the last chapter that made it through the pipeline, so a later run can continue after it."""
+
+    def __init__(self, novel: Novel, progress_store: ProgressStore):
+        """
+        :param novel: The novel the chapters belong to.
+        :param progress_store: The store to record the progress in.
+        """
+        super().__init__()
+        self._novel = novel
+        self._progress_store = progress_store
+
+    def wrap(self, gen: Generator[Tuple[Book, Chapter], None, None]) -> Generator[Tuple[Book, Chapter], None, None]:
+        for book, chapter in gen:
+            next_chapter = chapter.next_chapter
+            self._progress_store.put(
+                str(self._novel.url),
+                book.number,
+                chapter.index,
+                chapter.abs_index,
+                str(chapter.url),
+                next_chapter.path if next_chapter else None
+            )
+            self.log.debug(f"Recorded progress at {chapter}")
+            yield book, chapter
+
+
+class Checkpointer(Pipeline):
+    """
+    Saves a checkpoint every few chapters that made it through the pipeline: the last chapter and the state of the
+    outputs at that chapter. If a run dies, the next one can resume the outputs from the last checkpoint and continue
+    fetching after its chapter, instead of starting over.
+
+    The outputs have to wrap the chapters before the checkpointer and on the same thread, i.e. not within a
+    :class:`PipelineExecutor` or :class:`FanOut`, so they wrote exactly the chapters the checkpointer has seen.
+    The checkpoint gets deleted once the chapters ran out.
+    """
+
+    def __init__(self, novel: Novel, checkpoint_store: CheckpointStore, outputs: Sequence[Output], interval: int = 50):
+        """
+        :param novel: The novel the chapters belong to.
+        :param checkpoint_store: The store to save the checkpoints in.
+        :param outputs: The outputs to save the states of. All of them have to support checkpoints.
+        :param interval: The number of chapters between two checkpoints.
+        :raises Exception: If one of the outputs can't save checkpoints.
+        """
+        super().__init__()
+        for output in outputs:
+            if not output.can_checkpoint:
+                raise Exception(f"{output.__class__.__name__} can't save checkpoints")
+        self._novel = novel
+        self._checkpoint_store = checkpoint_store
+        self._outputs = list(outputs)
+        self._interval = interval
+
+    def resume(self) -> Optional[StoredProgress]:
+        """
+        Resumes the outputs from the last checkpoint, if there is one.
+        :return: The progress to continue fetching chapters after, i.e. the `since` of
+            :meth:`LightNovelApi.get_all_chapters`, or None to start over.
+        """
+        checkpoint = self._checkpoint_store.get(str(self._novel.url))
+        if checkpoint is None:
+            return None
+        for output in self._outputs:
+            state = checkpoint.states.get(output.filename)
+            if state is None:
+                raise Exception(f"The checkpoint of {self._novel.url} has no state of {output.filename}")
+            output.resume(state)
+        self.log.info(f"Resuming after chapter {checkpoint.progress.abs_index}: {checkpoint.progress.chapter_url}")
+        return checkpoint.progress
+
+    def wrap(self, gen: Generator[Tuple[Book, Chapter], None, None]) -> Generator[Tuple[Book, Chapter], None, None]:
+        count = 0
+        for book, chapter in gen:
+            count += 1
+            if count % self._interval == 0:
+                self.save(book, chapter)
+            yield book, chapter
+        self._checkpoint_store.delete(str(self._novel.url))
+        self.log.debug("Finished the run, deleted its checkpoint")
+
+    def save(self, book: Book, chapter: Chapter):
+        """Saves a checkpoint at the last chapter the outputs wrote."""
+        next_chapter = chapter.next_chapter
+        self._checkpoint_store.put(
+            str(self._novel.url),
+            book.number,
+            chapter.index,
+            chapter.abs_index,
+            str(chapter.url),
+            next_chapter.path if next_chapter else None,
+            {output.filename: output.checkpoint() for output in self._outputs}
+        )
+        self.log.debug(f"Saved checkpoint at {chapter}")
@@ -0,0 +1,232 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from enum import Enum
+from typing import Callable, Dict, Generator, List, Optional, Tuple
+
+from urllib3.util import parse_url
+
+from api import LightNovelApi, Novel, Book, Chapter
+from pipeline import Parser
+from webot import Firefox
+
+ChapterGenerator = Generator[Tuple[Book, Chapter], None, None]
+
+
+class CrawlState(Enum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    SKIPPED = 'skipped'
+
+
+class CrawlJob:
+    """The crawl of a single novel: its download generator wrapped in the pipeline stages."""
+    url: str
+    hostname: str
+    priority: int
+    api: LightNovelApi
+    novel: Optional[Novel]
+    state: CrawlState
+    chapters: int
+    error: Optional[BaseException]
+    started: Optional[float]
+    finished: Optional[float]
+    _gen: Optional[ChapterGenerator]
+
+    def __init__(self, url: str, api: LightNovelApi, priority: int = 0):
+        self.url = url
+        self.hostname = parse_url(url).host
+        self.priority = priority
+        self.api = api
+        self.novel = None
+        self.state = CrawlState.QUEUED
+        self.chapters = 0
+        self.error = None
+        self.started = None
+        self.finished = None
+        self._gen = None
+
+    @property
+    def title(self) -> str:
+        return self.novel.title if self.novel is not None and self.novel.title else self.url
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished if self.finished is not None else time.time()) - self.started
+
+    def __str__(self):
+        return f"{self.title}: {self.state.value}, {self.chapters} chapters in {self.elapsed:.1f}s"
+
+
+class CrawlScheduler:
+    """
+    Crawls several novels at the same time.
+
+    Every novel is downloaded with :meth:`LightNovelApi.get_entire_novel` and wrapped in its own pipeline.
+    Novels whose page couldn't be parsed get skipped.
+    Worker threads advance the pipelines one chapter at a time, taking the novel with the highest priority
+    that waited the longest, so a huge novel doesn't hold up the others. At most `per_host` novels of the same
+    host are advanced at once; the requests themselves stay throttled by the rate limiter of the apis.
+    """
+    _jobs: List[CrawlJob]
+    _queue: List[Tuple[int, int, CrawlJob]]
+    _active: Dict[str, int]
+
+    def __init__(
+            self,
+            pipeline: Callable[[LightNovelApi, Novel, ChapterGenerator], ChapterGenerator] = None,
+            api_factory: Callable[[str], LightNovelApi] = None,
+            workers: int = 4,
+            per_host: int = 2,
+            prefetch: int = 0,
+            on_progress: Callable[[CrawlJob], None] = None):
+        """
+        Creates a new scheduler.
+        :param pipeline: Wraps the chapter generator of a novel in pipeline stages. Defaults to a :class:`Parser`.
+        :param api_factory: Creates the api for a novel url. Defaults to :meth:`LightNovelApi.get_api`.
+        :param workers: How many novels get advanced at the same time.
+        :param per_host: How many novels of the same host get advanced at the same time.
+        :param prefetch: The prefetch window passed to :meth:`LightNovelApi.get_entire_novel`.
+        :param on_progress: Gets called with the job after every processed chapter and when a job ends.
+        """
+        self.log = logging.getLogger(self.__class__.__name__)
+        self._pipeline = pipeline if pipeline is not None else lambda api, novel, gen: Parser(api.browser).wrap(gen)
+        self._api_factory = api_factory if api_factory is not None else lambda url: LightNovelApi.get_api(url, Firefox())
+        self.workers = workers
+        self.per_host = per_host
+        self.prefetch = prefetch
+        self._on_progress = on_progress
+        self._condition = threading.Condition()
+        self._jobs = []
+        self._queue = []
+        self._active = {}
+        self._running = 0
+        self._counter = itertools.count()
+
+    @property
+    def jobs(self) -> List[CrawlJob]:
+        with self._condition:
+            return list(self._jobs)
+
+    def add(self, url: str, priority: int = 0) -> CrawlJob:
+        """
+        Adds a novel to crawl.
+        :param url: The url of the novel.
+        :param priority: Novels with a higher priority get advanced first, e.g. recently updated ones.
+        :return: The job of the novel.
+        """
+        job = CrawlJob(url, self._api_factory(url), priority)
+        with self._condition:
+            self._jobs.append(job)
+            self._push(job)
+            self._condition.notify()
+        return job
+
+    def _push(self, job: CrawlJob):
+        heapq.heappush(self._queue, (-job.priority, next(self._counter), job))
+
+    def _take(self) -> Optional[CrawlJob]:
+        """Waits for the next job that may be advanced. Returns None once all jobs are finished."""
+        with self._condition:
+            while True:
+                skipped = []
+                job = None
+                while self._queue:
+                    entry = heapq.heappop(self._queue)
+                    if self._active.get(entry[2].hostname, 0) < self.per_host:
+                        job = entry[2]
+                        break
+                    skipped.append(entry)
+                for entry in skipped:
+                    heapq.heappush(self._queue, entry)
+                if job is not None:
+                    self._active[job.hostname] = self._active.get(job.hostname, 0) + 1
+                    self._running += 1
+                    return job
+                if self._running == 0:
+                    return None
+                self._condition.wait()
+
+    def _release(self, job: CrawlJob):
+        with self._condition:
+            self._active[job.hostname] -= 1
+            self._running -= 1
+            if job.state == CrawlState.RUNNING:
+                self._push(job)
+            self._condition.notify_all()
+
+    def _step(self, job: CrawlJob):
+        """Advances the pipeline of a job by one chapter, starting it if necessary."""
+        if job._gen is None:
+            job.state = CrawlState.RUNNING
+            job.started = time.time()
+            novel, gen = job.api.get_entire_novel(parse_url(job.url), prefetch=self.prefetch)
+            job.novel = novel
+            if not novel.success:
+                self.log.error(f"Failed getting novel {job.url}")
+                job.state = CrawlState.SKIPPED
+                job.finished = time.time()
+                gen.close()
+                self._report(job)
+                return
+            job._gen = self._pipeline(job.api, novel, gen)
+            self.log.info(f"Started crawling {job.title}")
+            return
+        try:
+            next(job._gen)
+        except StopIteration:
+            job.state = CrawlState.DONE
+            job.finished = time.time()
+            job._gen = None
+            self.log.info(f"Finished {job}")
+            self._report(job)
+            return
+        job.chapters += 1
+        self._report(job)
+
+    def _report(self, job: CrawlJob):
+        if self._on_progress is not None:
+            self._on_progress(job)
+
+    def _work(self):
+        while True:
+            job = self._take()
+            if job is None:
+                return
+            try:
+                self._step(job)
+            except Exception as e:
+                self.log.exception(f"Crawling {job.url} failed")
+                job.state = CrawlState.FAILED
+                job.error = e
+                job.finished = time.time()
+                if job._gen is not None:
+                    job._gen.close()
+                    job._gen = None
+                self._report(job)
+            finally:
+                self._release(job)
+
+    def run(self) -> List[CrawlJob]:
+        """
+        Crawls all added novels and blocks until every one of them is done or failed.
+        :return: The jobs of the novels.
+        """
+        threads = [
+            threading.Thread(target=self._work, name=f"crawl-{i}", daemon=True) for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.jobs
+
+    def progress(self) -> Dict[str, str]:
+        """The state of every novel, keyed by its url."""
+        return {job.url: str(job) for job in self.jobs}
@@ -0,0 +1,286 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC
+from typing import Optional, NamedTuple, Any, List, Tuple, Dict
+
+from util import make_sure_dir_exists
+
+
+class SqliteStore(ABC):
+    """A store backed by an SQLite database, which can be shared between threads."""
+    SCHEMA = ''
+    path: str
+
+    def __init__(self, path: str = ':memory:'):
+        """
+        Opens the store and creates its tables if necessary.
+        :param path: The path to the database file. Defaults to an in-memory database.
+        """
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.path = path
+        if path != ':memory:' and os.path.dirname(path) != '':
+            make_sure_dir_exists(os.path.dirname(path))
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._connection.executescript(self.SCHEMA)
+            self._connection.commit()
+
+    def _execute(self, sql: str, parameters: Tuple = ()) -> List[Tuple[Any, ...]]:
+        with self._lock:
+            cursor = self._connection.execute(sql, parameters)
+            rows = cursor.fetchall()
+            self._connection.commit()
+            return rows
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exit_type, value, traceback):
+        self.close()
+
+
+class StoredPage(NamedTuple):
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    body: str
+    fetched: float
+
+
+class PageStore(SqliteStore):
+    """Keeps the body of html pages together with their validators (ETag, Last-Modified) for conditional requests."""
+    SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    body TEXT NOT NULL,
+    fetched REAL NOT NULL
+);'''
+
+    def get(self, url: str) -> Optional[StoredPage]:
+        rows = self._execute('SELECT url, etag, last_modified, body, fetched FROM pages WHERE url = ?', (url,))
+        return StoredPage(*rows[0]) if rows else None
+
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str], body: str):
+        self._execute(
+            'INSERT OR REPLACE INTO pages (url, etag, last_modified, body, fetched) VALUES (?, ?, ?, ?, ?)',
+            (url, etag, last_modified, body, time.time())
+        )
+
+    def touch(self, url: str):
+        """Marks a stored page as freshly validated."""
+        self._execute('UPDATE pages SET fetched = ? WHERE url = ?', (time.time(), url))
+
+    def delete(self, url: str):
+        self._execute('DELETE FROM pages WHERE url = ?', (url,))
+
+    def __contains__(self, url: str) -> bool:
+        return len(self._execute('SELECT 1 FROM pages WHERE url = ?', (url,))) > 0
+
+    def __len__(self) -> int:
+        return self._execute('SELECT COUNT(*) FROM pages')[0][0]
+
+
+class ChapterRecord(NamedTuple):
+    url: str
+    digest: str
+    title: str
+    translator: str
+    previous_path: Optional[str]
+    next_path: Optional[str]
+    cleaned: bool
+    content: str
+    extra: Dict[str, Any]
+
+
+class ChapterStore(SqliteStore):
+    """
+    Keeps the parsed result of complete chapters, keyed by their url and a hash of their page.
+
+    As long as the page of a chapter doesn't change, the chapter can be restored from the store
+    without building a document of the page and parsing it again.
+    """
+    SCHEMA = '''
+CREATE TABLE IF NOT EXISTS chapters (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    title TEXT NOT NULL,
+    translator TEXT NOT NULL,
+    previous_path TEXT,
+    next_path TEXT,
+    cleaned INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    extra TEXT NOT NULL
+);'''
+
+    @staticmethod
+    def digest(html: str) -> str:
+        """
+        Hashes the html of a chapter page.
+        :param html: The html of the page.
+        :return: The hex digest identifying this version of the page.
+        """
+        return hashlib.sha1(html.encode('utf-8')).hexdigest()
+
+    def get(self, url: str, digest: str) -> Optional[ChapterRecord]:
+        """
+        Looks up the parsed result of a chapter.
+        :param url: The url of the chapter.
+        :param digest: The digest of the current page of the chapter.
+        :return: The stored chapter or None if the chapter isn't stored or its page changed since.
+        """
+        rows = self._execute(
+            'SELECT url, digest, title, translator, previous_path, next_path, cleaned, content, extra '
+            'FROM chapters WHERE url = ? AND digest = ?', (url, digest)
+        )
+        if not rows:
+            return None
+        row = rows[0]
+        return ChapterRecord(*row[:6], bool(row[6]), row[7], json.loads(row[8]))
+
+    def put(self, record: ChapterRecord):
+        """Stores the parsed result of a chapter and replaces older versions of it."""
+        self._execute(
+            'INSERT OR REPLACE INTO chapters '
+            '(url, digest, title, translator, previous_path, next_path, cleaned, content, extra) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (*record[:6], int(record.cleaned), record.content, json.dumps(record.extra))
+        )
+
+    def delete(self, url: str):
+        self._execute('DELETE FROM chapters WHERE url = ?', (url,))
+
+    def __contains__(self, url: str) -> bool:
+        return len(self._execute('SELECT 1 FROM chapters WHERE url = ?', (url,))) > 0
+
+    def __len__(self) -> int:
+        return self._execute('SELECT COUNT(*) FROM chapters')[0][0]
+
+
+class StoredProgress(NamedTuple):
+    novel_url: str
+    book_index: int
+    chapter_index: int
+    abs_index: int
+    chapter_url: str
+    next_path: Optional[str]
+    updated: float
+
+
+class ProgressStore(SqliteStore):
+    """Keeps the last successfully processed chapter of every novel, so later runs can continue after it."""
+    SCHEMA = '''
+CREATE TABLE IF NOT EXISTS progress (
+    novel_url TEXT PRIMARY KEY,
+    book_index INTEGER NOT NULL,
+    chapter_index INTEGER NOT NULL,
+    abs_index INTEGER NOT NULL,
+    chapter_url TEXT NOT NULL,
+    next_path TEXT,
+    updated REAL NOT NULL
+);'''
+
+    def get(self, novel_url: str) -> Optional[StoredProgress]:
+        rows = self._execute(
+            'SELECT novel_url, book_index, chapter_index, abs_index, chapter_url, next_path, updated '
+            'FROM progress WHERE novel_url = ?', (novel_url,)
+        )
+        return StoredProgress(*rows[0]) if rows else None
+
+    def put(self, novel_url: str, book_index: int, chapter_index: int, abs_index: int, chapter_url: str,
+            next_path: Optional[str]):
+        """
+        Records the last processed chapter of a novel.
+        :param novel_url: The url of the novel.
+        :param book_index: The number of the book the chapter belongs to, starting at 1.
+        :param chapter_index: The index of the chapter within its book.
+        :param abs_index: The index of the chapter across all books.
+        :param chapter_url: The url of the chapter.
+        :param next_path: The path of the next chapter link of the chapter, if it had one.
+        """
+        self._execute(
+            'INSERT OR REPLACE INTO progress '
+            '(novel_url, book_index, chapter_index, abs_index, chapter_url, next_path, updated) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (novel_url, book_index, chapter_index, abs_index, chapter_url, next_path, time.time())
+        )
+
+    def delete(self, novel_url: str):
+        self._execute('DELETE FROM progress WHERE novel_url = ?', (novel_url,))
+
+    def __contains__(self, novel_url: str) -> bool:
+        return len(self._execute('SELECT 1 FROM progress WHERE novel_url = ?', (novel_url,))) > 0
+
+    def __len__(self) -> int:
+        return self._execute('SELECT COUNT(*) FROM progress')[0][0]
+
+
+class StoredCheckpoint(NamedTuple):
+    progress: StoredProgress
+    states: Dict[str, Dict[str, Any]]
+
+
+class CheckpointStore(SqliteStore):
+    """
+    Keeps the last checkpoint of a run for every novel: the last chapter that made it through the pipeline and the
+    state of the outputs at that chapter, both saved at once. A run that died can resume from it.
+    """
+    SCHEMA = '''
+CREATE TABLE IF NOT EXISTS checkpoints (
+    novel_url TEXT PRIMARY KEY,
+    book_index INTEGER NOT NULL,
+    chapter_index INTEGER NOT NULL,
+    abs_index INTEGER NOT NULL,
+    chapter_url TEXT NOT NULL,
+    next_path TEXT,
+    updated REAL NOT NULL,
+    states TEXT NOT NULL
+);'''
+
+    def get(self, novel_url: str) -> Optional[StoredCheckpoint]:
+        rows = self._execute(
+            'SELECT novel_url, book_index, chapter_index, abs_index, chapter_url, next_path, updated, states '
+            'FROM checkpoints WHERE novel_url = ?', (novel_url,)
+        )
+        if not rows:
+            return None
+        return StoredCheckpoint(StoredProgress(*rows[0][:7]), json.loads(rows[0][7]))
+
+    def put(self, novel_url: str, book_index: int, chapter_index: int, abs_index: int, chapter_url: str,
+            next_path: Optional[str], states: Dict[str, Dict[str, Any]]):
+        """
+        Saves a checkpoint of a run and replaces the previous one.
+        :param novel_url: The url of the novel.
+        :param book_index: The number of the book of the last chapter, starting at 1.
+        :param chapter_index: The index of the last chapter within its book.
+        :param abs_index: The index of the last chapter across all books.
+        :param chapter_url: The url of the last chapter.
+        :param next_path: The path of the next chapter link of the last chapter, if it had one.
+        :param states: The states of the outputs, by their file names. They have to be serializable to JSON.
+        """
+        self._execute(
+            'INSERT OR REPLACE INTO checkpoints '
+            '(novel_url, book_index, chapter_index, abs_index, chapter_url, next_path, updated, states) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (novel_url, book_index, chapter_index, abs_index, chapter_url, next_path, time.time(), json.dumps(states))
+        )
+
+    def delete(self, novel_url: str):
+        self._execute('DELETE FROM checkpoints WHERE novel_url = ?', (novel_url,))
+
+    def __contains__(self, novel_url: str) -> bool:
+        return len(self._execute('SELECT 1 FROM checkpoints WHERE novel_url = ?', (novel_url,))) > 0
+
+    def __len__(self) -> int:
+        return self._execute('SELECT COUNT(*) FROM checkpoints')[0][0]
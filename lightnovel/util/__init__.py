@@ -1,3 +1,6 @@
+from .cache import TtlCache
 from .other import make_sure_dir_exists
 from .sink import HtmlSink, StringHtmlSink, MarkdownHtmlSink, LatexHtmlSink
 from .text import slugify, sanitize_for_html
+from .ratelimit import RateLimiter, TokenBucket
+from .adapter import ThreadSafeCacheAdapter
@@ -0,0 +1,144 @@
+import threading
+from typing import Dict, Optional
+
+from requests import Session, Response
+from requests.adapters import BaseAdapter
+from requests.models import PreparedRequest
+
+from webot.adapter import CacheAdapter
+
+BYPASS_CACHE_HEADER = 'X-Bypass-Cache'
+"""Requests with this header bypass the cache of a :class:`ThreadSafeCacheAdapter`. It never reaches the host."""
+
+
+class _ThreadAdapter:
+    """The copy of the cache adapter of a thread and the url of the last response it received."""
+    __slots__ = ('adapter', 'lock', 'last_url')
+
+    def __init__(self, adapter: CacheAdapter):
+        self.adapter = adapter
+        self.lock = threading.Lock()
+        self.last_url = None
+
+
+class ThreadSafeCacheAdapter(BaseAdapter):
+    """
+    Shares a :class:`CacheAdapter` between threads.
+
+    The cache adapter tells whether the last response came from the cache with its `hit` attribute and
+    can only delete the last response from the cache. Neither works if several threads send requests at once.
+    This adapter gives every thread its own copy of the cache adapter, which shares the cache with the original,
+    and marks every response with `from_cache`. Responses are only deleted from the cache while they are still
+    the last one the thread that requested them received.
+
+    Requests with the :data:`BYPASS_CACHE_HEADER` bypass the cache without affecting other requests.
+    """
+    _adapter: CacheAdapter
+    _threads: Dict[int, _ThreadAdapter]
+
+    def __init__(self, adapter: CacheAdapter):
+        """
+        Creates a new thread-safe cache adapter.
+        :param adapter: The cache adapter to share. The thread creating this adapter keeps using it directly.
+        """
+        super().__init__()
+        self._adapter = adapter
+        self._lock = threading.Lock()
+        self._threads = {threading.get_ident(): _ThreadAdapter(adapter)}
+
+    @classmethod
+    def mount(cls, session: Session) -> Optional['ThreadSafeCacheAdapter']:
+        """
+        Replaces the cache adapter mounted on a session with a thread-safe one, for every prefix it is mounted on.
+        :param session: The session to change.
+        :return: The thread-safe cache adapter of the session or None if it doesn't use a cache adapter.
+        """
+        adapter = session.get_adapter('https://')
+        if isinstance(adapter, cls):
+            return adapter
+        if not isinstance(adapter, CacheAdapter):
+            return None
+        wrapper = cls(adapter)
+        for prefix, mounted in list(session.adapters.items()):
+            if mounted is adapter:
+                session.adapters[prefix] = wrapper
+        return wrapper
+
+    @property
+    def cache_adapter(self) -> CacheAdapter:
+        """The shared cache adapter."""
+        return self._adapter
+
+    def _thread_adapter(self) -> _ThreadAdapter:
+        ident = threading.get_ident()
+        thread_adapter = self._threads.get(ident)
+        if thread_adapter is None:
+            # A shallow copy shares the cache and the connection pools, but has its own `hit` and last entry.
+            adapter = object.__new__(type(self._adapter))
+            adapter.__dict__.update(self._adapter.__dict__)
+            thread_adapter = _ThreadAdapter(adapter)
+            with self._lock:
+                self._threads[ident] = thread_adapter
+        return thread_adapter
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:
+        thread_adapter = self._thread_adapter()
+        adapter = thread_adapter.adapter
+        bypass = request.headers.pop(BYPASS_CACHE_HEADER, None)
+        with thread_adapter.lock:
+            use_cache = adapter.use_cache
+            if bypass is not None:
+                adapter.use_cache = False
+            try:
+                response = adapter.send(request, **kwargs)
+            finally:
+                adapter.use_cache = use_cache
+                if bypass is not None:
+                    # Redirects copy the request, so they bypass the cache as well.
+                    request.headers[BYPASS_CACHE_HEADER] = bypass
+            response.from_cache = bypass is None and bool(adapter.hit)
+            thread_adapter.last_url = request.url
+        return response
+
+    def delete(self, url: str) -> bool:
+        """
+        Deletes the cached response of an url, i.e. if the host answered with an error or an incomplete page.
+        Only works as long as the response is the last one the thread that requested it received.
+        :param url: The url of the response.
+        :return: Whether the response got deleted.
+        """
+        prepared = PreparedRequest()
+        prepared.prepare_url(str(url), None)
+        with self._lock:
+            thread_adapters = list(self._threads.values())
+        for thread_adapter in thread_adapters:
+            with thread_adapter.lock:
+                if thread_adapter.last_url == prepared.url:
+                    thread_adapter.adapter.delete_last()
+                    thread_adapter.last_url = None
+                    return True
+        return False
+
+    @property
+    def hit(self) -> bool:
+        """Whether the last response of the current thread came from the cache. Prefer `response.from_cache`."""
+        return self._thread_adapter().adapter.hit
+
+    @property
+    def use_cache(self) -> bool:
+        """Whether the current thread uses the cache."""
+        return self._thread_adapter().adapter.use_cache
+
+    @use_cache.setter
+    def use_cache(self, value: bool):
+        self._thread_adapter().adapter.use_cache = value
+
+    def delete_last(self):
+        """Deletes the last response of the current thread from the cache."""
+        thread_adapter = self._thread_adapter()
+        with thread_adapter.lock:
+            thread_adapter.adapter.delete_last()
+            thread_adapter.last_url = None
+
+    def close(self):
+        self._adapter.close()
@@ -0,0 +1,62 @@
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TtlCache:
+    """
+    A thread-safe in-memory cache whose values expire after a fixed time to live, based on a monotonic clock.
+
+    Expired values get dropped when they are looked up or when new values are put into the cache.
+    """
+    _ttl: float
+    _values: Dict[Hashable, Tuple[float, Any]]
+
+    def __init__(self, ttl: timedelta, clock: Callable[[], float] = time.monotonic):
+        """
+        Creates a new cache.
+        :param ttl: How long values are kept. A ttl of 0 disables the cache.
+        :param clock: The monotonic clock to measure the age of the values with.
+        """
+        self._lock = threading.Lock()
+        self._clock = clock
+        self._ttl = ttl.total_seconds()
+        self._values = {}
+
+    @property
+    def ttl(self) -> timedelta:
+        return timedelta(seconds=self._ttl)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Looks a value up.
+        :param key: The key of the value.
+        :return: The value or None if it isn't cached or expired.
+        """
+        with self._lock:
+            cached = self._values.get(key)
+            if cached is None:
+                return None
+            expires, value = cached
+            if expires <= self._clock():
+                del self._values[key]
+                return None
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """Caches a value for the time to live of the cache."""
+        if self._ttl <= 0:
+            return
+        with self._lock:
+            now = self._clock()
+            for expired in [key for key, (expires, _) in self._values.items() if expires <= now]:
+                del self._values[expired]
+            self._values[key] = (now + self._ttl, value)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def __len__(self) -> int:
+        return len(self._values)
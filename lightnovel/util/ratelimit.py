@@ -0,0 +1,343 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+
+def parse_retry_after(value: Optional[str], now: datetime = None) -> Optional[float]:
+    """
+    Parses the value of a Retry-After header.
+    :param value: The header value. Either an amount of seconds or an http date.
+    :param now: The current time to compare an http date to. Defaults to now.
+    :return: The amount of seconds to wait or None if the value could not be parsed.
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if date is None:
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    now = now if now is not None else datetime.now(timezone.utc)
+    return max(0.0, (date - now).total_seconds())
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0,
+                  rng: Callable[[], float] = random.random) -> float:
+    """
+    Calculates an exponential backoff delay with jitter.
+    Half of the delay is fixed, the other half is random, so retries of several clients spread out.
+    :param attempt: The number of the failed attempt, starting at 0.
+    :param base: The delay after the first failed attempt.
+    :param cap: The maximal delay.
+    :param rng: The random number generator returning values in [0, 1).
+    :return: The amount of seconds to wait.
+    """
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + delay / 2 * rng()
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket based on a monotonic clock.
+
+    Every request takes one token. Tokens are refilled at `rate` tokens per second, up to `burst` tokens,
+    so up to `burst` requests can be made at once after a quiet period.
+
+    The rate adapts to the host: :meth:`penalize` lowers it and blocks the bucket when the host rejects
+    requests, :meth:`reward` raises it again step by step up to the configured rate.
+    """
+    _rate: float
+    _max_rate: float
+    min_rate: float
+    decrease_factor: float
+    recovery: float
+    _burst: float
+    _tokens: float
+    _updated: float
+    _waited: float
+    _acquisitions: int
+    _waits: int
+
+    def __init__(self, rate: float, burst: float = 1, clock: Callable[[], float] = time.monotonic):
+        """
+        Creates a new token bucket.
+        :param rate: How many tokens get refilled per second. Use `float('inf')` to disable the limit.
+        :param burst: How many tokens the bucket can hold at most.
+        :param clock: The monotonic clock to measure the refill with.
+        """
+        self._lock = threading.Lock()
+        self._clock = clock
+        self._rate = rate
+        self._max_rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._updated = clock()
+        self._waited = 0.0
+        self._acquisitions = 0
+        self._waits = 0
+        self.min_rate = 1.0 / 60
+        self.decrease_factor = 0.5
+        self.recovery = 0.05
+
+    @property
+    def rate(self) -> float:
+        """
+        The current rate in tokens per second. Might be lower than the configured rate after penalties.
+        Setting it changes the configured rate. A penalized rate stays as low as it is and recovers up to the new rate.
+        """
+        return self._rate
+
+    @rate.setter
+    def rate(self, value: float):
+        with self._lock:
+            self._refill()
+            penalized = self._rate < self._max_rate
+            self._max_rate = value
+            self._rate = min(self._rate, value) if penalized else value
+
+    @property
+    def max_rate(self) -> float:
+        """The configured rate, which rewards can raise the current rate to."""
+        return self._max_rate
+
+    @property
+    def burst(self) -> float:
+        return self._burst
+
+    @burst.setter
+    def burst(self, value: float):
+        with self._lock:
+            self._refill()
+            self._burst = value
+            self._tokens = min(self._tokens, value)
+
+    @property
+    def tokens(self) -> float:
+        """The amount of tokens currently available. Negative if callers are already waiting for tokens."""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    @property
+    def waited(self) -> float:
+        """The total amount of seconds callers had to wait for a token."""
+        return self._waited
+
+    @property
+    def acquisitions(self) -> int:
+        """The amount of tokens taken from this bucket."""
+        return self._acquisitions
+
+    @property
+    def waits(self) -> int:
+        """The amount of acquisitions that had to wait for a token."""
+        return self._waits
+
+    @property
+    def average_wait(self) -> float:
+        return self._waited / self._acquisitions if self._acquisitions > 0 else 0.0
+
+    def reset_statistics(self):
+        with self._lock:
+            self._waited = 0.0
+            self._acquisitions = 0
+            self._waits = 0
+
+    def _refill(self):
+        now = self._clock()
+        if self._rate == float('inf'):
+            self._tokens = self._burst
+        else:
+            self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        Takes tokens from the bucket without waiting for them.
+        The caller has to wait for the returned amount of seconds before using the tokens.
+        :param tokens: The amount of tokens to take.
+        :return: The amount of seconds to wait.
+        """
+        with self._lock:
+            self._refill()
+            self._acquisitions += 1
+            if self._rate == float('inf'):
+                return 0.0
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            wait = -self._tokens / self._rate if self._rate > 0 else float('inf')
+            self._waited += wait
+            self._waits += 1
+            return wait
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Takes tokens from the bucket and waits until they are available.
+        :param tokens: The amount of tokens to take.
+        :return: The amount of seconds waited.
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def refund(self, tokens: float = 1):
+        """
+        Puts tokens back into the bucket, i.e. if the request they were taken for didn't reach the host.
+        :param tokens: The amount of tokens to put back.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._burst, self._tokens + tokens)
+
+    def penalize(self, delay: float):
+        """
+        Lowers the rate and blocks the bucket, i.e. if the host answered with 429 Too Many Requests.
+        :param delay: The amount of seconds no tokens should be handed out for.
+        """
+        with self._lock:
+            self._refill()
+            if self._rate == float('inf'):
+                if delay <= 0:
+                    return
+                self._rate = max(self.min_rate, 1.0 / delay)
+            else:
+                self._rate = max(min(self.min_rate, self._rate), self._rate * self.decrease_factor)
+            self._tokens = min(self._tokens, 0.0) - delay * self._rate
+
+    def reward(self):
+        """Raises the rate a bit towards the configured rate, i.e. after the host answered successfully."""
+        with self._lock:
+            if self._rate < self._max_rate:
+                self._refill()
+                self._rate = min(self._max_rate, self._rate * (1.0 + self.recovery))
+
+    def __str__(self):
+        return f"{self._rate}/s (burst {self._burst}, waited {self._waited:.2f}s over {self._acquisitions} requests)"
+
+
+class RateLimiter:
+    """
+    A collection of token buckets keyed by hostname.
+
+    All apis using the same rate limiter (by default the one returned by :meth:`RateLimiter.default`)
+    share the buckets, no matter which instance or thread executes the request.
+    """
+    _default: Optional['RateLimiter'] = None
+    _default_lock = threading.Lock()
+    _buckets: Dict[str, TokenBucket]
+
+    def __init__(self, rate: float = 1.0, burst: float = 1):
+        """
+        Creates a new rate limiter.
+        :param rate: The rate of new buckets in requests per second.
+        :param burst: The burst of new buckets.
+        """
+        self.log = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self.rate = rate
+        self.burst = burst
+
+    @classmethod
+    def default(cls) -> 'RateLimiter':
+        """The rate limiter shared by all apis that didn't get their own."""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    @property
+    def buckets(self) -> Dict[str, TokenBucket]:
+        with self._lock:
+            return dict(self._buckets)
+
+    def bucket(self, hostname: str) -> TokenBucket:
+        """
+        Returns the bucket of a host and creates it if necessary.
+        :param hostname: The host to get the bucket for.
+        :return: The token bucket of the host.
+        """
+        with self._lock:
+            bucket = self._buckets.get(hostname)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+                self._buckets[hostname] = bucket
+            return bucket
+
+    def setdefault(self, hostname: str, rate: float, burst: float) -> TokenBucket:
+        """
+        Returns the bucket of a host and creates it with the given rate and burst if necessary.
+        An existing bucket doesn't change, as other apis might share it or it might have been penalized.
+        :param hostname: The host to get the bucket for.
+        :param rate: The rate of a new bucket in requests per second.
+        :param burst: The burst of a new bucket.
+        :return: The token bucket of the host.
+        """
+        with self._lock:
+            bucket = self._buckets.get(hostname)
+            if bucket is None:
+                bucket = TokenBucket(rate, burst)
+                self._buckets[hostname] = bucket
+            return bucket
+
+    def configure(self, hostname: str, rate: float = None, burst: float = None) -> TokenBucket:
+        """
+        Changes the rate and burst of the bucket of a host.
+        :param hostname: The host to configure.
+        :param rate: The new rate in requests per second. Stays the same if omitted.
+        :param burst: The new burst. Stays the same if omitted.
+        :return: The token bucket of the host.
+        """
+        bucket = self.bucket(hostname)
+        if rate is not None:
+            bucket.rate = rate
+        if burst is not None:
+            bucket.burst = burst
+        return bucket
+
+    def reserve(self, hostname: str) -> float:
+        wait = self.bucket(hostname).reserve()
+        if wait > 0:
+            self.log.debug(f"Waiting for {wait} seconds before requesting {hostname}")
+        return wait
+
+    def acquire(self, hostname: str) -> float:
+        """
+        Waits until another request to the host is allowed.
+        :param hostname: The host to be requested.
+        :return: The amount of seconds waited.
+        """
+        wait = self.reserve(hostname)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def refund(self, hostname: str):
+        self.bucket(hostname).refund()
+
+    def penalize(self, hostname: str, delay: float):
+        self.log.warning(f"Backing off from {hostname} for {delay:.1f} seconds")
+        self.bucket(hostname).penalize(delay)
+
+    def reward(self, hostname: str):
+        self.bucket(hostname).reward()
+
+    @property
+    def waited(self) -> float:
+        """The total amount of seconds callers waited, summed over all hosts."""
+        return sum(bucket.waited for bucket in self.buckets.values())
+
+    def statistics(self) -> Dict[str, str]:
+        return {hostname: str(bucket) for hostname, bucket in self.buckets.items()}
@@ -5,9 +5,48 @@ from typing import List
 # noinspection PyProtectedMember
 from bs4 import Tag, NavigableString
 
+from content import Block, BlockKind, Content, Runs, BREAK, IMAGE, ITALIC, BOLD, UNDERLINE, STRIKE
+
 
 class HtmlSink(ABC):
 
+    def render(self, content: Content) -> str:
+        """Renders the compact content of a chapter."""
+        return self._join_strings([self._render_block(block) for block in content])
+
+    def _render_block(self, block: Block) -> str:
+        if block.kind == BlockKind.RULE:
+            return self._horizontal_rule()
+        if block.kind == BlockKind.ORDERED_LIST:
+            return self._ordered_list([self._render_runs(item) for item in block.items])
+        if block.kind == BlockKind.UNORDERED_LIST:
+            return self._unordered_list([self._render_runs(item) for item in block.items])
+        if block.kind == BlockKind.TABLE:
+            return self._join_strings([
+                self._paragraph(' '.join(self._render_runs(cell) for cell in row)) for row in block.items
+            ])
+        return self._paragraph(self._render_runs(block.runs))
+
+    def _render_runs(self, runs: Runs) -> str:
+        string = ''
+        for run in runs:
+            if run.style & BREAK:
+                string += self._line_break()
+                continue
+            if run.style & IMAGE:
+                continue
+            text = self._string(run.text)
+            if run.style & STRIKE:
+                text = self._del(text)
+            if run.style & UNDERLINE:
+                text = self._underline(text)
+            if run.style & BOLD:
+                text = self._strong(text)
+            if run.style & ITALIC:
+                text = self._italics(text)
+            string += text
+        return string
+
     def parse(self, html: Tag) -> str:
         strings = []
         for child in html.children:
@@ -38,10 +77,16 @@ class HtmlSink(ABC):
             raise Exception(f"Unknown child tag name: {tag.name}")
 
     def _parse_navigable_string(self, string: NavigableString) -> str:
-        return string.__str__()
+        return self._string(string.__str__())
+
+    def _string(self, string: str) -> str:
+        return string
 
     def _parse_paragraph(self, tag: Tag) -> str:
-        return self._parse_sub_tags(tag)
+        return self._paragraph(self._parse_sub_tags(tag))
+
+    def _paragraph(self, string: str) -> str:
+        return string
 
     def _parse_sub_tags(self, tag: Tag) -> str:
         string = ''
@@ -63,7 +108,9 @@ class HtmlSink(ABC):
                     string += self._parse_link(subtag)
                 elif subtag.name in ['p']:
                     string += self._parse_paragraph(tag.contents[0])
-                elif subtag.name in ['br', 'img']:
+                elif subtag.name in ['br']:
+                    string += self._line_break()
+                elif subtag.name in ['img']:
                     pass
                 else:
                     raise Exception(f"Unknown tag type: {subtag.name}({subtag})")
@@ -72,40 +119,54 @@ class HtmlSink(ABC):
         return string
 
     def _parse_horizontal_rule(self, tag: Tag) -> str:
-        raise NotImplementedError('Must be overwritten.')
+        return self._horizontal_rule()
 
     def _parse_strong(self, tag: Tag) -> str:
-        raise NotImplementedError('Must be overwritten.')
+        return self._strong(self._parse_sub_tags(tag))
 
     def _parse_italics(self, tag: Tag) -> str:
-        raise NotImplementedError('Must be overwritten.')
+        return self._italics(self._parse_sub_tags(tag))
 
     def _parse_underline(self, tag: Tag) -> str:
-        raise NotImplementedError('Must be overwritten.')
+        return self._underline(self._parse_sub_tags(tag))
 
     def _parse_del(self, tag: Tag) -> str:
-        raise NotImplementedError('Must be overwritten.')
+        return self._del(self._parse_sub_tags(tag))
 
     def _parse_ordered_list(self, tag: Tag) -> str:
-        strings = []
-        i = 0
-        for subtag in tag.children:
-            if subtag.name == 'li':
-                i += 1
-                strings.append(self._parse_ordered_list_item(subtag, i))
-        return self._join_strings(strings)
+        return self._ordered_list([self._parse_sub_tags(subtag) for subtag in tag.children if subtag.name == 'li'])
 
     def _parse_unordered_list(self, tag: Tag) -> str:
-        strings = []
-        for subtag in tag.children:
-            if subtag.name == 'li':
-                strings.append(self._parse_unordered_list_item(subtag))
-        return self._join_strings(strings)
+        return self._unordered_list([self._parse_sub_tags(subtag) for subtag in tag.children if subtag.name == 'li'])
+
+    def _horizontal_rule(self) -> str:
+        raise NotImplementedError('Must be overwritten.')
+
+    def _line_break(self) -> str:
+        return '\n'
+
+    def _strong(self, string: str) -> str:
+        raise NotImplementedError('Must be overwritten.')
+
+    def _italics(self, string: str) -> str:
+        raise NotImplementedError('Must be overwritten.')
+
+    def _underline(self, string: str) -> str:
+        raise NotImplementedError('Must be overwritten.')
+
+    def _del(self, string: str) -> str:
+        raise NotImplementedError('Must be overwritten.')
+
+    def _ordered_list(self, items: List[str]) -> str:
+        return self._join_strings([self._ordered_list_item(item, i) for i, item in enumerate(items, 1)])
+
+    def _unordered_list(self, items: List[str]) -> str:
+        return self._join_strings([self._unordered_list_item(item) for item in items])
 
-    def _parse_ordered_list_item(self, tag: Tag, index: int) -> str:
+    def _ordered_list_item(self, string: str, index: int) -> str:
         raise NotImplementedError('Must be overwritten.')
 
-    def _parse_unordered_list_item(self, tag: Tag) -> str:
+    def _unordered_list_item(self, string: str) -> str:
         raise NotImplementedError('Must be overwritten.')
 
     def _parse_link(self, tag: Tag) -> str:
@@ -117,37 +178,43 @@ class StringHtmlSink(HtmlSink, ABC):
     def _parse_child_tag(self, tag: Tag) -> str:
         return tag.text.strip()
 
+    def _render_block(self, block: Block) -> str:
+        return block.text.strip()
+
 
 class MarkdownHtmlSink(HtmlSink):
 
     def _join_strings(self, strings: List[str]) -> str:
         return str.join('\n\n', strings).strip()
 
-    def _parse_horizontal_rule(self, tag: Tag) -> str:
+    def _line_break(self) -> str:
+        return '  \n'
+
+    def _horizontal_rule(self) -> str:
         return '---'
 
-    def _parse_italics(self, tag: Tag) -> str:
-        return f"_{self._parse_sub_tags(tag)}_"
+    def _italics(self, string: str) -> str:
+        return f"_{string}_"
 
-    def _parse_strong(self, tag: Tag) -> str:
-        return f"**{self._parse_sub_tags(tag)}**"
+    def _strong(self, string: str) -> str:
+        return f"**{string}**"
 
-    def _parse_underline(self, tag: Tag) -> str:
-        return f"__{self._parse_sub_tags(tag)}__"
+    def _underline(self, string: str) -> str:
+        return f"__{string}__"
 
-    def _parse_ordered_list_item(self, tag: Tag, index: int) -> str:
-        return f"{index}. {self._parse_sub_tags(tag)}"
+    def _ordered_list_item(self, string: str, index: int) -> str:
+        return f"{index}. {string}"
 
-    def _parse_unordered_list_item(self, tag: Tag) -> str:
-        return f"- {self._parse_sub_tags(tag)}"
+    def _unordered_list_item(self, string: str) -> str:
+        return f"- {string}"
 
-    def _parse_del(self, tag: Tag) -> str:
-        return f"~~{self._parse_sub_tags(tag)}~~"
+    def _del(self, string: str) -> str:
+        return f"~~{string}~~"
 
 
 class LatexHtmlSink(HtmlSink):
 
-    def _parse_navigable_string(self, string: NavigableString) -> str:
+    def _string(self, string: str) -> str:
         string = string.strip('\n\t ')
         string = re.sub(r"–", '–', string)
         string = re.sub(r"　", ' ', string)
@@ -161,46 +228,43 @@ class LatexHtmlSink(HtmlSink):
         string = re.sub(r"(?<=[^!?\"]) (?=[,.!?])", '', string)
         return string
 
-    def _parse_paragraph(self, tag: Tag) -> str:
-        return f"{self._parse_sub_tags(tag)}\\\\ \\relax"
+    def _paragraph(self, string: str) -> str:
+        return f"{string}\\\\ \\relax"
 
-    def _parse_horizontal_rule(self, tag: Tag) -> str:
+    def _line_break(self) -> str:
+        return '\\\\\n'
+
+    def _horizontal_rule(self) -> str:
         return '\\hrule'
 
-    def _parse_italics(self, tag: Tag) -> str:
-        return f"\\textit{{{self._parse_sub_tags(tag)}}}"
+    def _italics(self, string: str) -> str:
+        return f"\\textit{{{string}}}"
 
-    def _parse_strong(self, tag: Tag) -> str:
-        return f"\\textbf{{{self._parse_sub_tags(tag)}}}"
+    def _strong(self, string: str) -> str:
+        return f"\\textbf{{{string}}}"
 
-    def _parse_underline(self, tag: Tag) -> str:
-        return f"\\underline{{{self._parse_sub_tags(tag)}}}"
+    def _underline(self, string: str) -> str:
+        return f"\\underline{{{string}}}"
 
     # noinspection SpellCheckingInspection
-    def _parse_del(self, tag: Tag) -> str:
+    def _del(self, string: str) -> str:
         # \usepackage[normalem]{ulem}
-        return f"\\sout{{{self._parse_sub_tags(tag)}}}"
+        return f"\\sout{{{string}}}"
 
-    def _parse_ordered_list(self, tag: Tag) -> str:
+    def _ordered_list(self, items: List[str]) -> str:
         strings = ['\\begin{enumerate}']
-        i = 0
-        for subtag in tag.children:
-            if subtag.name == 'li':
-                i += 1
-                strings.append(self._parse_ordered_list_item(subtag, i))
+        strings.extend(self._ordered_list_item(item, i) for i, item in enumerate(items, 1))
         strings.append('\\end{enumerate}')
         return self._join_strings(strings)
 
-    def _parse_unordered_list(self, tag: Tag) -> str:
+    def _unordered_list(self, items: List[str]) -> str:
         strings = ['\\begin{itemize}']
-        for subtag in tag.children:
-            if subtag.name == 'li':
-                strings.append(self._parse_unordered_list_item(subtag))
+        strings.extend(self._unordered_list_item(item) for item in items)
         strings.append('\\end{itemize}')
         return self._join_strings(strings)
 
-    def _parse_ordered_list_item(self, tag: Tag, index: int) -> str:
-        return f"\\item {self._parse_sub_tags(tag)}"
+    def _ordered_list_item(self, string: str, index: int) -> str:
+        return f"\\item {string}"
 
-    def _parse_unordered_list_item(self, tag: Tag) -> str:
-        return f"\\item {self._parse_sub_tags(tag)}"
+    def _unordered_list_item(self, string: str) -> str:
+        return f"\\item {string}"
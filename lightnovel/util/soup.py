@@ -0,0 +1,185 @@
+import html
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+from bs4 import BeautifulSoup, SoupStrainer, Tag
+from bs4.builder import builder_registry
+
+
+def is_available(features: str) -> bool:
+    """Whether BeautifulSoup has a tree builder with the given features, i.e. whether its parser is installed."""
+    return builder_registry.lookup(features) is not None
+
+
+def fast_features() -> str:
+    """The fastest available parser: lxml if it is installed, Python's built-in html.parser otherwise."""
+    return 'lxml' if is_available('lxml') else 'html.parser'
+
+
+def strainer(*parts: str) -> SoupStrainer:
+    """
+    Creates a strainer that only keeps the given parts of a page, including everything within them.
+    :param parts: Simple selectors of the form `tag`, `tag.class` or `tag#id`.
+    :return: The strainer to pass as `parse_only`.
+    """
+    specs = []
+    for part in parts:
+        if '#' in part:
+            name, ident = part.split('#', 1)
+            specs.append((name, None, ident))
+        elif '.' in part:
+            name, css_class = part.split('.', 1)
+            specs.append((name, css_class, None))
+        else:
+            specs.append((part, None, None))
+
+    def matches(name, attrs=None) -> bool:
+        if isinstance(name, Tag):
+            name, attrs = name.name, name.attrs
+        attrs = attrs if attrs is not None else {}
+        for spec_name, spec_class, spec_id in specs:
+            if name != spec_name:
+                continue
+            if spec_id is not None and attrs.get('id') != spec_id:
+                continue
+            if spec_class is not None:
+                classes = attrs.get('class', [])
+                if spec_class not in (classes.split() if isinstance(classes, str) else classes):
+                    continue
+            return True
+        return False
+
+    return SoupStrainer(matches)
+
+
+_HEAD_END_PATTERN = re.compile(r'</head\s*>', re.IGNORECASE)
+_ATTRIBUTE_PATTERN = re.compile(r'([^\s=/>]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+)))?')
+_TAG_PATTERNS: Dict[str, re.Pattern] = {}
+
+
+def head_of(markup: str) -> str:
+    """Cuts the html of a page off after its head, for the raw html extractors below."""
+    match = _HEAD_END_PATTERN.search(markup)
+    return markup[:match.start()] if match is not None else markup
+
+
+def _tag_pattern(tag: str) -> re.Pattern:
+    pattern = _TAG_PATTERNS.get(tag)
+    if pattern is None:
+        if tag == 'script':
+            pattern = re.compile(r'<script\b([^>]*)>(.*?)</script\s*>', re.IGNORECASE | re.DOTALL)
+        else:
+            pattern = re.compile(rf'<{tag}\b([^>]*)>', re.IGNORECASE)
+        _TAG_PATTERNS[tag] = pattern
+    return pattern
+
+
+def parse_attributes(source: str) -> Dict[str, str]:
+    """Parses the attributes of a start tag, i.e. `rel="canonical" href="/a"`."""
+    attributes = {}
+    for match in _ATTRIBUTE_PATTERN.finditer(source):
+        value = next((group for group in match.groups()[1:] if group is not None), '')
+        attributes.setdefault(match.group(1).lower(), html.unescape(value))
+    return attributes
+
+
+def find_tags(markup: str, tag: str, **attributes: str) -> List[Dict[str, str]]:
+    """
+    Finds tags in raw html without building a document. Meant for well-formed parts like the head of a page.
+    :param markup: The html to search.
+    :param tag: The name of the tags.
+    :param attributes: The attribute values the tags must have.
+    :return: The attributes of every matching tag.
+    """
+    found = []
+    for match in _tag_pattern(tag).finditer(markup):
+        tag_attributes = parse_attributes(match.group(1))
+        if all(tag_attributes.get(key) == value for key, value in attributes.items()):
+            found.append(tag_attributes)
+    return found
+
+
+def find_scripts(markup: str, **attributes: str) -> List[str]:
+    """
+    Finds the contents of script tags in raw html without building a document.
+    :param markup: The html to search.
+    :param attributes: The attribute values the script tags must have.
+    :return: The contents of every matching script tag.
+    """
+    return [
+        match.group(2) for match in _tag_pattern('script').finditer(markup)
+        if all(parse_attributes(match.group(1)).get(key) == value for key, value in attributes.items())
+    ]
+
+
+class HtmlParser:
+    """
+    Builds html documents with a fast parser and falls back to a lenient one if needed.
+
+    Fast parsers can build a different tree than a browser would for broken markup. If a document
+    lacks any of the selectors the caller requires, it gets parsed again with the fallback parser.
+    """
+    features: str
+    fallback: Optional[str]
+    _fallbacks: int
+
+    def __init__(self, features: str = None, fallback: Optional[str] = 'html5lib'):
+        """
+        Creates a new parser.
+        :param features: The BeautifulSoup features of the parser to use. Defaults to the fastest available one.
+        :param fallback: The features of the parser to use if required selectors are missing. None disables it.
+        """
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.features = features if features is not None else fast_features()
+        self.fallback = fallback if fallback != self.features else None
+        self._fallbacks = 0
+
+    @property
+    def fallbacks(self) -> int:
+        """How many documents had to be parsed again with the fallback parser."""
+        return self._fallbacks
+
+    def parse(self, markup: str, required_selectors: Tuple[str, ...] = (),
+              parse_only: SoupStrainer = None) -> BeautifulSoup:
+        """
+        Parses a html document.
+
+        With a strainer, only the parts of the page it keeps get built. The html5lib parser doesn't support
+        strainers and always builds the whole document, so the required selectors have to match both.
+        :param markup: The html to parse.
+        :param required_selectors: The css selectors the document must match, or it gets parsed with the fallback.
+        :param parse_only: The strainer that decides which parts of the page to build.
+        :return: The document.
+        """
+        document = self._build(markup, self.features, parse_only)
+        if self.fallback is not None:
+            missing = self.missing_selectors(document, required_selectors)
+            if missing:
+                self.log.debug(f"Document parsed with {self.features} lacks {missing}. Falling back to {self.fallback}.")
+                self._fallbacks += 1
+                document = self._build(markup, self.fallback, parse_only)
+        return document
+
+    @staticmethod
+    def _build(markup: str, features: str, parse_only: SoupStrainer = None) -> BeautifulSoup:
+        if parse_only is None or features == 'html5lib':
+            return BeautifulSoup(markup, features=features)
+        return BeautifulSoup(markup, features=features, parse_only=parse_only)
+
+    @staticmethod
+    def missing_selectors(document: BeautifulSoup, selectors: Tuple[str, ...]) -> Tuple[str, ...]:
+        return tuple(selector for selector in selectors if document.select_one(selector) is None)
+
+    def fragment(self, markup: str = '') -> BeautifulSoup:
+        """
+        Parses a html snippet, i.e. a synopsis, or creates an empty document to create new tags with.
+        :param markup: The html to parse.
+        :return: The document.
+        """
+        return BeautifulSoup(markup, features='html.parser')
+
+    def __str__(self):
+        if self.fallback is None:
+            return self.features
+        return f"{self.features} (falling back to {self.fallback})"
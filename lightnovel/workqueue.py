@@ -0,0 +1,275 @@
+import logging
+import os
+import socket
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from urllib3.util import parse_url
+
+from api import LightNovelApi, Novel
+from pipeline import Parser
+from scheduler import ChapterGenerator
+from store import SqliteStore
+from webot import Firefox
+
+
+class WorkItem(NamedTuple):
+    id: int
+    novel_url: str
+    first: int
+    last: Optional[int]
+    worker: Optional[str]
+    lease_expires: Optional[float]
+    attempts: int
+
+    @property
+    def chapter_range(self) -> Tuple[int, Optional[int]]:
+        return self.first, self.last
+
+    @property
+    def whole_novel(self) -> bool:
+        return self.first <= 1 and self.last is None
+
+
+class WorkQueue(SqliteStore):
+    """
+    A queue of novels and chapter ranges to crawl, shared by workers on several machines.
+
+    Workers lease an item for a limited time, renew the lease while working on it and complete it when done.
+    Items whose lease expired, i.e. because their worker died, get handed out again. The queue lives in an
+    SQLite database, which can be put on a shared filesystem; leases are taken in immediate transactions,
+    so no item is handed out twice at the same time.
+    """
+    SCHEMA = '''
+CREATE TABLE IF NOT EXISTS work (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    novel_url TEXT NOT NULL,
+    first INTEGER NOT NULL,
+    last INTEGER,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    finished REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS work_state ON work (state, lease_expires);'''
+    COLUMNS = 'id, novel_url, first, last, worker, lease_expires, attempts'
+    max_attempts: int = 3
+
+    @contextmanager
+    def _transaction(self):
+        """Runs statements in an immediate transaction, which locks the database for other writers."""
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.rollback()
+                raise
+            self._connection.commit()
+
+    def add(self, novel_url: str, first: int = 1, last: int = None) -> int:
+        """
+        Adds a novel or a range of its chapters to the queue.
+        :param novel_url: The url of the novel.
+        :param first: The absolute index of the first chapter.
+        :param last: The absolute index of the last chapter. None to crawl up to the latest chapter.
+        :return: The id of the new item.
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute('INSERT INTO work (novel_url, first, last) VALUES (?, ?, ?)',
+                                        (novel_url, first, last))
+            return cursor.lastrowid
+
+    def lease(self, worker: str, lease_time: float = 600.0) -> Optional[WorkItem]:
+        """
+        Takes the oldest pending item or an item whose lease expired.
+        :param worker: The name of the worker taking the lease.
+        :param lease_time: For how many seconds the item is leased.
+        :return: The leased item or None if there is no work left at the moment.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute(
+                f"SELECT {self.COLUMNS} FROM work "
+                f"WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) ORDER BY id LIMIT 1", (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            item = WorkItem(*row)._replace(worker=worker, lease_expires=now + lease_time, attempts=row[6] + 1)
+            connection.execute(
+                "UPDATE work SET state = 'leased', worker = ?, lease_expires = ?, attempts = ? WHERE id = ?",
+                (item.worker, item.lease_expires, item.attempts, item.id)
+            )
+        if item.attempts > 1:
+            self.log.warning(f"Leasing item {item.id} ({item.novel_url}) again, attempt {item.attempts}")
+        return item
+
+    def renew(self, item: WorkItem, lease_time: float = 600.0) -> Optional[WorkItem]:
+        """
+        Extends the lease of an item.
+        :param item: The leased item.
+        :param lease_time: For how many seconds from now the item stays leased.
+        :return: The renewed item or None if the lease got lost to another worker.
+        """
+        expires = time.time() + lease_time
+        if not self._update(item, "lease_expires = ?", (expires,)):
+            return None
+        return item._replace(lease_expires=expires)
+
+    def complete(self, item: WorkItem) -> bool:
+        """
+        Marks a leased item as done.
+        :return: False if the lease got lost to another worker in the meantime.
+        """
+        return self._update(item, "state = 'done', finished = ?", (time.time(),))
+
+    def fail(self, item: WorkItem, error: str) -> bool:
+        """
+        Gives a leased item back after an error. It will be retried until it failed `max_attempts` times.
+        :return: False if the lease got lost to another worker in the meantime.
+        """
+        state = 'failed' if item.attempts >= self.max_attempts else 'pending'
+        return self._update(item, "state = ?, error = ?, lease_expires = NULL", (state, error))
+
+    def split(self, item: WorkItem, ranges: List[Tuple[int, Optional[int]]]) -> bool:
+        """
+        Replaces a leased item with items for the given chapter ranges, so several workers can crawl them.
+        :param item: The leased item.
+        :param ranges: The first and last absolute index of each range.
+        :return: False if the lease got lost to another worker in the meantime.
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE work SET state = 'done', finished = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                (time.time(), item.id, item.worker)
+            )
+            if cursor.rowcount == 0:
+                return False
+            connection.executemany('INSERT INTO work (novel_url, first, last) VALUES (?, ?, ?)',
+                                   [(item.novel_url, first, last) for first, last in ranges])
+        return True
+
+    def _update(self, item: WorkItem, assignments: str, parameters: Tuple) -> bool:
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                f"UPDATE work SET {assignments} WHERE id = ? AND worker = ? AND state = 'leased'",
+                (*parameters, item.id, item.worker)
+            )
+            return cursor.rowcount > 0
+
+    def statistics(self) -> Dict[str, int]:
+        """The amount of items per state."""
+        return dict(self._execute('SELECT state, COUNT(*) FROM work GROUP BY state'))
+
+    def unfinished(self) -> int:
+        """The amount of items that are pending or leased."""
+        return self._execute("SELECT COUNT(*) FROM work WHERE state IN ('pending', 'leased')")[0][0]
+
+
+class Worker:
+    """
+    Crawls the items leased from a :class:`WorkQueue` until the queue runs empty.
+
+    Every item runs through :meth:`LightNovelApi.get_all_chapters` and the pipeline stages, like a novel of the
+    :class:`CrawlScheduler`. Items for an entire novel get split into chapter ranges of `range_size` chapters
+    first, if the novel lists more than that. The last range stays open-ended to follow links to unlisted chapters.
+    """
+    name: str
+    lease_time: float
+    range_size: int
+    prefetch: int
+
+    def __init__(
+            self,
+            queue: WorkQueue,
+            pipeline: Callable[[LightNovelApi, Novel, ChapterGenerator], ChapterGenerator] = None,
+            api_factory: Callable[[str], LightNovelApi] = None,
+            name: str = None,
+            lease_time: float = 600.0,
+            range_size: int = 0,
+            prefetch: int = 0):
+        """
+        Creates a new worker.
+        :param queue: The queue to lease items from.
+        :param pipeline: Wraps the chapter generator of an item in pipeline stages. Defaults to a :class:`Parser`.
+            Output stages should write each chapter range on its own.
+        :param api_factory: Creates the api for a novel url. Defaults to :meth:`LightNovelApi.get_api`.
+        :param name: The name of the worker. Defaults to the hostname and process id.
+        :param lease_time: For how many seconds an item is leased. The lease gets renewed while crawling.
+        :param range_size: How many chapters an item may span. 0 disables splitting novels.
+        :param prefetch: The prefetch window passed to :meth:`LightNovelApi.get_all_chapters`.
+        """
+        self.log = logging.getLogger(self.__class__.__name__)
+        self._queue = queue
+        self._pipeline = pipeline if pipeline is not None else lambda api, novel, gen: Parser(api.browser).wrap(gen)
+        self._api_factory = api_factory if api_factory is not None else lambda url: LightNovelApi.get_api(url, Firefox())
+        self.name = name if name is not None else f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_time = lease_time
+        self.range_size = range_size
+        self.prefetch = prefetch
+
+    def run(self, poll_interval: float = 5.0) -> int:
+        """
+        Processes items until none are pending or leased by other workers anymore.
+        :param poll_interval: How long to wait before checking again while other workers still hold leases.
+        :return: The amount of processed items.
+        """
+        processed = 0
+        while True:
+            if self.run_once():
+                processed += 1
+            elif self._queue.unfinished() > 0:
+                time.sleep(poll_interval)
+            else:
+                return processed
+
+    def run_once(self) -> bool:
+        """
+        Leases and processes a single item.
+        :return: Whether an item was leased.
+        """
+        item = self._queue.lease(self.name, self.lease_time)
+        if item is None:
+            return False
+        self.log.info(f"Leased item {item.id}: chapters {item.first} to {item.last or 'end'} of {item.novel_url}")
+        try:
+            if self._process(item):
+                self._queue.complete(item)
+        except Exception as e:
+            self.log.exception(f"Processing item {item.id} failed")
+            self._queue.fail(item, repr(e))
+        return True
+
+    def _process(self, item: WorkItem) -> bool:
+        """
+        Crawls the chapters of an item, renewing its lease on the way.
+        :return: Whether the item should be completed. False if it got split or its lease got lost.
+        """
+        api = self._api_factory(item.novel_url)
+        novel = api.get_novel(parse_url(item.novel_url))
+        if not novel.parse():
+            raise Exception(f"Couldn't parse novel page {item.novel_url}")
+        if item.whole_novel and self.range_size > 0:
+            listed = sum(len(book.chapter_entries) for book in novel.books)
+            if listed > self.range_size:
+                ranges = [(first, first + self.range_size - 1) for first in range(1, listed + 1, self.range_size)]
+                ranges[-1] = (ranges[-1][0], None)
+                self.log.info(f"Splitting {novel.title} into {len(ranges)} chapter ranges")
+                self._queue.split(item, ranges)
+                return False
+        novel.cover = api.get_image(novel.cover_url)
+        gen = api.get_all_chapters(novel, self.prefetch, chapter_range=item.chapter_range)
+        gen = self._pipeline(api, novel, gen)
+        try:
+            for _ in gen:
+                if item.lease_expires - time.time() < self.lease_time / 2:
+                    item = self._queue.renew(item, self.lease_time)
+                    if item is None:
+                        self.log.warning("Lost the lease to another worker. Stopping.")
+                        return False
+        finally:
+            gen.close()
+        return True
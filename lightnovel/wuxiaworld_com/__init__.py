@@ -1,2 +1,2 @@
 from .api import WuxiaWorldComApi, WuxiaWorldCom, WuxiaWorldComNovel, WuxiaWorldComChapter, WuxiaWorldComBook, \
-    WuxiaWorldComChapterEntry, WuxiaWorldComSearchEntry
+    WuxiaWorldComChapterEntry, WuxiaWorldComSearchEntry, WuxiaWorldComSearchSummary, AsyncWuxiaWorldComApi
@@ -1,20 +1,67 @@
+import asyncio
 import html
 import json
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from enum import Enum
-from typing import List, Tuple
+from typing import List, Tuple, Any, Optional, NamedTuple, Union, Generator, AsyncGenerator
 
 # noinspection PyProtectedMember
-from bs4 import BeautifulSoup, Tag, NavigableString
+from bs4 import BeautifulSoup, Tag
 from urllib3.util.url import parse_url, Url
 
-from lightnovel import ChapterEntry, Book, Novel, Chapter, LightNovelApi, SearchEntry
-from webot.adapter import CacheAdapter
+from async_api import AsyncLightNovelApi
+from cleaner import CleaningRules
+from lightnovel import ChapterEntry, ChapterTable, Book, Novel, Chapter, LightNovelApi, SearchEntry
+from util.cache import TtlCache
+from util.soup import strainer, find_tags, find_scripts
 from webot.util import encode_form_data
 
 
 class WuxiaWorldCom:
+    __slots__ = ()
     _hostname = 'www.wuxiaworld.com'
+    SEARCH_URL = 'https://www.wuxiaworld.com/api/novels/search'
+    SEARCH_HEADERS = {
+        'Accept': 'application/json, text/plain, */*',
+        'Content-Type': 'application/json;charset=utf-8',
+        'Upgrade-Insecure-Requests': None,
+    }
+
+    @staticmethod
+    def _search_payload(
+            title: str,
+            tags: Tuple['NovelTag'],
+            genres: Tuple['Genre'],
+            status: 'Status',
+            sort_by: 'SortType',
+            sort_asc: bool,
+            search_after: int,
+            count: int) -> str:
+        return json.dumps({
+            "title": title,
+            "tags": list(map(lambda tag: tag.value, tags)),
+            "genres": list(map(lambda genre: genre.value, genres)),
+            "active": status.value,
+            "sortType": sort_by.value,
+            "sortAsc": sort_asc,
+            "searchAfter": search_after,
+            "count": count,
+        }, separators=(',', ':'))
+
+    @staticmethod
+    def _page_offsets(page_size: int, total: int) -> range:
+        """The `search_after` values of the pages that follow a first page with `page_size` of `total` matches."""
+        return range(page_size, total, page_size) if page_size > 0 else range(0)
+
+    @staticmethod
+    def _search_results(
+            data: Any,
+            bulk: bool = False) -> Tuple[List[Union['WuxiaWorldComSearchEntry', 'WuxiaWorldComSearchSummary']], int]:
+        assert data['result']
+        if bulk:
+            return list(map(WuxiaWorldComSearchSummary.from_json, data['items'])), int(data['total'])
+        return list(map(WuxiaWorldComSearchEntry, data['items'])), int(data['total'])
 
 
 class WuxiaWorldComChapterEntry(WuxiaWorldCom, ChapterEntry):
@@ -22,9 +69,13 @@ class WuxiaWorldComChapterEntry(WuxiaWorldCom, ChapterEntry):
 
 
 class WuxiaWorldComBook(WuxiaWorldCom, Book):
-    _chapter_entries: List[WuxiaWorldComChapterEntry] = []
+    _chapter_entries: ChapterTable = None
     _chapters: List['WuxiaWorldComChapter'] = []
 
+    def __init__(self, title: str):
+        super(WuxiaWorldComBook, self).__init__(title)
+        self._chapter_entries = ChapterTable(Url('https', host=self._hostname), WuxiaWorldComChapterEntry)
+
 
 class Status(Enum):
     ANY = None
@@ -50,9 +101,7 @@ class NovelTag(Enum):
 
     @classmethod
     def from_str(cls, tag: str):
-        for member in cls:
-            if tag == member.value:
-                return member
+        return cls._value2member_map_.get(tag)
 
 
 class Genre(Enum):
@@ -78,9 +127,7 @@ class Genre(Enum):
 
     @classmethod
     def from_str(cls, tag: str):
-        for member in cls:
-            if tag == member.value:
-                return member
+        return cls._value2member_map_.get(tag)
 
 
 class SortType(Enum):
@@ -91,12 +138,18 @@ class SortType(Enum):
 
 
 class WuxiaWorldComSearchEntry(WuxiaWorldCom, SearchEntry):
+    """
+    A novel found by a search.
+
+    The synopsis only gets parsed when it is accessed, as most entries just get looked through.
+    """
+    __slots__ = ('id', 'name', 'slug', 'cover_url', 'abbreviation', '_synopsis', '_synopsis_html', 'language',
+                 'time_created', 'sneakPeek', 'status', 'chapter_count', 'tags', 'genres')
     id: int
     name: str
     slug: str
     cover_url: str
     abbreviation: str
-    synopsis: Tag
     language: str
     time_created: datetime
     sneakPeek: bool
@@ -112,23 +165,66 @@ class WuxiaWorldComSearchEntry(WuxiaWorldCom, SearchEntry):
         self.slug = json_data['slug']
         self.cover_url = json_data['coverUrl']
         self.abbreviation = json_data['abbreviation']
-        self.synopsis = BeautifulSoup(json_data['synopsis'], features="html5lib")
+        self._synopsis = None
+        self._synopsis_html = json_data['synopsis']
         self.language = json_data['language']
         self.time_created = datetime.utcfromtimestamp(float(json_data['timeCreated']))
         self.sneakPeek = bool(json_data['sneakPeek'])
         self.status = Status.from_int(json_data['status'])
         self.chapter_count = int(json_data['chapterCount'])
-        self.tags = list(map(lambda tag: NovelTag.from_str(tag), json_data['tags']))
-        self.genres = list(map(lambda genre: Genre.from_str(genre), json_data['genres']))
+        self.tags = [NovelTag.from_str(tag) for tag in json_data['tags']]
+        self.genres = [Genre.from_str(genre) for genre in json_data['genres']]
 
         self.title = self.name
-        if self.sneakPeek:
-            self._url = self.alter_url(f"preview/{self.slug}")
-        else:
-            self._url = self.alter_url(f"novel/{self.slug}")
+        self._url = self.alter_url(_search_path(self.slug, self.sneakPeek))
+
+    @property
+    def synopsis(self) -> Tag:
+        if self._synopsis is None:
+            self._synopsis = BeautifulSoup(self._synopsis_html, features='html.parser')
+            self._synopsis_html = None
+        return self._synopsis
+
+
+class WuxiaWorldComSearchSummary(NamedTuple):
+    """The fields of a search result needed to pick the novels to crawl, without decoding the rest."""
+    id: int
+    name: str
+    slug: str
+    sneak_peek: bool
+    status: Status
+    chapter_count: int
+
+    @classmethod
+    def from_json(cls, json_data: dict) -> 'WuxiaWorldComSearchSummary':
+        return cls(int(json_data['id']), json_data['name'], json_data['slug'], bool(json_data['sneakPeek']),
+                   Status.from_int(json_data['status']), int(json_data['chapterCount']))
+
+    @property
+    def title(self) -> str:
+        return self.name
+
+    @property
+    def url(self) -> Url:
+        return Url('https', host=WuxiaWorldCom._hostname, path=_search_path(self.slug, self.sneak_peek))
+
+
+def _search_path(slug: str, sneak_peek: bool) -> str:
+    """The path of the page of a novel found by a search. Sneak peeks only have a preview page."""
+    if sneak_peek:
+        return f"preview/{slug}"
+    return f"novel/{slug}"
 
 
 class WuxiaWorldComNovel(WuxiaWorldCom, Novel):
+    REQUIRED_SELECTORS = (
+        'head meta[name="description"]',
+        'head script[type="application/ld+json"]',
+        'dl.dl-horizontal',
+        'p.legal',
+        'div.p-15 div#accordion',
+    )
+    PARSE_ONLY = strainer('head', 'div.p-15', 'dl.dl-horizontal', 'p.legal')
     _books: List[WuxiaWorldComBook]
     _karma_active: bool = False
 
@@ -137,18 +233,18 @@ class WuxiaWorldComNovel(WuxiaWorldCom, Novel):
         return self._karma_active
 
     def parse(self) -> bool:
-        head = self._document.select_one('head')
-        if not isinstance(head, Tag):
+        index = _NovelIndex()
+        index.walk(self._document)
+        if not index.head:
             raise Exception("Unexpected type of tag selection")
-        meta_description = head.select_one('meta[name="description"]')
+        meta_description = index.meta.get('description')
         if not isinstance(meta_description, Tag):
             raise Exception("Unexpected type of tag selection")
         if not meta_description.has_attr('content'):
             return False
-        head_json = head.select_one('script[type="application/ld+json"]')
-        if not isinstance(head_json, Tag):
+        if index.ld_json is None:
             raise Exception("Unexpected type of tag selection")
-        json_data = json.loads(head_json.text)
+        json_data = json.loads(index.ld_json.text)
         self._title = json_data['name']
         self.log.debug(f"Novel title is: {self._title}")
         url = json_data['potentialAction']['target'].get('urlTemplate', '')
@@ -156,10 +252,9 @@ class WuxiaWorldComNovel(WuxiaWorldCom, Novel):
             self._success = False
             return False
         self._first_chapter_path = parse_url(url).path
-        description_list = self._document.select_one('dl.dl-horizontal')
-        if not isinstance(description_list, Tag):
+        if index.description_list is None:
             raise Exception("Unexpected type of tag selection")
-        descriptions = description_list.text.strip('\n').split('\n')
+        descriptions = index.description_list.text.strip('\n').split('\n')
         while len(descriptions) > 0:
             if descriptions[0] == "Translator:":
                 descriptions.pop(0)
@@ -171,67 +266,152 @@ class WuxiaWorldComNovel(WuxiaWorldCom, Novel):
                 self.log.warning(f"Discarding description entry {descriptions.pop(0)}")
         # self._author = dl.contents[7].text
         # self._translator = dl.contents[3].text  # json_data['author']['name']
-        legal_paragraph = self._document.select_one('p.legal')
-        if not isinstance(legal_paragraph, Tag):
+        if index.legal is None:
             raise Exception("Unexpected type of tag selection")
-        self._rights = html.unescape(legal_paragraph.getText())
+        self._rights = html.unescape(index.legal.getText())
         self._release_date = datetime.fromisoformat(json_data['datePublished'])
-        for tag in head.select('script[type="text/javascript"]'):
-            if "karmaActive" in tag.text:
-                self._karma_active = "karmaActive: true" in tag.text
+        for script in index.scripts:
+            if "karmaActive" in script:
+                self._karma_active = "karmaActive: true" in script
         if self._karma_active:
             self.log.warning("This novel might require karma points to unlock chapters.")
-        meta_image = head.select_one('meta[property="og:image"]')
+        meta_image = index.meta.get('og:image')
         if not isinstance(meta_image, Tag):
             raise Exception("Unexpected type of tag selection")
         self._cover_url = meta_image.get('content')
-        p15 = self._document.select_one('div.p-15')
-        if not isinstance(p15, Tag):
+        if not index.p15:
             raise Exception("Unexpected type of tag selection")
-        self._tags = self.__extract_tags(p15)
-        self._description = p15.select('div.fr-view')[1]
-        self._books = self.__extract_books(p15)
+        self._tags = index.tags
+        self.log.debug(f"Tags found: {self._tags}")
+        self._description = index.description
+        self._books = self.__make_books(index.panels)
         self._success = True
         self._language = 'en'
         return True
 
-    def __extract_tags(self, p15: Tag) -> List[str]:
-        tags = []
-        for tag_html in p15.select('div.media.media-novel-index div.media-body div.tags a'):
-            tag = tag_html.text.strip()
-            tags.append(tag)
-        self.log.debug(f"Tags found: {tags}")
-        return tags
-
-    def __extract_books(self, p15: Tag) -> List[WuxiaWorldComBook]:
+    def __make_books(self, panels: List[list]) -> List[WuxiaWorldComBook]:
         books = []
-        book_index = 0
-        for book_html in p15.select('div#accordion div.panel.panel-default'):
-            book_index += 1
-            book = WuxiaWorldComBook(book_html.select_one('a.collapsed').text.strip())
+        for book_index, (title, links) in enumerate(panels, 1):
+            book = WuxiaWorldComBook(title)
             book.novel = self
             book.index = book_index
-            book._chapter_entries = self.__extract_chapters(book_html)
+            chapters = book.chapter_entries
+            for path, chapter_title in links:
+                chapters.add(path, chapter_title)
+            self.log.debug(f"Chapters found: {len(chapters)}")
             self.log.debug(f"Book: {book}")
             books.append(book)
         return books
 
-    def __extract_chapters(self, book_html: Tag) -> List[WuxiaWorldComChapterEntry]:
-        chapters = []
-        chapter_index = 0
-        for chapter_html in book_html.select('div div li a'):
-            chapter_index += 1
-            chapter = WuxiaWorldComChapterEntry(
-                Url('https', host='www.wuxiaworld.com', path=chapter_html.get('href')),
-                title=chapter_html.text.strip()
-            )
-            chapter.index = chapter_index
-            chapters.append(chapter)
-        self.log.debug(f"Chapters found: {len(chapters)}")
-        return chapters
+
+class _NovelIndex:
+    """
+    Collects everything :meth:`WuxiaWorldComNovel.parse` needs from the index page in a single walk over
+    the document, instead of running a css selector over the whole tree for every part.
+
+    The walk keeps track of where it is in the tree to match what these selectors used to:
+    `head meta[name="description"]`, `head meta[property="og:image"]`, `head script[type="application/ld+json"]`,
+    `head script[type="text/javascript"]`, `dl.dl-horizontal`, `p.legal`, `div.p-15`,
+    `div.p-15 div.media.media-novel-index div.media-body div.tags a` for the tags,
+    the second `div.p-15 div.fr-view` for the description,
+    `div.p-15 div#accordion div.panel.panel-default` for the books, their first `a.collapsed` for the book title
+    and their `div div li a` for the chapters.
+    """
+    # Stages of the tag selector: within div.media.media-novel-index, its div.media-body and their div.tags
+    MEDIA, MEDIA_BODY, TAGS = 1, 2, 3
+
+    def __init__(self):
+        self.head = False
+        self.meta = {}
+        self.ld_json: Optional[Tag] = None
+        self.scripts: List[str] = []
+        self.description_list: Optional[Tag] = None
+        self.legal: Optional[Tag] = None
+        self.p15 = False
+        self.tags: List[str] = []
+        self.description: Optional[Tag] = None
+        self.panels: List[list] = []
+        self._fr_views = 0
+
+    def walk(self, parent: Tag, in_head: bool = False, in_p15: bool = False, tag_stage: int = 0,
+             in_accordion: bool = False, panel: list = None, panel_divs: int = 0, in_li: bool = False):
+        for tag in parent.children:
+            if not isinstance(tag, Tag):
+                continue
+            name = tag.name
+            classes = tag.get('class') or ()
+            # Some parsers nest the tags of the head into void tags like meta or link, so they get walked too.
+            if in_head:
+                if name == 'meta':
+                    key = tag.get('name') or tag.get('property')
+                    if key is not None and key not in self.meta:
+                        self.meta[key] = tag
+                elif name == 'script':
+                    script_type = tag.get('type')
+                    if script_type == 'application/ld+json':
+                        if self.ld_json is None:
+                            self.ld_json = tag
+                    elif script_type == 'text/javascript':
+                        self.scripts.append(tag.text)
+                    continue
+            elif name == 'head' and not self.head:
+                self.head = True
+                self.walk(tag, in_head=True)
+                continue
+            if name == 'dl' and self.description_list is None and 'dl-horizontal' in classes:
+                self.description_list = tag
+            elif name == 'p' and self.legal is None and 'legal' in classes:
+                self.legal = tag
+            if not in_p15:
+                if name == 'div' and not self.p15 and 'p-15' in classes:
+                    self.p15 = True
+                    self.walk(tag, in_p15=True)
+                    continue
+                self.walk(tag, in_head)
+                continue
+            stage, accordion, book, divs, li = tag_stage, in_accordion, panel, panel_divs, in_li
+            if name == 'a':
+                if book is not None:
+                    if book[0] is None and 'collapsed' in classes:
+                        book[0] = tag.text.strip()
+                    if li:
+                        book[1].append((tag.get('href'), tag.text.strip()))
+                        continue
+                if stage == self.TAGS:
+                    self.tags.append(tag.text.strip())
+            elif name == 'li':
+                li = li or (book is not None and divs >= 2)
+            elif name == 'div':
+                divs += 1
+                if 'fr-view' in classes:
+                    self._fr_views += 1
+                    if self._fr_views == 2:
+                        self.description = tag
+                if stage == 0 and 'media' in classes and 'media-novel-index' in classes:
+                    stage = self.MEDIA
+                elif stage == self.MEDIA and 'media-body' in classes:
+                    stage = self.MEDIA_BODY
+                elif stage == self.MEDIA_BODY and 'tags' in classes:
+                    stage = self.TAGS
+                if tag.get('id') == 'accordion':
+                    accordion = True
+                elif accordion and 'panel' in classes and 'panel-default' in classes:
+                    book, divs, li = [None, []], 0, False
+                    self.panels.append(book)
+            self.walk(tag, in_p15=True, tag_stage=stage, in_accordion=accordion, panel=book, panel_divs=divs,
+                      in_li=li)
 
 
 class WuxiaWorldComChapter(WuxiaWorldCom, Chapter):
+    REQUIRED_SELECTORS = (
+        'head link[rel="canonical"]',
+        'head meta[name="description"]',
+        'head script[type="application/ld+json"]',
+        'div.fr-view',
+    )
+    PARSE_ONLY = strainer('head', 'div.fr-view')
+    PEEKS_WITHOUT_PARSING = True
+    CLEANING_RULES = CleaningRules()
     _chapter_id: int
     _is_teaser: bool
     _karma_locked: bool
@@ -242,6 +422,9 @@ class WuxiaWorldComChapter(WuxiaWorldCom, Chapter):
 
     @property
     def is_teaser(self) -> bool:
+        if not hasattr(self, '_is_teaser'):
+            chapter_data = self._chapter_data()
+            return bool(chapter_data.get('isTeaser')) if chapter_data is not None else False
         return self._is_teaser
 
     @property
@@ -249,29 +432,24 @@ class WuxiaWorldComChapter(WuxiaWorldCom, Chapter):
         return self._karma_locked
 
     def parse(self) -> bool:
-        head = self._document.select_one('head')
-        if not isinstance(head, Tag):
+        if self._restored:
+            return self._success
+        canonical_url = self._canonical_url()
+        if canonical_url is None:
             raise Exception("Unexpected type of tag selection")
-        link = head.select_one('link[rel="canonical"]')
-        if not isinstance(link, Tag):
-            raise Exception("Unexpected type of tag selection")
-        url = parse_url(link.get('href'))
+        url = parse_url(canonical_url)
         if url.path.startswith('/preview') or url.path.startswith('/Error'):
             return False
         self._karma_locked = False  # For is_complete() to run smoothly
         if self.is_complete():
-            head_json = head.select_one('script[type="application/ld+json"]')
-            if not isinstance(head_json, Tag):
+            json_data = self._ld_json()
+            if json_data is None:
                 raise Exception("Unexpected type of tag selection")
-            json_str = head_json.text
-            json_data = json.loads(json_str)
             self._translator = json_data['author']['name']
             # self.title = head.select_one('meta[property=og:title]').get('content').replace('  ', '
-            for script_tag in head.select('script'):
-                script = script_tag.text.strip('\n \t;')
-                if script.startswith('var CHAPTER = '):
-                    json_data = json.loads(script[14:])
-                    break
+            chapter_data = self._chapter_data()
+            if chapter_data is not None:
+                json_data = chapter_data
             self._title = json_data['name']
             self._chapter_id = int(json_data['id'])
             self._is_teaser = json_data['isTeaser']
@@ -279,7 +457,7 @@ class WuxiaWorldComChapter(WuxiaWorldCom, Chapter):
             self._next_chapter_path = json_data['nextChapter']
             if self._title == '':
                 self.log.warning("Couldn't extract data from CHAPTER variable.")
-            content = self._document.select_one('div.p-15 div.fr-view')
+            content = self.document.select_one('div.fr-view')
             if not isinstance(content, Tag):
                 raise Exception("Unexpected type of tag selection")
             self._content = content
@@ -290,89 +468,82 @@ class WuxiaWorldComChapter(WuxiaWorldCom, Chapter):
             self._success = True
             return True
 
-    def is_complete(self) -> bool:
-        meta_description = self._document.select_one('head meta[name="description"]')
+    def _canonical_url(self) -> Optional[str]:
+        """Read from the raw html like the other head data. The document only gets built if the raw html lacks it."""
+        if self.head_markup is not None:
+            links = find_tags(self.head_markup, 'link', rel='canonical')
+            if links and 'href' in links[0]:
+                return links[0]['href']
+        link = self.document.select_one('head link[rel="canonical"]')
+        return link.get('href') if isinstance(link, Tag) else None
+
+    def _has_description(self) -> bool:
+        if self.head_markup is not None:
+            metas = find_tags(self.head_markup, 'meta', name='description')
+            if metas:
+                return 'content' in metas[0]
+        meta_description = self.document.select_one('head meta[name="description"]')
         if not isinstance(meta_description, Tag):
             raise Exception("Unexpected type of description meta data")
-        return meta_description.has_attr('content') and not self.karma_locked
-
-    def clean_content(self):
-        bs = BeautifulSoup(features="html5lib")
-        new_content = bs.new_tag('div')
-        new_content.clear()
-        tags_cnt = 0
-        max_tags_cnt = 4
-        for child in self._content.children:
-            if isinstance(child, NavigableString):
-                if len(child.strip('\n  ')) == 0:
-                    # self.log.debug("Empty string.")
-                    pass
-                else:
-                    self.log.warning(f"Non-Empty string: '{child}'.")
-            elif isinstance(child, Tag):
-                # ['p', 'div', 'a', 'blockquote', 'ol', 'ul', 'h1', 'h2', 'h3', 'h4', 'h5']
-                if child.name == 'blockquote':  # Block quotes have to have a paragraph within
-                    p = bs.new_tag('p')
-                    for children in child.children:
-                        p.append(children)
-                    child.clear()
-                    child.append(p)
-                if child.name in ['p', 'div', 'blockquote']:
-                    #     child.name = 'p'
-                    # if child.name == 'p':
-                    if len(child.text.strip('\n ')) == 0:
-                        # self.log.debug("Empty paragraph.")
-                        pass
-                    else:
-                        for desc in child.descendants:
-                            if isinstance(desc, Tag):
-                                from lightnovel import EpubMaker
-                                if desc.name not in EpubMaker.ALLOWED_TAGS:
-                                    self.log.debug(f"Tag '{desc.name}' is not allowed in an epub. Changing to span")
-                                    desc.name = 'span'
-                                if desc.name == 'a':
-                                    self.log.debug(f"Cleaning link '{desc}'")
-                                    desc.attrs = {}
-                        if child.text in ['Next Chapter', 'Previous Chapter']:
-                            continue
-                        new_content.append(child.__copy__())
-                        tags_cnt += 1
-                        title_str = self.extract_clean_title()
-                        if tags_cnt <= max_tags_cnt and title_str != '' and title_str in child.text.strip('\n '):
-                            self.log.debug("Title found in paragraph. Discarding previous paragraphs.")
-                            new_content.clear()
-                            tags_cnt = max_tags_cnt
-                elif child.name == 'hr':
-                    new_content.append(child)
-                elif child.name == 'a':
-                    continue
-                elif child.name in ['ol', 'ul']:
-                    new_content.append(child)
-                else:
-                    raise Exception(f"Unexpected tag name: {child}")
-            else:
-                raise Exception(f"Unexpected type: {child}")
-        self._content = new_content
+        return meta_description.has_attr('content')
+
+    def _ld_json(self) -> Optional[dict]:
+        """The linked data of the page"""
+        if self.head_markup is not None:
+            scripts = find_scripts(self.head_markup, type='application/ld+json')
+            if scripts:
+                return json.loads(scripts[0])
+        head_json = self.document.select_one('head script[type="application/ld+json"]')
+        return json.loads(head_json.text) if isinstance(head_json, Tag) else None
+
+    def _chapter_data(self) -> Optional[dict]:
+        """The data of the CHAPTER variable in the head of the page"""
+        if self.head_markup is not None:
+            scripts = find_scripts(self.head_markup)
+        else:
+            scripts = [script_tag.text for script_tag in self.document.select('head script')]
+        for script in scripts:
+            script = script.strip('\n \t;')
+            if script.startswith('var CHAPTER = '):
+                return json.loads(script[14:])
+        return None
+
+    def peek_next_chapter(self) -> Optional[Url]:
+        if self._restored or self._success:
+            return self.next_chapter
+        chapter_data = self._chapter_data()
+        next_path = chapter_data.get('nextChapter') if chapter_data is not None else None
+        return self.alter_url(next_path) if next_path else None
 
-    def __clean_paragraph(self, p: Tag):
-        for desc in p.descendants:
-            if desc.name is None:
-                continue
-            from lightnovel import EpubMaker
-            if desc.name not in EpubMaker.ALLOWED_TAGS:
-                self.log.debug(f"Tag '{desc.name}' is not allowed in an epub. Changing to span")
-                desc.name = 'span'
-            if desc.name == 'a':
-                self.log.debug(f"Cleaning link '{desc['href']}'")
-                desc.attrs = {}
+    def is_complete(self) -> bool:
+        if self._restored:
+            return not self.karma_locked
+        return self._has_description() and not self.karma_locked
+
+    def _record_extra(self) -> dict:
+        return {'chapter_id': self._chapter_id, 'is_teaser': self._is_teaser, 'karma_locked': self._karma_locked}
+
+    def _restore_extra(self, extra: dict):
+        self._chapter_id = extra['chapter_id']
+        self._is_teaser = extra['is_teaser']
+        self._karma_locked = extra['karma_locked']
 
 
 class WuxiaWorldComApi(WuxiaWorldCom, LightNovelApi):
+    def __init__(self, *args, search_ttl: timedelta = timedelta(0), **kwargs):
+        """
+        Creates a new api for wuxiaworld.com. See :meth:`LightNovelApi.__init__` for the other parameters.
+        :param search_ttl: How long pages of search results are kept in memory, i.e. to page through the catalogue
+            several times. By default they aren't kept, so every search gets the current results.
+        """
+        super().__init__(*args, **kwargs)
+        self._search_cache = TtlCache(search_ttl)
+
     def get_novel(self, url: Url) -> WuxiaWorldComNovel:
-        return WuxiaWorldComNovel(url, self._get_document(url))
+        return WuxiaWorldComNovel(url, self._get_page(url, WuxiaWorldComNovel))
 
     def get_chapter(self, url: Url) -> WuxiaWorldComChapter:
-        return WuxiaWorldComChapter(url, self._get_document(url))
+        return self._make_chapter(WuxiaWorldComChapter, url, self._get_page_html(url))
 
     # TODO: Respect robots.txt and don't use /api/* calls. Instead, use https://www.wuxiaworld.com/sitemap/novels
     def search(
@@ -384,7 +555,8 @@ class WuxiaWorldComApi(WuxiaWorldCom, LightNovelApi):
             sort_by: SortType = SortType.NAME,
             sort_asc: bool = True,
             search_after: int = None,
-            count: int = 15) -> Tuple[List[WuxiaWorldComSearchEntry], int]:
+            count: int = 15,
+            bulk: bool = False) -> Tuple[List[Union[WuxiaWorldComSearchEntry, WuxiaWorldComSearchSummary]], int]:
         """Searches for novels matching certain criteria. Violates robots.txt
 
         :param title: The title or abbreviation to search for.
@@ -395,45 +567,78 @@ class WuxiaWorldComApi(WuxiaWorldCom, LightNovelApi):
         :param sort_asc: Whether to sort in an ascending order or not.
         :param search_after: The index after which to return the list. Useful if the first request did not return all matches.
         :param count: How many matches to maximally include in the returned list.
+        :param bulk: Whether to only decode the fields needed to pick novels (:class:`WuxiaWorldComSearchSummary`).
         :return: A list of matched novels (:class:`WuxiaWorldSearchEntry`) and the amount of total novels that matched the search criteria.
         """
         self.log.warning("This method violates robots.txt.")
+        payload = self._search_payload(title, tags, genres, status, sort_by, sort_asc, search_after, count)
+        return self._search_results(self._search_page(payload), bulk)
+
+    def iter_search(
+            self,
+            title: str = '',
+            tags: Tuple[NovelTag] = (),
+            genres: Tuple[Genre] = (),
+            status: Status = Status.ANY,
+            sort_by: SortType = SortType.NAME,
+            sort_asc: bool = True,
+            page_size: int = 50,
+            workers: int = 4,
+            bulk: bool = False
+    ) -> Generator[Union[WuxiaWorldComSearchEntry, WuxiaWorldComSearchSummary], None, None]:
+        """Searches for all novels matching certain criteria, page by page. Violates robots.txt
+
+        Once the first page tells how many novels match, the remaining pages get requested at the same time
+        on a pool of threads, within the rate limit of the host.
+        See :meth:`search` for the criteria.
+        :param page_size: How many novels to request per page. The host may return less.
+        :param workers: How many pages may be requested at the same time.
+        :param bulk: Whether to only decode the fields needed to pick novels (:class:`WuxiaWorldComSearchSummary`).
+        :return: A generator that yields all matched novels in order.
+        """
+        self.log.warning("This method violates robots.txt.")
+        criteria = (title, tags, genres, status, sort_by, sort_asc)
+        entries, total = self._search_results(self._search_page(self._search_payload(*criteria, None, page_size)), bulk)
+        yield from entries
+        offsets = self._page_offsets(len(entries), total)
+        if len(offsets) == 0:
+            return
+        executor = ThreadPoolExecutor(max_workers=max(1, min(workers, len(offsets))), thread_name_prefix='search')
+        pages = [
+            executor.submit(self._search_page, self._search_payload(*criteria, offset, len(entries)))
+            for offset in offsets
+        ]
+        try:
+            for page in pages:
+                yield from self._search_results(page.result(), bulk)[0]
+        finally:
+            for page in pages:
+                page.cancel()
+            executor.shutdown(wait=True)
+
+    def _search_page(self, payload: str) -> dict:
+        """
+        Requests a page of search results, unless it got requested within the search ttl.
+        The http cache gets bypassed, as the results change over time.
+        The session cookie gets fetched first if necessary. :meth:`iter_search` requests the first page on its own,
+        so the pages requested at the same time find the cookie.
+        :param payload: The search payload.
+        :return: The json data of the page.
+        """
+        data = self._search_cache.get(payload)
+        if data is not None:
+            self.log.debug("Search results are cached.")
+            return data
         self.fetch_session_cookie_if_necessary()
-        self.check_wait_condition()
-        if isinstance(self.adapter, CacheAdapter):
-            self.adapter.use_cache = False
-        response = self._browser.post("https://www.wuxiaworld.com/api/novels/search", headers={
-            'Accept': 'application/json, text/plain, */*',
-            'Content-Type': 'application/json;charset=utf-8',
-            'Upgrade-Insecure-Requests': None,
-        }, data=json.dumps({
-            "title": title,
-            "tags": list(map(lambda tag: tag.value, tags)),
-            "genres": list(map(lambda genre: genre.value, genres)),
-            "active": status.value,
-            "sortType": sort_by.value,
-            "sortAsc": sort_asc,
-            "searchAfter": search_after,
-            "count": count,
-        }, separators=(',', ':')))
-        if isinstance(self.adapter, CacheAdapter):
-            self.adapter.use_cache = True
-        self._last_request_timestamp = datetime.now()
+        response = self._request('post', self.SEARCH_URL, headers=self._uncached_headers(self.SEARCH_HEADERS),
+                                 data=payload)
         data = response.json()
-        assert data['result']
-        entries = []
-        for item in data['items']:
-            entries.append(WuxiaWorldComSearchEntry(item))
-        return entries, int(data['total'])
+        self._search_cache.put(payload, data)
+        return data
 
     def fetch_session_cookie_if_necessary(self):
         if not self._browser.session.cookies.get('__cfduid'):
-            self.check_wait_condition()
-            if isinstance(self.adapter, CacheAdapter):
-                self.adapter.use_cache = False
-            self._browser.navigate('https://www.wuxiaworld.com')
-            if isinstance(self.adapter, CacheAdapter):
-                self.adapter.use_cache = True
+            self._request('navigate', 'https://www.wuxiaworld.com', headers=self._uncached_headers())
         # assert self._browser.session.cookies.get('__cfduid')  # Messes up tests with cache that don't store headers
 
     def login(self, email: str, password: str, remember: bool = False) -> bool:
@@ -446,10 +651,8 @@ class WuxiaWorldComApi(WuxiaWorldCom, LightNovelApi):
         :return: True if the login succeeded, otherwise False.
         """
         self.fetch_session_cookie_if_necessary()
-        self.check_wait_condition()
-        if isinstance(self.adapter, CacheAdapter):
-            self.adapter.use_cache = False
-        login_page = self._get_document(parse_url("https://www.wuxiaworld.com/account/login"))
+        login_page = self._get_document(parse_url("https://www.wuxiaworld.com/account/login"),
+                                        headers=self._uncached_headers())
         rvt_input = login_page.select_one('input[name="__RequestVerificationToken"]')
         if not isinstance(rvt_input, Tag):
             raise Exception("Unexpected type of request verification token")
@@ -460,13 +663,9 @@ class WuxiaWorldComApi(WuxiaWorldCom, LightNovelApi):
             ('__RequestVerificationToken', rvt_input.get('value')),
             ('RememberMe', 'false')
         ]
-        self.check_wait_condition()
-        response = self._browser.post('https://www.wuxiaworld.com/account/login', headers={
+        response = self._request('post', 'https://www.wuxiaworld.com/account/login', headers=self._uncached_headers({
             'Content-Type': 'application/x-www-form-urlencoded'
-        }, data=encode_form_data(data))
-        if isinstance(self.adapter, CacheAdapter):
-            self.adapter.use_cache = True
-        self._last_request_timestamp = datetime.now()
+        }), data=encode_form_data(data))
         response.raise_for_status()
         return 200 <= response.status_code < 300
 
@@ -476,12 +675,10 @@ class WuxiaWorldComApi(WuxiaWorldCom, LightNovelApi):
         :return: True if the logout succeeded, otherwise False.
         """
         self.fetch_session_cookie_if_necessary()
-        self.check_wait_condition()
-        response = self._browser.post('https://www.wuxiaworld.com/account/logout', headers={
+        response = self._request('post', 'https://www.wuxiaworld.com/account/logout', headers={
             'Accept': 'application/json, text/plain, */*',
             'Upgrade-Insecure-Requests': None,
         }, data='')
-        self._last_request_timestamp = datetime.now()
         response.raise_for_status()
         return 200 <= response.status_code < 300
 
@@ -491,11 +688,8 @@ class WuxiaWorldComApi(WuxiaWorldCom, LightNovelApi):
         :return: A tuple of the karma (normal and gold karma)
         """
         self.fetch_session_cookie_if_necessary()
-        if isinstance(self.adapter, CacheAdapter):
-            self.adapter.use_cache = False
-        karma_page = self._get_document(parse_url("https://www.wuxiaworld.com/profile/karma"))
-        if isinstance(self.adapter, CacheAdapter):
-            self.adapter.use_cache = True
+        karma_page = self._get_document(parse_url("https://www.wuxiaworld.com/profile/karma"),
+                                        headers=self._uncached_headers())
         karma_table = karma_page.select_one("div.table-responsive table tbody")
         if not isinstance(karma_table, Tag):
             raise Exception("Unexpected type of table query")
@@ -510,11 +704,8 @@ class WuxiaWorldComApi(WuxiaWorldCom, LightNovelApi):
 
     def claim_daily_karma(self) -> bool:
         self.fetch_session_cookie_if_necessary()
-        if isinstance(self.adapter, CacheAdapter):
-            self.adapter.use_cache = False
-        mission_page = self._get_document(parse_url("https://www.wuxiaworld.com/profile/missions"))
-        if isinstance(self.adapter, CacheAdapter):
-            self.adapter.use_cache = True
+        mission_page = self._get_document(parse_url("https://www.wuxiaworld.com/profile/missions"),
+                                          headers=self._uncached_headers())
         rvt_input = mission_page.select_one('input[name="__RequestVerificationToken"]')
         if not isinstance(rvt_input, Tag):
             raise Exception("Unexpected type of request verification token")
@@ -524,10 +715,90 @@ class WuxiaWorldComApi(WuxiaWorldCom, LightNovelApi):
             ('Type', 'Login'),
             ('__RequestVerificationToken', rvt_input.get('value')),
         ]
-        self.check_wait_condition()
-        response = self._browser.post('https://www.wuxiaworld.com/profile/missions', headers={
+        response = self._request('post', 'https://www.wuxiaworld.com/profile/missions', headers={
             'Content-Type': 'application/x-www-form-urlencoded'
         }, data=encode_form_data(data))
-        self._last_request_timestamp = datetime.now()
         response.raise_for_status()
         return 200 <= response.status_code < 300
+
+
+class AsyncWuxiaWorldComApi(WuxiaWorldCom, AsyncLightNovelApi):
+    def __init__(self, *args, search_ttl: timedelta = timedelta(0), **kwargs):
+        """
+        Creates a new api for wuxiaworld.com. See :meth:`AsyncLightNovelApi.__init__` for the other parameters.
+        :param search_ttl: How long pages of search results are kept in memory, i.e. to page through the catalogue
+            several times. By default they aren't kept, so every search gets the current results.
+        """
+        super().__init__(*args, **kwargs)
+        self._search_cache = TtlCache(search_ttl)
+
+    async def get_novel(self, url: Url) -> WuxiaWorldComNovel:
+        return WuxiaWorldComNovel(url, await self._get_document(url, page_class=WuxiaWorldComNovel))
+
+    async def get_chapter(self, url: Url) -> WuxiaWorldComChapter:
+        return WuxiaWorldComChapter(url, await self._get_document(url, page_class=WuxiaWorldComChapter))
+
+    async def search(
+            self,
+            title: str = '',
+            tags: Tuple[NovelTag] = (),
+            genres: Tuple[Genre] = (),
+            status: Status = Status.ANY,
+            sort_by: SortType = SortType.NAME,
+            sort_asc: bool = True,
+            search_after: int = None,
+            count: int = 15,
+            bulk: bool = False) -> Tuple[List[Union[WuxiaWorldComSearchEntry, WuxiaWorldComSearchSummary]], int]:
+        """Searches for novels matching certain criteria. Violates robots.txt
+
+        See :meth:`WuxiaWorldComApi.search` for the parameters.
+        """
+        self.log.warning("This method violates robots.txt.")
+        payload = self._search_payload(title, tags, genres, status, sort_by, sort_asc, search_after, count)
+        return await self._run_blocking(self._search_results, await self._search_page(payload), bulk)
+
+    async def iter_search(
+            self,
+            title: str = '',
+            tags: Tuple[NovelTag] = (),
+            genres: Tuple[Genre] = (),
+            status: Status = Status.ANY,
+            sort_by: SortType = SortType.NAME,
+            sort_asc: bool = True,
+            page_size: int = 50,
+            workers: int = 4,
+            bulk: bool = False
+    ) -> AsyncGenerator[Union[WuxiaWorldComSearchEntry, WuxiaWorldComSearchSummary], None]:
+        """Searches for all novels matching certain criteria, page by page. Violates robots.txt
+
+        See :meth:`WuxiaWorldComApi.iter_search` for the parameters.
+        """
+        self.log.warning("This method violates robots.txt.")
+        criteria = (title, tags, genres, status, sort_by, sort_asc)
+        first_page = await self._search_page(self._search_payload(*criteria, None, page_size))
+        entries, total = await self._run_blocking(self._search_results, first_page, bulk)
+        for entry in entries:
+            yield entry
+        semaphore = asyncio.Semaphore(max(1, workers))
+
+        async def request_page(offset: int) -> dict:
+            async with semaphore:
+                return await self._search_page(self._search_payload(*criteria, offset, len(entries)))
+
+        pages = [asyncio.ensure_future(request_page(offset)) for offset in self._page_offsets(len(entries), total)]
+        try:
+            for page in pages:
+                for entry in (await self._run_blocking(self._search_results, await page, bulk))[0]:
+                    yield entry
+        finally:
+            for page in pages:
+                page.cancel()
+
+    async def _search_page(self, payload: str) -> dict:
+        """Requests a page of search results, unless it got requested within the search ttl."""
+        data = self._search_cache.get(payload)
+        if data is None:
+            response = await self._request('POST', self.SEARCH_URL, headers=self.SEARCH_HEADERS, data=payload)
+            data = response.json()
+            self._search_cache.put(payload, data)
+        return data
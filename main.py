@@ -1,6 +1,7 @@
 import logging
 
 from pipeline import EpubMaker, Parser, DeleteChapters
+from scheduler import CrawlScheduler
 from webot import Firefox
 from webot.adapter import CacheAdapter
 from wuxiaworld_com import WuxiaWorldComApi
@@ -18,15 +19,19 @@ logging.getLogger("urllib3").setLevel(logging.ERROR)
 logging.getLogger('chardet.charsetprober').setLevel(logging.ERROR)
 log = logging.getLogger(__name__)
 
+
 # Set it
-browser = Firefox()
-browser._accept_encoding = ['deflate', 'gzip']  # brotli (br) is cumbersome
-cache = CacheAdapter()
-browser.session.mount('https://', cache)
-browser.session.mount('http://', cache)
+def make_browser():
+    browser = Firefox()
+    browser._accept_encoding = ['deflate', 'gzip']  # brotli (br) is cumbersome
+    cache = CacheAdapter()
+    browser.session.mount('https://', cache)
+    browser.session.mount('http://', cache)
+    return browser
+
 
 # Make it
-api = WuxiaWorldComApi(browser)
+api = WuxiaWorldComApi(make_browser())
 
 # print(f"Login successful: {api.login(EMAIL, PASSWORD)}")
 # karma_normal, karma_golden = api.get_karma()
@@ -36,9 +41,7 @@ api = WuxiaWorldComApi(browser)
 # print(f"Karma: {karma_normal} normal, {karma_golden} golden")
 # print(f"Logout successful: {api.logout()}")
 
-lst, n = api.search(count=200)
-if n > len(lst):
-    print(f"Not all matches returned. {n} Matches search, but only {len(lst)} got returned.")
+lst = list(api.iter_search(page_size=200, bulk=True))
 # URLS = [
 #     # 'https://www.wuxiaworld.com/novel/warlock-of-the-magus-world',
 #     # 'https://www.wuxiaworld.com/novel/heavenly-jewel-change',
@@ -57,25 +60,40 @@ if n > len(lst):
 #     # 'https://www.wuxiaworld.com/novel/perfect-world'
 #     'https://www.wuxiaworld.com/novel/the-unrivaled-tang-sect'
 # ]
+
+
 newly_fetched = {}
-urls = list(map(lambda i: i.url, lst[16:]))
-for url in urls:
-    # Rip,
-    novel, gen = api.get_entire_novel(url)
-    if not novel.success:
-        log.error("Failed getting novel")
-        continue
+
+
+def count_new_chapters(novel_api, novel, gen):
     newly_fetched[novel.title] = 0
+    for book, chapter in gen:
+        # Chapters get downloaded on the thread advancing the novel, just before they are yielded.
+        if not novel_api.adapter.hit:
+            newly_fetched[novel.title] += 1
+        yield book, chapter
+
 
-    # Export it
-    gen = Parser(api.browser).wrap(gen)
+def make_pipeline(novel_api, novel, gen):
+    gen = count_new_chapters(novel_api, novel, gen)
+    gen = Parser(novel_api.browser).wrap(gen)
     # gen = HtmlCleaner().wrap(gen)
     # gen = ChapterConflation(novel).wrap(gen)
     gen = EpubMaker(novel).wrap(gen)
-    gen = DeleteChapters().wrap(gen)
-    for _ in gen:
-        if not cache.hit:
-            newly_fetched[novel.title] += 1
+    return DeleteChapters().wrap(gen)
+
+
+# Rip it, novels side by side
+# Every novel gets its own api and browser, as they are advanced on different threads
+scheduler = CrawlScheduler(make_pipeline, api_factory=lambda url: WuxiaWorldComApi(make_browser()), workers=4,
+                           per_host=2)
+for entry in lst[16:]:
+    scheduler.add(str(entry.url))
+jobs = scheduler.run()
+
+print("Chapters:")
+for job in jobs:
+    print(job)
 
 print("New chapters:")
 for title, amount in newly_fetched.items():
@@ -1,6 +1,18 @@
+import random
+import time
 import unittest
+from datetime import timedelta
+from typing import Tuple
 
-from lightnovel import LightNovelApi
+from bs4 import BeautifulSoup
+from requests import HTTPError, Response
+from requests.adapters import BaseAdapter
+from urllib3.util import Url
+
+from lightnovel import LightNovelApi, Novel, Book, ChapterEntry, ChapterRow, ChapterTable, Chapter, ChapterSummary, \
+    ChapterConflation, ProgressTracker
+from lightnovel.store import PageStore, ProgressStore
+from lightnovel.util.ratelimit import RateLimiter
 from webot import Firefox
 
 
@@ -12,3 +24,358 @@ class ApiFactoryTest(unittest.TestCase):
     def test_wuxiaworld(self):
         api = LightNovelApi.get_api('www.wuxiaworld.com', Firefox())
         self.assertIsNotNone(api)
+
+
+class ChapterTableTest(unittest.TestCase):
+    BASE = Url('https', host='localhost')
+
+    def make_table(self, count: int) -> ChapterTable:
+        table = ChapterTable(self.BASE)
+        for i in range(1, count + 1):
+            table.add(f"/novel/{i}", f"Chapter {i}")
+        return table
+
+    def test_creates_entries_on_access(self):
+        table = self.make_table(3)
+        self.assertEqual({}, table._entries)
+        entry = table[1]
+        self.assertIsInstance(entry, ChapterEntry)
+        self.assertEqual('https://localhost/novel/2', str(entry.url))
+        self.assertEqual('Chapter 2', entry.title)
+        self.assertEqual(2, entry.index)
+        self.assertIs(entry, table[-2])
+        self.assertEqual([1], list(table._entries))
+        with self.assertRaises(IndexError):
+            _ = table[3]
+
+    def test_enumerates_rows_without_entries(self):
+        novel = Novel(Url('https', host='localhost', path='/novel'), BeautifulSoup('', 'html.parser'))
+        novel._books = [Book('Book 1'), Book('Book 2')]
+        novel._books[0].chapter_entries = self.make_table(2)
+        novel._books[1].chapter_entries = self.make_table(1)
+        rows = [entry for _, entry in novel.enumerate_chapter_entries(rows=True)]
+        self.assertTrue(all(isinstance(row, ChapterRow) for row in rows))
+        self.assertEqual([(1, 1, 1), (1, 2, 2), (2, 1, 3)], [(r.book_number, r.index, r.abs_index) for r in rows])
+        self.assertEqual('https://localhost/novel/2', str(rows[1].url))
+        self.assertEqual({}, novel._books[0].chapter_entries._entries)
+        entries = [entry for _, entry in novel.enumerate_chapter_entries()]
+        self.assertTrue(all(isinstance(entry, ChapterEntry) for entry in entries))
+        self.assertEqual([1, 2, 1], [entry.index for entry in entries])
+        self.assertEqual(3, entries[2].abs_index)
+
+    def test_keeps_appended_entries(self):
+        table = ChapterTable()
+        entry = ChapterEntry(Url('https', host='localhost', path='/novel/1'), "Chapter 1")
+        table.append(entry)
+        table.number(2, 5)
+        self.assertIs(entry, table[0])
+        self.assertEqual(5, entry.abs_index)
+        self.assertEqual(ChapterRow(entry.url, '/novel/1', 'Chapter 1', 2, 1, 5), table.row(0))
+
+    def test_adding_by_path_requires_base(self):
+        with self.assertRaisesRegex(Exception, 'no base url'):
+            ChapterTable().add('/novel/1', "Chapter 1")
+
+
+class ChapterListTest(unittest.TestCase):
+    def test_keeps_order_while_removing(self):
+        chapters = [DummyChapter(Url('https', host='localhost', path=f"/novel/{i}"), None) for i in range(5)]
+        book = Book('Book 1')
+        for chapter in chapters:
+            book.chapters.append(chapter)
+        book.chapters.remove(chapters[2])
+        book.chapters.discard(chapters[2])
+        self.assertEqual([chapters[0], chapters[1], chapters[3], chapters[4]], list(book.chapters))
+        self.assertEqual(4, len(book.chapters))
+        self.assertNotIn(chapters[2], book.chapters)
+        self.assertIs(chapters[3], book.chapters[2])
+        self.assertIs(chapters[4], book.chapters[-1])
+        with self.assertRaises(ValueError):
+            book.chapters.remove(chapters[2])
+        with self.assertRaises(IndexError):
+            _ = book.chapters[4]
+        copy = book.chapters.copy()
+        copy.remove(chapters[0])
+        self.assertIn(chapters[0], book.chapters)
+
+    def test_released_chapters_leave_summaries(self):
+        book = Book('Book 1')
+        chapter = DummyChapter(Url('https', host='localhost', path='/novel/1'), None)
+        chapter._book = book
+        chapter._title = 'Chapter 1 - Arrival'
+        chapter._next_chapter_path = '/novel/2'
+        chapter.index = chapter.abs_index = 1
+        chapter._content_html = '<div><p>Text</p></div>'
+        book.chapters.append(chapter)
+        chapter.add_output_path('out/novel.md')
+        summary = chapter.release()
+        self.assertEqual(ChapterSummary('https://localhost/novel/1', 1, 1, 'Arrival', ('out/novel.md',)), summary)
+        self.assertTrue(chapter.released)
+        self.assertEqual('', chapter.content_html)
+        self.assertEqual('https://localhost/novel/2', str(chapter.next_chapter))
+        self.assertEqual(0, len(book.chapters))
+        self.assertEqual([summary], book.summaries)
+
+
+class DummyChapter(Chapter):
+    def parse(self) -> bool:
+        return True
+
+
+class DummyApi(LightNovelApi):
+    _hostname = 'localhost'
+
+    def get_chapter(self, url: Url) -> Chapter:
+        self.rate_limiter.acquire(url.host)
+        time.sleep(random.uniform(0.0, 0.02))
+        return DummyChapter(url, BeautifulSoup('', 'html.parser'))
+
+
+def make_dummy_novel(chapter_count: int) -> Novel:
+    novel = Novel(Url('https', host='localhost', path='/novel'), BeautifulSoup('', 'html.parser'))
+    book = Book('Book 1')
+    book.novel = novel
+    for i in range(1, chapter_count + 1):
+        book.chapter_entries.append(ChapterEntry(Url('https', host='localhost', path=f"/novel/{i}"), f"Chapter {i}"))
+    novel._books = [book]
+    return novel
+
+
+class PrefetchTest(unittest.TestCase):
+    def test_prefetch_keeps_order(self):
+        api = DummyApi(Firefox(), delay=timedelta(seconds=0), rate_limiter=RateLimiter())
+        novel = make_dummy_novel(20)
+        paths = [chapter.url.path for _, chapter in api.get_all_chapters(novel, prefetch=5, workers=3)]
+        self.assertEqual([f"/novel/{i}" for i in range(1, 21)], paths)
+
+    def test_prefetch_matches_sequential(self):
+        api = DummyApi(Firefox(), delay=timedelta(seconds=0), rate_limiter=RateLimiter())
+        novel = make_dummy_novel(7)
+        sequential = [(book.title, chapter.index) for book, chapter in api.get_all_chapters(novel)]
+        prefetched = [(book.title, chapter.index) for book, chapter in api.get_all_chapters(novel, prefetch=3)]
+        self.assertEqual(sequential, prefetched)
+
+    def test_prefetch_respects_delay(self):
+        api = DummyApi(Firefox(), delay=timedelta(seconds=0.05), rate_limiter=RateLimiter())
+        novel = make_dummy_novel(5)
+        start = time.time()
+        list(api.get_all_chapters(novel, prefetch=5, workers=5))
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+
+class SerialApi(DummyApi):
+    """Serves chapters /novel/1 to /novel/<published> that link to their next chapter."""
+
+    def __init__(self, published: int):
+        super().__init__(Firefox(), delay=timedelta(seconds=0), rate_limiter=RateLimiter())
+        self.published = published
+        self.requested = []
+
+    def get_chapter(self, url: Url) -> Chapter:
+        self.requested.append(url.path)
+        chapter = DummyChapter(url, BeautifulSoup('', 'html.parser'))
+        number = int(url.path.rsplit('/', 1)[-1])
+        chapter._next_chapter_path = f"/novel/{number + 1}" if number < self.published else None
+        chapter._success = True
+        return chapter
+
+
+class UpdateTest(unittest.TestCase):
+    NOVEL_URL = 'https://localhost/novel'
+
+    def run_update(self, api: SerialApi, novel: Novel, store: ProgressStore) -> list:
+        gen = api.get_all_chapters(novel, since=store.get(self.NOVEL_URL))
+        gen = ProgressTracker(novel, store).wrap(gen)
+        return [chapter.url.path for _, chapter in gen]
+
+    def test_enumerates_absolute_index(self):
+        novel = make_dummy_novel(3)
+        second_book = Book('Book 2')
+        second_book.chapter_entries.append(ChapterEntry(Url('https', host='localhost', path='/novel/4'), "Chapter 4"))
+        novel._books.append(second_book)
+        self.assertEqual([1, 2, 3, 1], [entry.index for _, entry in novel.enumerate_chapter_entries()])
+        self.assertEqual([1, 2, 3, 4], [entry.abs_index for _, entry in novel.enumerate_chapter_entries()])
+
+    def test_records_progress(self):
+        store = ProgressStore()
+        api = SerialApi(5)
+        self.assertEqual([f"/novel/{i}" for i in range(1, 6)], self.run_update(api, make_dummy_novel(3), store))
+        progress = store.get(self.NOVEL_URL)
+        self.assertEqual((1, 5, 5, 'https://localhost/novel/5', None), (
+            progress.book_index, progress.chapter_index, progress.abs_index, progress.chapter_url, progress.next_path
+        ))
+
+    def test_follows_new_link_of_last_chapter(self):
+        store = ProgressStore()
+        self.run_update(SerialApi(5), make_dummy_novel(3), store)
+        api = SerialApi(7)
+        self.assertEqual(['/novel/6', '/novel/7'], self.run_update(api, make_dummy_novel(3), store))
+        self.assertEqual(['/novel/5', '/novel/6', '/novel/7'], api.requested)
+        self.assertEqual(7, store.get(self.NOVEL_URL).abs_index)
+
+    def test_skips_processed_entries(self):
+        store = ProgressStore()
+        self.run_update(SerialApi(5), make_dummy_novel(3), store)
+        api = SerialApi(8)
+        self.assertEqual(['/novel/6', '/novel/7', '/novel/8'], self.run_update(api, make_dummy_novel(7), store))
+        self.assertEqual(['/novel/6', '/novel/7', '/novel/8'], api.requested)
+
+    def test_nothing_new(self):
+        store = ProgressStore()
+        self.run_update(SerialApi(5), make_dummy_novel(3), store)
+        api = SerialApi(5)
+        self.assertEqual([], self.run_update(api, make_dummy_novel(3), store))
+        self.assertEqual(['/novel/5'], api.requested)
+
+    def run_conflated_update(self, api: SerialApi, novel: Novel, store: ProgressStore) -> list:
+        def attach(gen):
+            for book, chapter in gen:
+                # Every chapter got published in two parts with the same title
+                chapter._title = ['Arrival', 'Departure', 'Return'][(chapter.abs_index - 1) // 2]
+                chapter._book = book
+                book.chapters.append(chapter)
+                yield book, chapter
+
+        gen = api.get_all_chapters(novel, since=store.get(self.NOVEL_URL))
+        gen = ProgressTracker(novel, store).wrap(ChapterConflation(novel).wrap(attach(gen)))
+        return [chapter.url.path for _, chapter in gen]
+
+    def test_skips_entries_of_conflated_parts(self):
+        store = ProgressStore()
+        self.assertEqual(['/novel/2', '/novel/4'], self.run_conflated_update(SerialApi(4), make_dummy_novel(4), store))
+        self.assertEqual((4, 'https://localhost/novel/4'),
+                         (store.get(self.NOVEL_URL).abs_index, store.get(self.NOVEL_URL).chapter_url))
+        api = SerialApi(6)
+        self.assertEqual(['/novel/6'], self.run_conflated_update(api, make_dummy_novel(6), store))
+        self.assertEqual(['/novel/5', '/novel/6'], api.requested)
+
+    def test_follows_link_of_last_conflated_part(self):
+        store = ProgressStore()
+        self.run_conflated_update(SerialApi(4), make_dummy_novel(3), store)
+        api = SerialApi(6)
+        self.assertEqual(['/novel/6'], self.run_conflated_update(api, make_dummy_novel(3), store))
+        self.assertEqual(['/novel/4', '/novel/5', '/novel/6'], api.requested)
+        self.assertEqual(6, store.get(self.NOVEL_URL).abs_index)
+
+
+class SpeculationTest(unittest.TestCase):
+    def test_follows_links_in_order(self):
+        api = SerialApi(8)
+        paths = [chapter.url.path for _, chapter in api.get_all_chapters(make_dummy_novel(2), prefetch=2)]
+        self.assertEqual([f"/novel/{i}" for i in range(1, 9)], paths)
+        self.assertEqual([i for i in range(1, 9)], [int(path.rsplit('/', 1)[-1]) for path in api.requested])
+
+    def test_downloads_next_chapter_while_consuming(self):
+        api = SerialApi(4)
+        gen = api.get_all_chapters(make_dummy_novel(1), prefetch=1)
+        next(gen)
+        _, chapter = next(gen)
+        self.assertEqual('/novel/2', chapter.url.path)
+        deadline = time.time() + 5
+        while '/novel/3' not in api.requested and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertIn('/novel/3', api.requested)
+        gen.close()
+
+    def test_drops_wrong_speculation(self):
+        api = SerialApi(4)
+        gen = api.get_all_chapters(make_dummy_novel(1), prefetch=1)
+        next(gen)
+        _, chapter = next(gen)
+        chapter._next_chapter_path = '/novel/4'
+        self.assertEqual(['/novel/4'], [chapter.url.path for _, chapter in gen])
+
+
+class ScriptedAdapter(BaseAdapter):
+    """Answers the requests with the given status codes, one after another."""
+
+    def __init__(self, *status_codes: int):
+        super().__init__()
+        self.status_codes = list(status_codes)
+        self.requests = 0
+
+    def send(self, request, **kwargs) -> Response:
+        self.requests += 1
+        response = Response()
+        response.status_code = self.status_codes.pop(0)
+        response.headers['Retry-After'] = '0'
+        response._content = b'<html><head></head><body></body></html>'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class BackoffTest(unittest.TestCase):
+    def make_api(self, *status_codes: int) -> Tuple[DummyApi, ScriptedAdapter]:
+        browser = Firefox()
+        adapter = ScriptedAdapter(*status_codes)
+        browser.session.mount('https://', adapter)
+        return DummyApi(browser, delay=timedelta(seconds=0), rate_limiter=RateLimiter()), adapter
+
+    def test_retries_rejected_get(self):
+        api, adapter = self.make_api(429, 503, 200)
+        document = api._get_document(Url('https', host='localhost', path='/novel'))
+        self.assertIsNotNone(document.select_one('body'))
+        self.assertEqual(3, adapter.requests)
+
+    def test_gives_up_after_max_retries(self):
+        api, adapter = self.make_api(503, 503, 503)
+        api.max_retries = 2
+        with self.assertRaises(HTTPError):
+            api._get_document(Url('https', host='localhost', path='/novel'))
+        self.assertEqual(3, adapter.requests)
+
+    def test_does_not_retry_post(self):
+        api, adapter = self.make_api(429, 200)
+        with self.assertRaises(HTTPError):
+            api._request('post', 'https://localhost/api')
+        self.assertEqual(1, adapter.requests)
+
+    def test_new_api_keeps_penalty(self):
+        limiter = RateLimiter()
+        DummyApi(Firefox(), delay=timedelta(seconds=0.5), rate_limiter=limiter)
+        limiter.penalize('localhost', 1.0)
+        DummyApi(Firefox(), rate_limiter=limiter)
+        self.assertEqual(1.0, limiter.bucket('localhost').rate)
+        self.assertEqual(2.0, limiter.bucket('localhost').max_rate)
+
+
+class RevalidatingAdapter(BaseAdapter):
+    """Serves a page with an ETag and answers matching conditional requests with 304 Not Modified."""
+
+    def __init__(self):
+        super().__init__()
+        self.status_codes = []
+
+    def send(self, request, **kwargs) -> Response:
+        response = Response()
+        if request.headers.get('If-None-Match') == '"v1"':
+            response.status_code = 304
+            response._content = b''
+        else:
+            response.status_code = 200
+            response.headers['ETag'] = '"v1"'
+            response._content = b'<html><head><title>Stored</title></head><body></body></html>'
+        self.status_codes.append(response.status_code)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class RevalidationTest(unittest.TestCase):
+    def test_not_modified_reuses_stored_page(self):
+        browser = Firefox()
+        adapter = RevalidatingAdapter()
+        browser.session.mount('https://', adapter)
+        api = DummyApi(browser, delay=timedelta(seconds=0), rate_limiter=RateLimiter(), page_store=PageStore())
+        url = Url('https', host='localhost', path='/novel')
+        self.assertEqual('Stored', api._get_page(url).title.text)
+        api.refresh = True
+        self.assertEqual('Stored', api._get_page(url).title.text)
+        self.assertEqual([200, 304], adapter.status_codes)
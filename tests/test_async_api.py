@@ -0,0 +1,170 @@
+import asyncio
+import base64
+import json
+import threading
+import unittest
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Union
+
+from urllib3.util import parse_url
+
+from lightnovel import StreamTransport, AsyncResponse
+from lightnovel.util.ratelimit import RateLimiter
+from lightnovel.wuxiaworld_com import AsyncWuxiaWorldComApi, WuxiaWorldComNovel, WuxiaWorldComChapter
+from tests.config import Har, resolve_path
+
+
+def serve_har(har_path) -> ThreadingHTTPServer:
+    """Starts a local http server which answers with the responses recorded in a har file."""
+    with open(resolve_path(har_path), 'r', encoding='utf-8') as fp:
+        entries = json.load(fp)['log']['entries']
+    responses = {}
+    for entry in entries:
+        request_url = parse_url(entry['request']['url'])
+        key = (entry['request']['method'], request_url.request_uri)
+        if key not in responses and entry['response']['content'].get('text'):
+            responses[key] = entry['response']
+
+    class HarHandler(BaseHTTPRequestHandler):
+        def _respond(self, method: str):
+            response = responses.get((method, self.path))
+            if response is None:
+                self.send_error(404)
+                return
+            content = response['content']
+            if content.get('encoding') == 'base64':
+                body = base64.b64decode(content.get('text', ''))
+            else:
+                body = content.get('text', '').encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', content.get('mimeType', 'text/html'))
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._respond('GET')
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self._respond('POST')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), HarHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class LocalTransport(StreamTransport):
+    """Sends every request to the local stub server instead of the actual host."""
+
+    def __init__(self, port: int):
+        super().__init__()
+        self.port = port
+        self.requested = []
+
+    async def request(self, method: str, url: str, headers: Dict[str, str] = None,
+                      data: Union[str, bytes] = None) -> AsyncResponse:
+        self.requested.append(url)
+        local_url = f"http://127.0.0.1:{self.port}{parse_url(url).request_uri}"
+        return await super().request(method, local_url, headers, data)
+
+
+# noinspection SpellCheckingInspection
+class AsyncWuxiaWorldComApiTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = serve_har(Har.WW_HJC_COVER_C1_2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def make_api(self) -> AsyncWuxiaWorldComApi:
+        return AsyncWuxiaWorldComApi(LocalTransport(self.server.server_address[1]), delay=timedelta(seconds=0),
+                                     rate_limiter=RateLimiter())
+
+    def test_get_novel(self):
+        async def run():
+            novel = await self.make_api().get_novel(
+                parse_url('https://www.wuxiaworld.com/novel/heavenly-jewel-change'))
+            self.assertTrue(isinstance(novel, WuxiaWorldComNovel))
+            self.assertTrue(novel.parse())
+            self.assertEqual('Heavenly Jewel Change', novel.title)
+
+        asyncio.run(run())
+
+    def test_get_chapter(self):
+        async def run():
+            chapter = await self.make_api().get_chapter(
+                parse_url('https://www.wuxiaworld.com/novel/heavenly-jewel-change/hjc-book-1-chapter-1-01'))
+            self.assertTrue(isinstance(chapter, WuxiaWorldComChapter))
+            self.assertTrue(chapter.parse())
+            self.assertEqual('/novel/heavenly-jewel-change/hjc-book-1-chapter-1-02', chapter.next_chapter.path)
+
+        asyncio.run(run())
+
+    def test_get_entire_novel(self):
+        async def run():
+            api = self.make_api()
+            novel, gen = await api.get_entire_novel(
+                parse_url('https://www.wuxiaworld.com/novel/heavenly-jewel-change'))
+            self.assertTrue(novel.success)
+            self.assertIsNotNone(novel.cover)
+            paths = []
+            async for book, chapter in gen:
+                self.assertTrue(chapter.success)
+                paths.append(chapter.url.path)
+                if len(paths) == 2:
+                    break
+            await gen.aclose()
+            self.assertEqual([
+                '/novel/heavenly-jewel-change/hjc-book-1-chapter-1-01',
+                '/novel/heavenly-jewel-change/hjc-book-1-chapter-1-02',
+            ], paths)
+
+        asyncio.run(run())
+
+    def test_concurrent_requests(self):
+        async def run():
+            api = self.make_api()
+            url = parse_url('https://www.wuxiaworld.com/novel/heavenly-jewel-change/hjc-book-1-chapter-1-01')
+            chapters = await asyncio.gather(*[api.get_chapter(url) for _ in range(4)])
+            self.assertEqual(4, len(chapters))
+            self.assertEqual(4, len(api.transport.requested))
+
+        asyncio.run(run())
+
+
+class AsyncWuxiaWorldComApiSearchTest(unittest.TestCase):
+    def test_search_default(self):
+        server = serve_har(Har.WW_SEARCH_DEFAULT)
+        try:
+            api = AsyncWuxiaWorldComApi(LocalTransport(server.server_address[1]), delay=timedelta(seconds=0),
+                                        rate_limiter=RateLimiter())
+            results, n = asyncio.run(api.search())
+            self.assertEqual(15, len(results))
+            self.assertEqual(59, n)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_iter_search(self):
+        server = serve_har(Har.WW_SEARCH_DEFAULT)
+        try:
+            api = AsyncWuxiaWorldComApi(LocalTransport(server.server_address[1]), delay=timedelta(seconds=0),
+                                        rate_limiter=RateLimiter(), search_ttl=timedelta(minutes=10))
+
+            async def scan():
+                return [entry async for entry in api.iter_search(page_size=15, bulk=True)]
+
+            # The recording answers every page with the first 15 of 59 novels.
+            self.assertEqual(60, len(asyncio.run(scan())))
+            self.assertEqual(4, len(api._search_cache))
+        finally:
+            server.shutdown()
+            server.server_close()
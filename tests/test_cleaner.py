@@ -0,0 +1,41 @@
+import unittest
+
+from bs4 import BeautifulSoup
+
+from lightnovel.cleaner import CleaningRules, ContentCleaner
+
+
+class ContentCleanerTest(unittest.TestCase):
+    MARKUP = '''<div class="fr-view" id="content">
+<p><a href="/prev">Previous Chapter</a></p>
+<p>Before</p>
+<p>Chapter 5 – The Title</p>
+<p> </p>
+<p>Text with <a href="/x" class="y">a link</a> and <font color="red">a font</font>.</p>
+<hr>
+<blockquote>Quoted <b>words</b><br>on two lines</blockquote>
+<a href="/next">Next Chapter</a>
+</div>'''
+
+    def clean(self, rules: CleaningRules = CleaningRules(), markup: str = MARKUP):
+        document = BeautifulSoup(markup, 'html.parser')
+        content = ContentCleaner(rules).clean(document.find('div'), 'The Title')
+        self.assertIsNone(content.parent)
+        return content
+
+    def test_clean(self):
+        self.assertEqual(
+            '<div><p>Text with <a>a link</a> and <span color="red">a font</span>.</p><hr/>'
+            '<blockquote><p>Quoted <b>words</b><br/>on two lines</p></blockquote></div>',
+            str(self.clean())
+        )
+
+    def test_title_only_within_first_paragraphs(self):
+        content = self.clean(CleaningRules(title_paragraphs=1))
+        self.assertEqual('Before', content.find('p').text)
+
+    def test_unexpected_tag(self):
+        markup = '<div><p>Text</p><table></table></div>'
+        with self.assertRaises(Exception):
+            self.clean(markup=markup)
+        self.assertEqual('<div><p>Text</p></div>', str(self.clean(CleaningRules(strict=False), markup)))
@@ -0,0 +1,117 @@
+import unittest
+
+from bs4 import BeautifulSoup
+from urllib3.util import parse_url
+
+from cleaner import ContentCleaner
+from content import BlockKind, Content, BOLD, BREAK, IMAGE, ITALIC
+from lightnovel.util import LatexHtmlSink, MarkdownHtmlSink
+from lightnovel.wuxiaworld_com import WuxiaWorldComApi
+from tests.config import Har, prepare_browser
+
+
+class ContentTest(unittest.TestCase):
+    MARKUP = '''<div class="fr-view">
+<p>Some <i>slanted <b>and bold</b></i> text<br>&amp; more.</p>
+<hr>
+<div><p>Nested</p><p>paragraphs</p></div>
+<ul><li>One</li><li>Two</li></ul>
+<blockquote>Quoted</blockquote>
+Loose text
+</div>'''
+
+    def convert(self) -> Content:
+        return Content.from_tag(BeautifulSoup(self.MARKUP, 'html.parser').find())
+
+    def test_blocks(self):
+        content = self.convert()
+        self.assertEqual(
+            [BlockKind.PARAGRAPH, BlockKind.RULE, BlockKind.PARAGRAPH, BlockKind.PARAGRAPH,
+             BlockKind.UNORDERED_LIST, BlockKind.QUOTE, BlockKind.PARAGRAPH],
+            [block.kind for block in content]
+        )
+        self.assertEqual(['p', 'hr', 'div', 'div', 'ul', 'blockquote', None], [block.tag for block in content])
+        self.assertEqual([('Some ', 0), ('slanted ', ITALIC), ('and bold', ITALIC | BOLD), (' text', 0), ('', BREAK),
+                          ('& more.', 0)], [(run.text, run.style) for run in content[0].runs])
+        self.assertEqual('OneTwo', content[4].text)
+
+    def test_html(self):
+        content = self.convert()
+        self.assertEqual(
+            '<div><p>Some <em>slanted </em><em><strong>and bold</strong></em> text<br/>&amp; more.</p><hr/>'
+            '<p>Nested</p><p>paragraphs</p><ul><li>One</li><li>Two</li></ul><blockquote><p>Quoted</p></blockquote>'
+            '<p>\nLoose text\n</p></div>',
+            content.html()
+        )
+        self.assertEqual(content.html(), Content.from_html(content.html()).html())
+
+    def test_keeps_images_links_headings_and_tables(self):
+        markup = ('<div><h3>Title</h3><p>See <a href="https://localhost/a?b=1&amp;c=2">the <b>link</b></a> '
+                  '<img alt="Map" src="map.png"></p><img src="cover.png">'
+                  '<table><tr><th>Name</th><th>Rank</th></tr><tr><td>Zhou</td><td><i>1</i></td></tr></table></div>')
+        content = Content.from_html(markup)
+        self.assertEqual([BlockKind.HEADING, BlockKind.PARAGRAPH, BlockKind.PARAGRAPH, BlockKind.TABLE],
+                         [block.kind for block in content])
+        self.assertEqual(3, content[0].level)
+        self.assertEqual([('See ', 0, None), ('the ', 0, 'https://localhost/a?b=1&c=2'),
+                          ('link', BOLD, 'https://localhost/a?b=1&c=2'), (' ', 0, None), ('Map', IMAGE, 'map.png')],
+                         [(run.text, run.style, run.url) for run in content[1].runs])
+        self.assertEqual('See the link ', content[1].text)
+        self.assertEqual('NameRankZhou1', content[3].text)
+        self.assertEqual(
+            '<div><h3>Title</h3><p>See <a href="https://localhost/a?b=1&amp;c=2">the </a>'
+            '<a href="https://localhost/a?b=1&amp;c=2"><strong>link</strong></a> <img alt="Map" src="map.png"/></p>'
+            '<p><img alt="" src="cover.png"/></p><table><tr><td>Name</td><td>Rank</td></tr>'
+            '<tr><td>Zhou</td><td><em>1</em></td></tr></table></div>',
+            content.html()
+        )
+        self.assertEqual(content.html(), Content.from_html(content.html()).html())
+
+    def test_cleaning_strips_links(self):
+        content = Content.from_html('<div><p>See <a href="https://localhost/a">the link</a> <img src="a.png"></p></div>')
+        ContentCleaner().clean_blocks(content)
+        self.assertEqual('<div><p>See the link <img alt="" src="a.png"/></p></div>', content.html())
+
+    def test_sinks_render_line_breaks(self):
+        content = Content.from_html('<div><p>line one<br>line <i>two</i></p></div>')
+        self.assertEqual('line one  \nline _two_', MarkdownHtmlSink().render(content))
+        html = BeautifulSoup('<div><p>line one<br>line two</p></div>', 'html.parser').find()
+        self.assertEqual('line one\\\\\nline two\\\\ \\relax', LatexHtmlSink().render(Content.from_tag(html)))
+        self.assertEqual(MarkdownHtmlSink().parse(html), MarkdownHtmlSink().render(Content.from_tag(html)))
+
+    def test_slots(self):
+        content = self.convert()
+        for obj in (content, content[0], content[0].runs[0]):
+            self.assertFalse(hasattr(obj, '__dict__'))
+
+
+# noinspection SpellCheckingInspection
+class ChapterBlocksTest(unittest.TestCase):
+    CHAPTER_URL = 'https://www.wuxiaworld.com/novel/heavenly-jewel-change/hjc-book-1-chapter-1-01'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.browser = prepare_browser(Har.WW_HJC_COVER_C1_2)
+
+    def test_compact_and_clean(self):
+        api = WuxiaWorldComApi(self.browser)
+        expected = api.get_chapter(parse_url(self.CHAPTER_URL))
+        expected.parse()
+        expected.clean_content()
+        chapter = api.get_chapter(parse_url(self.CHAPTER_URL))
+        chapter.parse()
+        chapter.compact()
+        del chapter.document
+        self.assertIsNone(chapter._content)
+        chapter.clean_content()
+        self.assertEqual(expected.content.text, chapter.blocks.text)
+        self.assertEqual(expected.content.text, chapter.content.text)
+        self.assertEqual([block.text for block in Content.from_tag(expected.content)],
+                         [block.text for block in chapter.blocks])
+
+    def test_sink_renders_blocks(self):
+        api = WuxiaWorldComApi(self.browser)
+        novel = api.get_novel(parse_url('https://www.wuxiaworld.com/novel/heavenly-jewel-change'))
+        self.assertTrue(novel.parse())
+        sink = MarkdownHtmlSink()
+        self.assertEqual(sink.parse(novel.description), sink.render(Content.from_tag(novel.description)))
@@ -1,9 +1,18 @@
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
+import zipfile
 
 from urllib3.util import parse_url
 
 from lightnovel.wuxiaworld_com import WuxiaWorldComApi
-from pipeline import ChapterConflation
+from pipeline import ChapterConflation, HtmlCleaner, Parser, Pipeline, PipelineExecutor, ProcessParser, FanOut, \
+    MarkdownMaker, LatexMaker, JsonLinesMaker, EpubMaker, Checkpointer, ReleaseChapters, Output
+from api import Book
+from store import ChapterStore, CheckpointStore
 from tests.config import Har, prepare_browser
 
 
@@ -86,5 +95,414 @@ With a cold flash, the tip of the sword was resting on Zhou Weiqing’s throat,
 """.replace('\n', ''), chapter1.content.text)
 
 
+# noinspection SpellCheckingInspection
+class ProcessParserTest(unittest.TestCase):
+    CHAPTER_URLS = [
+        'https://www.wuxiaworld.com/novel/heavenly-jewel-change/hjc-book-1-chapter-1-01',
+        'https://www.wuxiaworld.com/novel/heavenly-jewel-change/hjc-book-1-chapter-1-02',
+    ]
+
+    def crawl(self, wrap, store: ChapterStore = None):
+        browser = prepare_browser(Har.WW_HJC_COVER_C1_2)
+        api = WuxiaWorldComApi(browser)
+        novel = api.get_novel(parse_url('https://www.wuxiaworld.com/novel/heavenly-jewel-change'))
+        novel.parse()
+        book = novel.books[0]
+        gen = ((book, api.get_chapter(parse_url(url))) for url in self.CHAPTER_URLS)
+        return list(wrap(browser, api, store, gen))
+
+    def test_same_as_parser(self):
+        expected = self.crawl(lambda browser, api, store, gen: HtmlCleaner().wrap(Parser(browser).wrap(gen)))
+        store = ChapterStore()
+        actual = self.crawl(lambda browser, api, store, gen: ProcessParser(
+            browser, store, api.html_parser, workers=2).wrap(gen), store)
+        self.assertEqual(self.CHAPTER_URLS, [str(chapter.url) for _, chapter in actual])
+        for (_, chapter), (book, parsed) in zip(expected, actual):
+            self.assertTrue(parsed.cleaned)
+            self.assertIs(book, parsed.book)
+            self.assertIn(parsed, book.chapters)
+            self.assertEqual(chapter.title, parsed.title)
+            self.assertEqual(chapter.translator, parsed.translator)
+            self.assertEqual(chapter.chapter_id, parsed.chapter_id)
+            self.assertEqual(chapter.next_chapter, parsed.next_chapter)
+            self.assertEqual(chapter.content.text, parsed.content.text)
+            self.assertIn(str(parsed.url), store)
+
+
+class Tagging(Pipeline):
+    def __init__(self, tag: str, stop_at: int = None, fail_at: int = None):
+        super().__init__()
+        self.tag = tag
+        self.stop_at = stop_at
+        self.fail_at = fail_at
+        self.threads = set()
+
+    def wrap(self, gen):
+        for book, chapter in gen:
+            self.threads.add(threading.current_thread().name)
+            if chapter == self.stop_at:
+                return
+            if chapter == self.fail_at:
+                raise ValueError(f"{self.tag} failed at {chapter}")
+            yield f"{book}{self.tag}", chapter
+
+
+class PipelineExecutorTest(unittest.TestCase):
+    CHAPTER_URLS = ProcessParserTest.CHAPTER_URLS
+
+    def setUp(self):
+        self.produced = 0
+
+    def source(self, count: int = 50, fail_at: int = None):
+        for i in range(count):
+            if i == fail_at:
+                raise KeyError(i)
+            self.produced += 1
+            yield '', i
+
+    def assertStopped(self):
+        self.assertEqual([], [thread.name for thread in threading.enumerate() if thread.name.startswith('pipeline-')])
+
+    def test_keeps_order(self):
+        stages = Tagging('a'), Tagging('b'), Tagging('c')
+        executor = PipelineExecutor(*stages, queue_size=2)
+        self.assertEqual([('abc', i) for i in range(50)], list(executor.wrap(self.source())))
+        self.assertEqual(['pipeline-Tagging'], sorted({name for stage in stages for name in stage.threads}))
+        stats = executor.queue_stats
+        self.assertEqual(['source -> Tagging', 'Tagging -> Tagging', 'Tagging -> Tagging', 'Tagging -> consumer'],
+                         [stat.name for stat in stats])
+        self.assertTrue(all(0 < stat.peak <= stat.maxsize == 2 for stat in stats))
+        self.assertStopped()
+
+    def test_passes_on_exceptions(self):
+        with self.assertRaises(KeyError):
+            list(PipelineExecutor(Tagging('a'), Tagging('b')).wrap(self.source(fail_at=10)))
+        with self.assertRaisesRegex(ValueError, 'a failed at 10'):
+            list(PipelineExecutor(Tagging('a', fail_at=10), Tagging('b')).wrap(self.source()))
+        self.assertStopped()
+
+    def test_stage_stopping_stops_source(self):
+        chapters = list(PipelineExecutor(Tagging('a'), Tagging('b', stop_at=5), queue_size=2).wrap(self.source()))
+        self.assertEqual(list(range(5)), [chapter for _, chapter in chapters])
+        self.assertLess(self.produced, 50)
+        self.assertStopped()
+
+    def test_consumer_stopping_stops_stages(self):
+        gen = PipelineExecutor(Tagging('a'), Tagging('b'), queue_size=2).wrap(self.source(1000))
+        self.assertEqual(('ab', 0), next(gen))
+        time.sleep(0.05)
+        gen.close()
+        self.assertLess(self.produced, 1000)
+        self.assertStopped()
+
+    def test_same_as_nested_stages(self):
+        expected = ProcessParserTest.crawl(
+            self, lambda browser, api, store, gen: HtmlCleaner().wrap(Parser(browser).wrap(gen)))
+        actual = ProcessParserTest.crawl(
+            self, lambda browser, api, store, gen: PipelineExecutor(Parser(browser), HtmlCleaner()).wrap(gen))
+        self.assertEqual(self.CHAPTER_URLS, [str(chapter.url) for _, chapter in actual])
+        for (_, chapter), (book, parsed) in zip(expected, actual):
+            self.assertTrue(parsed.cleaned)
+            self.assertIn(parsed, book.chapters)
+            self.assertEqual(chapter.content.text, parsed.content.text)
+
+
+class ChapterConflationTest(unittest.TestCase):
+    class Part:
+        def __init__(self, book: Book, title: str, number: int):
+            self.book = book
+            self.title = title
+            self.index = number
+            self.abs_index = number
+            self._url = f"/novel/{number}"
+            self.blocks = [number]
+            self._next_chapter_path = f"/novel/{number + 1}"
+            book.chapters.append(self)
+
+        def extract_clean_title(self) -> str:
+            return self.title
+
+    def conflate(self, source, window: int = None) -> list:
+        return [(book.title, chapter.index, chapter.title, chapter.blocks)
+                for book, chapter in ChapterConflation(None, window).wrap(source)]
+
+    def test_conflates_parts_within_books(self):
+        first, second = Book('Book 1'), Book('Book 2')
+        titles = [(first, 'Arrival'), (first, 'Arrival'), (first, 'Departure'), (second, 'Departure'),
+                  (second, 'Return'), (second, 'Return'), (second, 'Return')]
+        parts = [self.Part(book, title, number) for number, (book, title) in enumerate(titles, 1)]
+        self.assertEqual([
+            ('Book 1', 1, 'Arrival', [1, 2]),
+            ('Book 1', 2, 'Departure', [3]),
+            ('Book 2', 1, 'Departure', [4]),
+            ('Book 2', 2, 'Return', [5, 6, 7]),
+        ], self.conflate((part.book, part) for part in parts))
+        self.assertEqual([parts[0], parts[2]], list(first.chapters))
+        self.assertEqual([parts[3], parts[4]], list(second.chapters))
+        self.assertEqual('/novel/8', parts[4]._next_chapter_path)
+        self.assertEqual([('/novel/2', 2), ('/novel/3', 3), ('/novel/4', 4), ('/novel/7', 7)],
+                         [(part._url, part.abs_index) for part in (parts[0], parts[2], parts[3], parts[4])])
+
+    def test_conflates_all_parts_by_default(self):
+        book = Book('Book 1')
+        parts = [self.Part(book, 'Endless', number) for number in range(1, 51)]
+        self.assertEqual([('Book 1', 1, 'Endless', list(range(1, 51)))],
+                         self.conflate((book, part) for part in parts))
+
+    def test_window_bounds_conflated_parts(self):
+        book = Book('Book 1')
+        parts = [self.Part(book, 'Endless', number) for number in range(1, 8)]
+        with self.assertLogs('ChapterConflation', 'WARNING') as logs:
+            self.assertEqual([('Book 1', 1, 'Endless', [1, 2, 3]), ('Book 1', 2, 'Endless', [4, 5, 6]),
+                              ('Book 1', 3, 'Endless', [7])], self.conflate(((book, part) for part in parts), 3))
+        self.assertEqual(2, len(logs.records))
+
+    def test_empty_source(self):
+        self.assertEqual([], self.conflate(iter([])))
+
+
+class FakeChapter:
+    blocks = None
+
+    def __init__(self, index: int):
+        self.index = index
+        self.releases = 0
+
+    def release(self):
+        self.releases += 1
+
+
+class Collecting(Pipeline):
+    def __init__(self, delay: float = 0.0, fail_at: int = None):
+        super().__init__()
+        self.delay = delay
+        self.fail_at = fail_at
+        self.collected = []
+        self.closed = False
+
+    def wrap(self, gen):
+        try:
+            for book, chapter in gen:
+                if chapter.index == self.fail_at:
+                    raise ValueError(f"failed at {chapter.index}")
+                time.sleep(self.delay)
+                self.collected.append(chapter.index)
+                yield book, chapter
+        finally:
+            self.closed = True
+
+
+class FanOutTest(unittest.TestCase):
+    @staticmethod
+    def source(count: int = 20):
+        return ((None, FakeChapter(i)) for i in range(count))
+
+    def test_every_branch_gets_every_chapter(self):
+        first, second, third = Collecting(), Collecting(), Collecting()
+        fan_out = FanOut(first, (second, third), queue_size=4)
+        passed = [chapter.index for _, chapter in fan_out.wrap(self.source())]
+        self.assertEqual(list(range(20)), passed)
+        for branch in (first, second, third):
+            self.assertEqual(list(range(20)), branch.collected)
+            self.assertTrue(branch.closed)
+        self.assertEqual(['0: Collecting', '1: Collecting -> Collecting'], [s.name for s in fan_out.queue_stats])
+        self.assertEqual({}, fan_out.failures)
+
+    def test_failing_branch_is_isolated(self):
+        failing, working = Collecting(fail_at=5), Collecting()
+        fan_out = FanOut(failing, working, queue_size=2)
+        self.assertEqual(20, len(list(fan_out.wrap(self.source()))))
+        self.assertEqual(list(range(5)), failing.collected)
+        self.assertTrue(failing.closed)
+        self.assertEqual(list(range(20)), working.collected)
+        self.assertIsInstance(fan_out.failures['0: Collecting'], ValueError)
+
+    def test_slow_branch_holds_up_only_beyond_its_queue(self):
+        slow, fast = Collecting(delay=0.01), Collecting()
+        fan_out = FanOut(slow, fast, queue_size=3)
+        gen = fan_out.wrap(self.source())
+        for _ in range(5):
+            next(gen)
+        time.sleep(0.05)
+        self.assertEqual(list(range(5)), fast.collected)
+        self.assertLessEqual(fan_out.queue_stats[0].peak, 3)
+        gen.close()
+        self.assertEqual(list(range(5)), slow.collected)
+
+    def test_releases_chapters_after_every_branch(self):
+        fast, slow, failing = Collecting(), Collecting(delay=0.005), Collecting(fail_at=3)
+        chapters = [chapter for _, chapter in FanOut(fast, slow, failing, release=True).wrap(self.source(10))]
+        self.assertEqual(list(range(10)), slow.collected)
+        self.assertEqual([1] * 10, [chapter.releases for chapter in chapters])
+
+    def test_keeps_chapters_until_the_consumer_took_them(self):
+        chapters = []
+        for _, chapter in FanOut(Collecting(), release=True).wrap(self.source(10)):
+            time.sleep(0.002)  # Lets the branch handle the chapter first
+            self.assertEqual(0, chapter.releases)
+            chapters.append(chapter)
+        self.assertEqual([1] * 10, [chapter.releases for chapter in chapters])
+
+    def test_writes_every_format_in_one_pass(self):
+        browser = prepare_browser(Har.WW_HJC_COVER_C1_2)
+        api = WuxiaWorldComApi(browser)
+        novel = api.get_novel(parse_url('https://www.wuxiaworld.com/novel/heavenly-jewel-change'))
+        novel.parse()
+        book = novel.books[0]
+        gen = ((book, api.get_chapter(parse_url(url))) for url in ProcessParserTest.CHAPTER_URLS)
+        with tempfile.TemporaryDirectory() as folder:
+            makers = MarkdownMaker(novel, folder), LatexMaker(novel, folder), JsonLinesMaker(novel, folder)
+            chapters = list(FanOut(*makers).wrap(HtmlCleaner().wrap(Parser(browser).wrap(gen))))
+            self.assertEqual(2, len(chapters))
+            markdown, latex, json_lines = makers
+            with open(markdown.join_to_path(markdown.filename), encoding='utf-8') as fp:
+                text = fp.read()
+            self.assertTrue(text.startswith('# Heavenly Jewel Change'))
+            self.assertEqual(2, text.count('\n### '))
+            latex_folder = latex.join_to_path(latex.slug_title)
+            self.assertEqual(['1_', '2_', 'Heavenly-Jewel-Change.tex', 'structure.tex'],
+                             sorted(name[:2] if name[0].isdigit() else name for name in os.listdir(latex_folder)))
+            with open(json_lines.join_to_path(json_lines.filename), encoding='utf-8') as fp:
+                lines = [json.loads(line) for line in fp]
+            self.assertEqual(ProcessParserTest.CHAPTER_URLS, [line['url'] for line in lines])
+            self.assertEqual(chapters[0][1].content_html, lines[0]['html'])
+
+
+class ReleaseChaptersTest(unittest.TestCase):
+    def test_streaming_keeps_summaries(self):
+        browser = prepare_browser(Har.WW_HJC_COVER_C1_2)
+        api = WuxiaWorldComApi(browser)
+        novel = api.get_novel(parse_url('https://www.wuxiaworld.com/novel/heavenly-jewel-change'))
+        novel.parse()
+        book = novel.books[0]
+        gen = ((book, api.get_chapter(parse_url(url))) for url in ProcessParserTest.CHAPTER_URLS)
+        with tempfile.TemporaryDirectory() as folder:
+            markdown, json_lines = MarkdownMaker(novel, folder), JsonLinesMaker(novel, folder)
+            gen = json_lines.wrap(markdown.wrap(HtmlCleaner().wrap(Parser(browser).wrap(gen))))
+            chapters = [chapter for _, chapter in ReleaseChapters().wrap(gen)]
+            self.assertEqual(0, len(book.chapters))
+            self.assertEqual(ProcessParserTest.CHAPTER_URLS, [summary.url for summary in book.summaries])
+            self.assertEqual((markdown.join_to_path(markdown.filename), json_lines.join_to_path(json_lines.filename)),
+                             book.summaries[0].paths)
+            self.assertTrue(all(chapter.released and chapter.content_html == '' for chapter in chapters))
+
+
+class CheckpointerTest(unittest.TestCase):
+    CHAPTER_URLS = ProcessParserTest.CHAPTER_URLS
+
+    def setUp(self):
+        self.browser = prepare_browser(Har.WW_HJC_COVER_C1_2)
+        self.api = WuxiaWorldComApi(self.browser)
+        self.novel = self.api.get_novel(parse_url('https://www.wuxiaworld.com/novel/heavenly-jewel-change'))
+        self.novel.parse()
+        self.folder = tempfile.TemporaryDirectory()
+        self.store = CheckpointStore()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def source(self, start: int = 0):
+        book = self.novel.books[0]
+        book.number = 1
+        for index, url in enumerate(self.CHAPTER_URLS[start:], start + 1):
+            chapter = self.api.get_chapter(parse_url(url))
+            chapter._book = book
+            chapter.index = chapter.abs_index = index
+            yield book, chapter
+
+    def run_outputs(self, source, crash_at: int = None, crash_after: int = None, conflate: bool = False) -> list:
+        outputs = [EpubMaker(self.novel, self.folder.name), MarkdownMaker(self.novel, self.folder.name),
+                   LatexMaker(self.novel, self.folder.name), JsonLinesMaker(self.novel, self.folder.name)]
+        checkpointer = Checkpointer(self.novel, self.store, outputs, interval=1)
+        since = checkpointer.resume()
+        gen = HtmlCleaner().wrap(Parser(self.browser).wrap(source(since.abs_index if since else 0)))
+        if conflate:
+            gen = ChapterConflation(self.novel).wrap(gen)
+        for output in outputs:
+            gen = output.wrap(gen)
+
+        def crash(chapters):
+            for book, chapter in chapters:
+                if chapter.abs_index == crash_at:
+                    raise Exception("Crash")
+                yield book, chapter
+
+        for book, chapter in checkpointer.wrap(crash(gen)):
+            if chapter.abs_index == crash_after:
+                raise Exception("Crash")
+        return outputs
+
+    def test_resume_after_crash(self):
+        with self.assertRaisesRegex(Exception, 'Crash'):
+            self.run_outputs(self.source, crash_at=2)
+        checkpoint = self.store.get(str(self.novel.url))
+        self.assertEqual(self.CHAPTER_URLS[0], checkpoint.progress.chapter_url)
+        self.assertEqual(1, checkpoint.progress.abs_index)
+
+        epub, markdown, latex, json_lines = self.run_outputs(self.source)
+        self.assertNotIn(str(self.novel.url), self.store)
+        with zipfile.ZipFile(epub.join_to_path(epub.filename)) as file:
+            self.assertIsNone(file.testzip())
+            names = file.namelist()
+            content = file.read('OEBPS/content.opf').decode('utf-8')
+            toc = file.read('OEBPS/toc.ncx').decode('utf-8')
+        self.assertEqual(len(names), len(set(names)))
+        self.assertEqual(3, len([name for name in names if name.startswith('OEBPS/1_')]))
+        self.assertEqual(1, content.count('id="chap_1_1"'))
+        self.assertEqual(1, content.count('id="chap_1_2"'))
+        self.assertEqual(1, content.count('id="book_1"'))
+        self.assertEqual(3, toc.count('<ncx:navPoint '))
+        with open(markdown.join_to_path(markdown.filename), encoding='utf-8') as fp:
+            text = fp.read()
+        self.assertEqual(1, text.count('\n## '))
+        self.assertEqual(2, text.count('\n### '))
+        with open(json_lines.join_to_path(json_lines.filename), encoding='utf-8') as fp:
+            self.assertEqual(self.CHAPTER_URLS, [json.loads(line)['url'] for line in fp])
+        with open(latex.join_to_path(latex.slug_title, latex.filename), encoding='utf-8') as fp:
+            self.assertEqual(2, fp.read().count('\\include{'))
+
+    def test_resume_after_conflated_chapter(self):
+        # Both chapters are parts of the first one
+        with self.assertRaisesRegex(Exception, 'Crash'):
+            self.run_outputs(self.source, crash_after=2, conflate=True)
+        checkpoint = self.store.get(str(self.novel.url))
+        self.assertEqual(self.CHAPTER_URLS[1], checkpoint.progress.chapter_url)
+        self.assertEqual(2, checkpoint.progress.abs_index)
+
+        epub, markdown, latex, json_lines = self.run_outputs(self.source, conflate=True)
+        self.assertNotIn(str(self.novel.url), self.store)
+        with zipfile.ZipFile(epub.join_to_path(epub.filename)) as file:
+            content = file.read('OEBPS/content.opf').decode('utf-8')
+        self.assertEqual(1, content.count('id="chap_1_1"'))
+        self.assertNotIn('id="chap_1_2"', content)
+        with open(markdown.join_to_path(markdown.filename), encoding='utf-8') as fp:
+            self.assertEqual(1, fp.read().count('\n### '))
+        with open(json_lines.join_to_path(json_lines.filename), encoding='utf-8') as fp:
+            self.assertEqual(self.CHAPTER_URLS[1:], [json.loads(line)['url'] for line in fp])
+        with open(latex.join_to_path(latex.slug_title, latex.filename), encoding='utf-8') as fp:
+            self.assertEqual(1, fp.read().count('\\include{'))
+
+    def test_rejects_outputs_without_checkpoints(self):
+        class PlainOutput(Output):
+            def wrap(self, gen):
+                yield from gen
+
+        with self.assertRaisesRegex(Exception, "PlainOutput can't save checkpoints"):
+            Checkpointer(self.novel, self.store, [PlainOutput(self.novel, 'txt', self.folder.name)])
+
+    def test_resume_cuts_off_partial_writes(self):
+        with self.assertRaisesRegex(Exception, 'Crash'):
+            self.run_outputs(self.source, crash_at=2)
+        for output in (EpubMaker(self.novel, self.folder.name), JsonLinesMaker(self.novel, self.folder.name)):
+            with open(output.join_to_path(output.filename), 'ab') as fp:
+                fp.write(b'half a chapter')
+        epub, _, _, json_lines = self.run_outputs(self.source)
+        with zipfile.ZipFile(epub.join_to_path(epub.filename)) as file:
+            self.assertIsNone(file.testzip())
+            self.assertEqual(7, len(file.namelist()))
+        with open(json_lines.join_to_path(json_lines.filename), encoding='utf-8') as fp:
+            self.assertEqual(2, len([json.loads(line) for line in fp]))
+
+
 if __name__ == '__main__':
     unittest.main()
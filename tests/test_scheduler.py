@@ -0,0 +1,114 @@
+import threading
+import unittest
+
+from urllib3.util import Url
+
+from lightnovel import CrawlScheduler, CrawlState
+from tests.test_api import SerialApi, make_dummy_novel
+
+
+class NovelApi(SerialApi):
+    """Serves a novel with the given amount of chapters and records which novels are crawled at the same time."""
+
+    def __init__(self, chapters: int, hostname: str, tracker: 'ConcurrencyTracker'):
+        super().__init__(chapters)
+        self._hostname = hostname
+        self.tracker = tracker
+
+    def get_entire_novel(self, url: Url, prefetch: int = 0, workers: int = 4, since=None):
+        novel = make_dummy_novel(self.published)
+        novel._success = self.published > 0
+        return novel, self.get_all_chapters(novel, prefetch, workers, since)
+
+    def get_chapter(self, url: Url):
+        with self.tracker.track(self._hostname):
+            return super().get_chapter(url)
+
+
+class ConcurrencyTracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = {}
+        self.peak = {}
+
+    def track(self, hostname: str):
+        tracker = self
+
+        class Tracking:
+            def __enter__(self):
+                with tracker.lock:
+                    tracker.active[hostname] = tracker.active.get(hostname, 0) + 1
+                    tracker.peak[hostname] = max(tracker.peak.get(hostname, 0), tracker.active[hostname])
+
+            def __exit__(self, *args):
+                with tracker.lock:
+                    tracker.active[hostname] -= 1
+
+        return Tracking()
+
+
+class CrawlSchedulerTest(unittest.TestCase):
+    def make_scheduler(self, sizes: dict, **kwargs) -> CrawlScheduler:
+        tracker = ConcurrencyTracker()
+
+        def api_factory(url: str):
+            host = url.split('/')[2]
+            return NovelApi(sizes[url], host, tracker)
+
+        scheduler = CrawlScheduler(pipeline=lambda api, novel, gen: gen, api_factory=api_factory, **kwargs)
+        scheduler.tracker = tracker
+        return scheduler
+
+    def test_crawls_all_novels(self):
+        sizes = {'https://a/novel/1': 5, 'https://a/novel/2': 3, 'https://b/novel/3': 4}
+        scheduler = self.make_scheduler(sizes, workers=3)
+        for url in sizes:
+            scheduler.add(url)
+        jobs = scheduler.run()
+        self.assertEqual([CrawlState.DONE] * 3, [job.state for job in jobs])
+        self.assertEqual([5, 3, 4], [job.chapters for job in jobs])
+
+    def test_respects_host_limit(self):
+        sizes = {f"https://a/novel/{i}": 5 for i in range(4)}
+        scheduler = self.make_scheduler(sizes, workers=4, per_host=1)
+        for url in sizes:
+            scheduler.add(url)
+        scheduler.run()
+        self.assertEqual(1, scheduler.tracker.peak['a'])
+
+    def test_interleaves_by_priority(self):
+        sizes = {'https://a/novel/big': 6, 'https://a/novel/small': 2, 'https://a/novel/urgent': 2}
+        order = []
+        scheduler = self.make_scheduler(sizes, workers=1, on_progress=lambda job: order.append(job.url))
+        scheduler.add('https://a/novel/big')
+        scheduler.add('https://a/novel/small')
+        scheduler.add('https://a/novel/urgent', priority=1)
+        scheduler.run()
+        self.assertEqual(['https://a/novel/urgent'] * 3, order[:3])
+        self.assertLess(order.index('https://a/novel/small'), order.index('https://a/novel/big') + 2)
+        self.assertEqual('https://a/novel/big', order[-1])
+
+    def test_skips_unparsed_novels(self):
+        sizes = {'https://a/novel/1': 0, 'https://a/novel/2': 2}
+        reported = []
+        scheduler = self.make_scheduler(sizes, on_progress=lambda job: reported.append(job.url))
+        for url in sizes:
+            scheduler.add(url)
+        jobs = scheduler.run()
+        self.assertEqual([CrawlState.SKIPPED, CrawlState.DONE], [job.state for job in jobs])
+        self.assertEqual(0, jobs[0].chapters)
+        self.assertIn('https://a/novel/1', reported)
+
+    def test_reports_failures(self):
+        class FailingApi(NovelApi):
+            def get_chapter(self, url: Url):
+                raise IOError("Connection reset")
+
+        scheduler = CrawlScheduler(
+            pipeline=lambda api, novel, gen: gen,
+            api_factory=lambda url: FailingApi(3, 'a', ConcurrencyTracker()),
+        )
+        job = scheduler.add('https://a/novel/1')
+        scheduler.run()
+        self.assertEqual(CrawlState.FAILED, job.state)
+        self.assertIsInstance(job.error, IOError)
@@ -0,0 +1,106 @@
+import os
+import tempfile
+import unittest
+
+from urllib3.util import parse_url
+
+from lightnovel import Parser
+from lightnovel.store import PageStore, ChapterStore, ChapterRecord, CheckpointStore
+from lightnovel.wuxiaworld_com import WuxiaWorldComApi
+from tests.config import Har, prepare_browser
+
+
+class PageStoreTest(unittest.TestCase):
+    def test_put_and_get(self):
+        with PageStore() as store:
+            self.assertIsNone(store.get('https://localhost/a'))
+            store.put('https://localhost/a', '"v1"', None, '<html></html>')
+            page = store.get('https://localhost/a')
+            self.assertEqual('"v1"', page.etag)
+            self.assertIsNone(page.last_modified)
+            self.assertEqual('<html></html>', page.body)
+            self.assertIn('https://localhost/a', store)
+            self.assertEqual(1, len(store))
+
+    def test_replace(self):
+        with PageStore() as store:
+            store.put('https://localhost/a', '"v1"', None, 'old')
+            store.put('https://localhost/a', '"v2"', 'Mon, 06 Jan 2020 12:00:00 GMT', 'new')
+            page = store.get('https://localhost/a')
+            self.assertEqual(('"v2"', 'new'), (page.etag, page.body))
+            self.assertEqual(1, len(store))
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'pages.sqlite')
+            with PageStore(path) as store:
+                store.put('https://localhost/a', None, 'Mon, 06 Jan 2020 12:00:00 GMT', 'body')
+            with PageStore(path) as store:
+                self.assertEqual('body', store.get('https://localhost/a').body)
+
+
+class CheckpointStoreTest(unittest.TestCase):
+    def test_put_and_get(self):
+        with CheckpointStore() as store:
+            self.assertIsNone(store.get('https://localhost/novel'))
+            store.put('https://localhost/novel', 1, 2, 3, 'https://localhost/novel/c3', '/novel/c4',
+                      {'novel.md': {'size': 42, 'book': 'Book 1'}})
+            store.put('https://localhost/novel', 1, 3, 4, 'https://localhost/novel/c4', None,
+                      {'novel.md': {'size': 84, 'book': 'Book 1'}})
+            checkpoint = store.get('https://localhost/novel')
+            self.assertEqual((1, 3, 4), checkpoint.progress[1:4])
+            self.assertIsNone(checkpoint.progress.next_path)
+            self.assertEqual({'novel.md': {'size': 84, 'book': 'Book 1'}}, checkpoint.states)
+            self.assertEqual(1, len(store))
+            store.delete('https://localhost/novel')
+            self.assertNotIn('https://localhost/novel', store)
+
+
+# noinspection SpellCheckingInspection
+class ChapterStoreTest(unittest.TestCase):
+    CHAPTER_URL = 'https://www.wuxiaworld.com/novel/heavenly-jewel-change/hjc-book-1-chapter-1-01'
+
+    def test_put_and_get(self):
+        with ChapterStore() as store:
+            record = ChapterRecord('https://localhost/c1', 'abc', 'Chapter 1', 'Translator', None, '/c2', False,
+                                   '<div><p>Text</p></div>', {'chapter_id': 1})
+            store.put(record)
+            self.assertEqual(record, store.get('https://localhost/c1', 'abc'))
+            self.assertIsNone(store.get('https://localhost/c1', 'changed'))
+            store.put(record._replace(digest='changed'))
+            self.assertIsNone(store.get('https://localhost/c1', 'abc'))
+            self.assertEqual(1, len(store))
+
+    def test_restore_chapter(self):
+        store = ChapterStore()
+        api = WuxiaWorldComApi(prepare_browser(Har.WW_HJC_COVER_C1_2), chapter_store=store)
+        url = parse_url(self.CHAPTER_URL)
+        chapter = api.get_chapter(url)
+        self.assertFalse(chapter.restored)
+        self.assertTrue(chapter.parse())
+        chapter.clean_content()
+        store.put(chapter.to_record())
+
+        restored = api.get_chapter(url)
+        self.assertTrue(restored.restored)
+        self.assertIsNone(restored.document)
+        self.assertTrue(restored.parse())
+        self.assertTrue(restored.is_complete())
+        self.assertTrue(restored.cleaned)
+        self.assertEqual(chapter.title, restored.title)
+        self.assertEqual(chapter.translator, restored.translator)
+        self.assertEqual(chapter.chapter_id, restored.chapter_id)
+        self.assertEqual(chapter.next_chapter, restored.next_chapter)
+        self.assertEqual(chapter.content_html, restored.content_html)
+        self.assertEqual(chapter.content.text, restored.content.text)
+
+    def test_parser_stores_chapters(self):
+        store = ChapterStore()
+        browser = prepare_browser(Har.WW_HJC_COVER_C1_2)
+        api = WuxiaWorldComApi(browser, chapter_store=store)
+        novel = api.get_novel(parse_url('https://www.wuxiaworld.com/novel/heavenly-jewel-change'))
+        novel.parse()
+        chapter = api.get_chapter(parse_url(self.CHAPTER_URL))
+        list(Parser(browser, store).wrap(iter([(novel.books[0], chapter)])))
+        self.assertIn(self.CHAPTER_URL, store)
+        self.assertTrue(api.get_chapter(parse_url(self.CHAPTER_URL)).restored)
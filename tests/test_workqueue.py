@@ -0,0 +1,107 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from bs4 import BeautifulSoup
+from urllib3.util import Url
+
+from lightnovel import Novel, WorkQueue, Worker
+from tests.test_api import SerialApi, make_dummy_novel
+
+NOVEL_URL = 'https://localhost/novel'
+
+
+class ListedNovel(Novel):
+    def parse(self) -> bool:
+        return True
+
+
+class QueueApi(SerialApi):
+    """Lists `listed` chapters on the novel page, which links up to `published` chapters."""
+
+    def __init__(self, listed: int, published: int, requested: list):
+        super().__init__(published)
+        self.listed = listed
+        self.requested = requested
+
+    def get_novel(self, url: Url) -> Novel:
+        novel = ListedNovel(url, BeautifulSoup('', 'html.parser'))
+        novel._books = make_dummy_novel(self.listed).books
+        return novel
+
+    def get_image(self, url: str):
+        return None
+
+
+class WorkQueueTest(unittest.TestCase):
+    def test_lease_and_complete(self):
+        with WorkQueue() as queue:
+            queue.add(NOVEL_URL)
+            item = queue.lease('a')
+            self.assertEqual((NOVEL_URL, 1, None, 'a', 1), (item.novel_url, item.first, item.last, item.worker,
+                                                             item.attempts))
+            self.assertIsNone(queue.lease('b'))
+            self.assertTrue(queue.complete(item))
+            self.assertEqual({'done': 1}, queue.statistics())
+            self.assertEqual(0, queue.unfinished())
+
+    def test_expired_lease(self):
+        with WorkQueue() as queue:
+            queue.add(NOVEL_URL, 1, 10)
+            stale = queue.lease('a', lease_time=-1)
+            item = queue.lease('b')
+            self.assertEqual((stale.id, 2), (item.id, item.attempts))
+            self.assertFalse(queue.complete(stale))
+            self.assertIsNone(queue.renew(stale))
+            self.assertTrue(queue.complete(item))
+
+    def test_retries_failed_items(self):
+        with WorkQueue() as queue:
+            queue.max_attempts = 2
+            queue.add(NOVEL_URL)
+            queue.fail(queue.lease('a'), 'error')
+            self.assertEqual({'pending': 1}, queue.statistics())
+            queue.fail(queue.lease('a'), 'error')
+            self.assertEqual({'failed': 1}, queue.statistics())
+            self.assertIsNone(queue.lease('a'))
+
+
+class WorkerTest(unittest.TestCase):
+    def test_splits_novel_into_ranges(self):
+        with WorkQueue() as queue:
+            queue.add(NOVEL_URL)
+            requested = []
+            worker = Worker(queue, pipeline=lambda api, novel, gen: gen,
+                            api_factory=lambda url: QueueApi(7, 7, requested), range_size=3)
+            self.assertTrue(worker.run_once())
+            self.assertEqual([], requested)
+            items = [queue.lease('b') for _ in range(3)]
+            self.assertEqual([(1, 3), (4, 6), (7, None)], [item.chapter_range for item in items])
+
+    def test_workers_share_queue(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'queue.sqlite')
+            with WorkQueue(path) as queue:
+                queue.add(NOVEL_URL)
+            requested = []
+            lock = threading.Lock()
+
+            def api_factory(url: str) -> QueueApi:
+                with lock:
+                    return QueueApi(10, 12, requested)
+
+            def work(name: str):
+                with WorkQueue(path) as queue:
+                    Worker(queue, pipeline=lambda api, novel, gen: gen, api_factory=api_factory, name=name,
+                           range_size=3).run(poll_interval=0.01)
+
+            threads = [threading.Thread(target=work, args=(f"worker-{i}",)) for i in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual([f"/novel/{i}" for i in range(1, 13)],
+                             sorted(requested, key=lambda path: int(path.rsplit('/', 1)[-1])))
+            with WorkQueue(path) as queue:
+                self.assertEqual({'done': 5}, queue.statistics())
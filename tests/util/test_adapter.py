@@ -0,0 +1,92 @@
+import threading
+import unittest
+
+from requests import Session, Response
+from requests.adapters import BaseAdapter
+
+from lightnovel.util.adapter import ThreadSafeCacheAdapter, BYPASS_CACHE_HEADER
+from webot.adapter import CacheAdapter
+
+
+class MemoryCacheAdapter(CacheAdapter):
+    # noinspection PyMissingConstructor
+    def __init__(self):
+        BaseAdapter.__init__(self)
+        self.cache = set()
+        self.hit = False
+        self.use_cache = True
+        self.last = None
+        self.headers = {}
+
+    def send(self, request, **kwargs):
+        self.headers = dict(request.headers)
+        self.hit = self.use_cache and request.url in self.cache
+        self.cache.add(request.url)
+        self.last = request.url
+        response = Response()
+        response.status_code = 200
+        response.url = request.url
+        return response
+
+    def delete_last(self):
+        self.cache.discard(self.last)
+
+    def close(self):
+        pass
+
+
+class ThreadSafeCacheAdapterTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = MemoryCacheAdapter()
+        self.session = Session()
+        self.session.mount('https://', self.cache)
+        self.session.mount('http://', self.cache)
+        self.adapter = ThreadSafeCacheAdapter.mount(self.session)
+
+    def test_mount(self):
+        self.assertIs(self.adapter, self.session.get_adapter('https://'))
+        self.assertIs(self.adapter, self.session.get_adapter('http://'))
+        self.assertIs(self.adapter, ThreadSafeCacheAdapter.mount(self.session))
+        self.assertIsNone(ThreadSafeCacheAdapter.mount(Session()))
+
+    def test_from_cache_per_response(self):
+        self.assertFalse(self.session.get('https://a.com/1').from_cache)
+        responses = {}
+
+        def run(url: str):
+            responses[url] = self.session.get(url)
+
+        threads = [threading.Thread(target=run, args=(url,)) for url in ('https://a.com/1', 'https://a.com/2')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(responses['https://a.com/1'].from_cache)
+        self.assertFalse(responses['https://a.com/2'].from_cache)
+        self.assertFalse(self.adapter.hit)
+
+    def test_delete_only_last_response(self):
+        self.session.get('https://a.com/1')
+        self.session.get('https://a.com/2')
+        self.assertFalse(self.adapter.delete('https://a.com/1'))
+        self.assertTrue(self.adapter.delete('https://a.com/2'))
+        self.assertEqual({'https://a.com/1'}, self.cache.cache)
+
+    def test_delete_from_other_thread(self):
+        thread = threading.Thread(target=self.session.get, args=('https://a.com/1',))
+        thread.start()
+        thread.join()
+        self.assertTrue(self.adapter.delete('https://a.com/1'))
+        self.assertEqual(set(), self.cache.cache)
+
+    def test_bypass_cache(self):
+        self.session.get('https://a.com/1')
+        response = self.session.get('https://a.com/1', headers={BYPASS_CACHE_HEADER: '1'})
+        self.assertFalse(response.from_cache)
+        self.assertNotIn(BYPASS_CACHE_HEADER, self.cache.headers)
+        self.assertTrue(self.adapter.use_cache)
+        self.assertTrue(self.session.get('https://a.com/1').from_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+from datetime import timedelta
+
+from lightnovel.util.cache import TtlCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TtlCacheTest(unittest.TestCase):
+    def test_expires(self):
+        clock = FakeClock()
+        cache = TtlCache(timedelta(seconds=10), clock=clock)
+        cache.put('a', 1)
+        clock.now += 9.5
+        self.assertEqual(1, cache.get('a'))
+        clock.now += 0.5
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(0, len(cache))
+
+    def test_put_drops_expired(self):
+        clock = FakeClock()
+        cache = TtlCache(timedelta(seconds=10), clock=clock)
+        cache.put('a', 1)
+        clock.now += 5
+        cache.put('b', 2)
+        clock.now += 5
+        cache.put('c', 3)
+        self.assertEqual(2, len(cache))
+        self.assertEqual(2, cache.get('b'))
+
+    def test_zero_ttl_disables(self):
+        cache = TtlCache(timedelta(0))
+        cache.put('a', 1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(0, len(cache))
@@ -0,0 +1,131 @@
+import threading
+import unittest
+from datetime import datetime, timezone
+
+from lightnovel.util.ratelimit import TokenBucket, RateLimiter, parse_retry_after, backoff_delay
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2.0, burst=3, clock=clock)
+        self.assertEqual([0.0, 0.0, 0.0], [bucket.reserve() for _ in range(3)])
+        self.assertAlmostEqual(0.5, bucket.reserve())
+        self.assertAlmostEqual(1.0, bucket.reserve())
+        self.assertAlmostEqual(1.5, bucket.waited)
+        self.assertEqual(5, bucket.acquisitions)
+        self.assertEqual(2, bucket.waits)
+
+    def test_refill(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1.0, burst=2, clock=clock)
+        bucket.reserve()
+        bucket.reserve()
+        clock.now += 1.5
+        self.assertAlmostEqual(1.5, bucket.tokens)
+        clock.now += 10.0
+        self.assertAlmostEqual(2.0, bucket.tokens)
+
+    def test_refund(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1.0, burst=1, clock=clock)
+        self.assertEqual(0.0, bucket.reserve())
+        bucket.refund()
+        self.assertEqual(0.0, bucket.reserve())
+
+    def test_unlimited(self):
+        bucket = TokenBucket(rate=float('inf'), burst=1)
+        self.assertEqual(0.0, sum(bucket.reserve() for _ in range(100)))
+
+    def test_threads(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=10.0, burst=1, clock=clock)
+        waits = []
+        threads = [threading.Thread(target=lambda: waits.append(bucket.reserve())) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([round(0.1 * i, 6) for i in range(10)], sorted(round(wait, 6) for wait in waits))
+
+    def test_penalize_and_reward(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=4.0, burst=1, clock=clock)
+        bucket.penalize(10.0)
+        self.assertEqual(2.0, bucket.rate)
+        self.assertAlmostEqual(10.5, bucket.reserve())
+        for _ in range(100):
+            bucket.reward()
+        self.assertEqual(4.0, bucket.rate)
+        self.assertEqual(4.0, bucket.max_rate)
+
+    def test_rate_keeps_penalty(self):
+        bucket = TokenBucket(rate=4.0, burst=1, clock=FakeClock())
+        bucket.penalize(1.0)
+        bucket.rate = 3.0
+        self.assertEqual(2.0, bucket.rate)
+        self.assertEqual(3.0, bucket.max_rate)
+        bucket.rate = 1.0
+        self.assertEqual(1.0, bucket.rate)
+        bucket.rate = 5.0
+        self.assertEqual(5.0, bucket.rate)
+
+    def test_penalize_unlimited(self):
+        bucket = TokenBucket(rate=float('inf'), burst=1, clock=FakeClock())
+        bucket.penalize(0.0)
+        self.assertEqual(float('inf'), bucket.rate)
+        bucket.penalize(5.0)
+        self.assertEqual(0.2, bucket.rate)
+
+
+class RetryAfterTest(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(120.0, parse_retry_after('120'))
+
+    def test_http_date(self):
+        now = datetime(2020, 1, 6, 12, 0, 0, tzinfo=timezone.utc)
+        self.assertEqual(90.0, parse_retry_after('Mon, 06 Jan 2020 12:01:30 GMT', now))
+        self.assertEqual(0.0, parse_retry_after('Mon, 06 Jan 2020 11:00:00 GMT', now))
+
+    def test_invalid(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after('soon'))
+
+    def test_backoff(self):
+        self.assertEqual(1.0, backoff_delay(1, base=1.0, rng=lambda: 0.0))
+        self.assertAlmostEqual(4.0, backoff_delay(2, base=1.0, rng=lambda: 0.999999999))
+        self.assertEqual(30.0, backoff_delay(10, base=1.0, cap=60.0, rng=lambda: 0.0))
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_buckets_per_host(self):
+        limiter = RateLimiter(rate=1.0, burst=1)
+        self.assertIs(limiter.bucket('a.com'), limiter.bucket('a.com'))
+        self.assertIsNot(limiter.bucket('a.com'), limiter.bucket('b.com'))
+
+    def test_configure(self):
+        limiter = RateLimiter(rate=1.0, burst=1)
+        bucket = limiter.configure('a.com', rate=5.0, burst=4)
+        self.assertEqual(5.0, bucket.rate)
+        self.assertEqual(4, bucket.burst)
+        self.assertEqual(1.0, limiter.bucket('b.com').rate)
+
+    def test_setdefault(self):
+        limiter = RateLimiter(rate=1.0, burst=1)
+        bucket = limiter.setdefault('a.com', rate=5.0, burst=4)
+        self.assertEqual(5.0, bucket.rate)
+        bucket.penalize(1.0)
+        self.assertIs(bucket, limiter.setdefault('a.com', rate=8.0, burst=2))
+        self.assertEqual(2.5, bucket.rate)
+        self.assertEqual(4, bucket.burst)
+
+    def test_default_is_shared(self):
+        self.assertIs(RateLimiter.default(), RateLimiter.default())
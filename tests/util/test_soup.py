@@ -0,0 +1,97 @@
+import unittest
+
+from urllib3.util import parse_url
+
+from lightnovel.util.soup import HtmlParser, fast_features, find_scripts, find_tags, head_of, is_available, strainer
+from lightnovel.wuxiaworld_com import WuxiaWorldComApi
+from tests.config import Har, prepare_browser
+
+
+class HtmlParserTest(unittest.TestCase):
+    def test_fast_default(self):
+        self.assertEqual('lxml' if is_available('lxml') else 'html.parser', fast_features())
+        self.assertEqual(fast_features(), HtmlParser().features)
+
+    def test_no_fallback_if_selectors_match(self):
+        parser = HtmlParser('html.parser')
+        document = parser.parse('<html><head><title>A</title></head><body><div class="a">B</div></body></html>',
+                                ('head title', 'div.a'))
+        self.assertEqual('B', document.select_one('div.a').text)
+        self.assertEqual(0, parser.fallbacks)
+
+    def test_fallback_if_selectors_missing(self):
+        parser = HtmlParser('html.parser')
+        document = parser.parse('<div class="a">B</div>', ('head',))
+        self.assertIsNotNone(document.select_one('head'))
+        self.assertEqual(1, parser.fallbacks)
+
+    def test_fallback_disabled(self):
+        parser = HtmlParser('html.parser', None)
+        document = parser.parse('<div class="a">B</div>', ('head',))
+        self.assertIsNone(document.select_one('head'))
+        self.assertEqual(0, parser.fallbacks)
+
+    def test_strainer(self):
+        parser = HtmlParser('html.parser', None)
+        document = parser.parse(
+            '<html><head><title>T</title></head><body><nav>N</nav>'
+            '<div class="a b">C<p>P</p></div><div id="x">X</div><div class="a">A</div></body></html>',
+            parse_only=strainer('head', 'div.b', 'div#x')
+        )
+        self.assertIsNone(document.select_one('nav'))
+        self.assertEqual('T', document.select_one('head title').text)
+        self.assertEqual('P', document.select_one('div.b p').text)
+        self.assertEqual('X', document.select_one('div#x').text)
+        self.assertEqual(2, len(document.select('div')))
+
+
+class RawHtmlTest(unittest.TestCase):
+    MARKUP = '''<html><head><link rel="stylesheet" href="/a.css">
+<LINK href='/novel/a?x=1&amp;y=2' rel=canonical />
+<meta name="description" content="D">
+<script type="application/ld+json">{"a": 1}</script><script>var b = 2;</script>
+</head><body><link rel="canonical" href="/body"></body></html>'''
+
+    def test_head_of(self):
+        head = head_of(self.MARKUP)
+        self.assertTrue(head.endswith('var b = 2;</script>\n'))
+        self.assertEqual('<p>', head_of('<p>'))
+
+    def test_find_tags(self):
+        head = head_of(self.MARKUP)
+        self.assertEqual([{'href': '/novel/a?x=1&y=2', 'rel': 'canonical'}], find_tags(head, 'link', rel='canonical'))
+        self.assertEqual(2, len(find_tags(head, 'link')))
+        self.assertEqual(3, len(find_tags(self.MARKUP, 'link')))
+        self.assertEqual('D', find_tags(head, 'meta', name='description')[0]['content'])
+        self.assertEqual([], find_tags(head, 'meta', name='keywords'))
+
+    def test_find_scripts(self):
+        self.assertEqual(['{"a": 1}'], find_scripts(self.MARKUP, type='application/ld+json'))
+        self.assertEqual(['{"a": 1}', 'var b = 2;'], find_scripts(self.MARKUP))
+
+
+# noinspection SpellCheckingInspection
+class BackendTest(unittest.TestCase):
+    CHAPTER_URL = 'https://www.wuxiaworld.com/novel/heavenly-jewel-change/hjc-book-1-chapter-1-01'
+
+    def parse_chapter(self, parser: HtmlParser):
+        api = WuxiaWorldComApi(prepare_browser(Har.WW_HJC_COVER_C1_2))
+        api.html_parser = parser
+        chapter = api.get_chapter(parse_url(self.CHAPTER_URL))
+        self.assertTrue(chapter.parse())
+        return chapter
+
+    def test_backends_agree(self):
+        reference = self.parse_chapter(HtmlParser('html5lib'))
+        for features in ('lxml', 'html.parser'):
+            if not is_available(features):
+                continue
+            parser = HtmlParser(features)
+            chapter = self.parse_chapter(parser)
+            self.assertEqual(0, parser.fallbacks)
+            self.assertEqual(reference.title, chapter.title)
+            self.assertEqual(reference.translator, chapter.translator)
+            self.assertEqual(reference.chapter_id, chapter.chapter_id)
+            self.assertEqual(reference.next_chapter, chapter.next_chapter)
+            self.assertTrue(chapter.is_complete())
+            self.assertLess(len(chapter.document.find_all(True)), len(reference.document.find_all(True)))
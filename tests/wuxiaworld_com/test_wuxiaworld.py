@@ -1,9 +1,12 @@
+import json
 import unittest
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 
 from urllib3.util import parse_url
 
-from lightnovel.wuxiaworld_com import WuxiaWorldComNovel, WuxiaWorldComChapter, WuxiaWorldComApi
+from lightnovel.wuxiaworld_com import WuxiaWorldComNovel, WuxiaWorldComChapter, WuxiaWorldComApi, \
+    WuxiaWorldComSearchSummary
+from lightnovel.util.ratelimit import RateLimiter
 from tests.config import Har, prepare_browser
 # noinspection SpellCheckingInspection
 from wuxiaworld_com.api import Genre
@@ -140,6 +143,18 @@ As if the pink haired girl had heard his internal prayers, she actually slowly t
 """.replace('\n', ''),
                          chapter.content.text)
 
+    def test_peeking_without_document(self):
+        api = WuxiaWorldComApi(self.browser)
+        chapter = api.get_chapter(
+            parse_url('https://www.wuxiaworld.com/novel/heavenly-jewel-change/hjc-book-1-chapter-1-01'))
+        self.assertEqual('/novel/heavenly-jewel-change/hjc-book-1-chapter-1-02', chapter.peek_next_chapter().path)
+        self.assertFalse(chapter.is_teaser)
+        self.assertIsNotNone(chapter.markup)
+        self.assertTrue(chapter.parse())
+        self.assertIsNone(chapter.markup)
+        self.assertEqual('/novel/heavenly-jewel-change/hjc-book-1-chapter-1-02', chapter.next_chapter.path)
+        self.assertEqual('Stardu5t', chapter.translator)
+
     def test_parsing_chapter_2(self):
         api = WuxiaWorldComApi(self.browser)
         chapter = api.get_chapter(
@@ -765,3 +780,60 @@ class WuxiaWorldComApiSearchTest(unittest.TestCase):
         results, n = api.search(genres=(Genre.MODERN_SETTING,))
         self.assertEqual(7, len(results))
         self.assertEqual(7, n)
+
+    def test_search_decodes_synopsis_lazily(self):
+        browser = prepare_browser(Har.WW_SEARCH_DEFAULT)
+        api = WuxiaWorldComApi(browser)
+        results, _ = api.search()
+        entry = results[0]
+        self.assertEqual('7 Killers', entry.title)
+        self.assertEqual('https://www.wuxiaworld.com/novel/7-killers', str(entry.url))
+        self.assertIsNone(entry._synopsis)
+        self.assertTrue(entry.synopsis.get_text().startswith('Dragon Fifth is a powerful lord'))
+        self.assertIs(entry.synopsis, entry._synopsis)
+        self.assertFalse(hasattr(entry, '__dict__'))
+        self.assertEqual(['Chinese', 'Completed'], [tag.value for tag in entry.tags])
+
+    def test_search_bulk(self):
+        browser = prepare_browser(Har.WW_SEARCH_DEFAULT)
+        api = WuxiaWorldComApi(browser)
+        entries, n = api.search()
+        summaries, bulk_n = api.search(bulk=True)
+        self.assertEqual(n, bulk_n)
+        self.assertTrue(all(isinstance(summary, WuxiaWorldComSearchSummary) for summary in summaries))
+        self.assertEqual([(e.id, e.title, str(e.url), e.chapter_count) for e in entries],
+                         [(s.id, s.title, str(s.url), s.chapter_count) for s in summaries])
+        self.assertEqual([e.status.value for e in entries], [s.status.value for s in summaries])
+
+    def test_iter_search_pages_through_catalogue(self):
+        browser = prepare_browser(Har.WW_SEARCH_DEFAULT)
+        api = WuxiaWorldComApi(browser, delay=timedelta(0), rate_limiter=RateLimiter(),
+                               search_ttl=timedelta(minutes=10))
+        payloads = []
+        request = api._request
+
+        def recording_request(method, url, **kwargs):
+            if url == api.SEARCH_URL:
+                payloads.append(json.loads(kwargs['data']))
+            return request(method, url, **kwargs)
+
+        api._request = recording_request
+        # The recording answers every page with the first 15 of 59 novels.
+        entries = list(api.iter_search(page_size=15, bulk=True))
+        self.assertEqual(60, len(entries))
+        self.assertEqual('7 Killers', entries[45].name)
+        # The pages after the first one get requested at the same time, in any order.
+        self.assertIsNone(payloads[0]['searchAfter'])
+        self.assertEqual([15, 30, 45], sorted(payload['searchAfter'] for payload in payloads[1:]))
+        self.assertEqual(60, len(list(api.iter_search(page_size=15, bulk=True))))
+        self.assertEqual(4, len(payloads))
+
+    def test_search_cache_ttl(self):
+        browser = prepare_browser(Har.WW_SEARCH_DEFAULT)
+        api = WuxiaWorldComApi(browser, delay=timedelta(0), rate_limiter=RateLimiter())
+        requests = []
+        request = api._request
+        api._request = lambda method, url, **kwargs: requests.append(url) or request(method, url, **kwargs)
+        api.search()
+        api.search()
+        self.assertEqual(2, requests.count(api.SEARCH_URL))